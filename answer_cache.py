@@ -0,0 +1,128 @@
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1000
+
+
+class SemanticAnswerCache:
+    """Cache de respostas indexado pelo embedding da pergunta.
+
+    Perguntas cujo embedding tem similaridade de cosseno >= `threshold` com uma
+    pergunta já respondida reaproveitam a resposta. Cada entrada guarda a versão do
+    índice usada para gerá-la: depois de uma nova ingestão as entradas antigas deixam
+    de valer. Entradas expiram após `ttl` segundos e as menos usadas são descartadas
+    (LRU) quando o limite é atingido.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Perguntas idênticas (após normalização) são atendidas sem calcular embedding
+        self._by_text = {}
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def normalize_question(question):
+        return " ".join(question.lower().split())
+
+    def _drop(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        key = self.normalize_question(entry["question"])
+        if self._by_text.get(key) == entry_id:
+            del self._by_text[key]
+        self._matrix = None
+
+    def _hit(self, entry_id, similarity):
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        entry = self._entries[entry_id]
+        return {
+            "question": entry["question"],
+            "answer": entry["answer"],
+            "similarity": similarity,
+            "created_at": entry["created_at"],
+        }
+
+    def _purge(self, index_version):
+        """Remove entradas expiradas ou geradas com outra versão do índice."""
+        now = time.time()
+        stale = [
+            entry_id for entry_id, entry in self._entries.items()
+            if now - entry["created_at"] > self.ttl or entry["index_version"] != index_version
+        ]
+        for entry_id in stale:
+            self._drop(entry_id)
+
+    def lookup_text(self, question, index_version):
+        """Atalho para a pergunta exatamente igual: não precisa do embedding (nem da rede).
+
+        Uma falha aqui não conta como miss; a busca semântica com `lookup` vem em seguida.
+        """
+        with self._lock:
+            self._purge(index_version)
+            entry_id = self._by_text.get(self.normalize_question(question))
+            if entry_id is None:
+                return None
+            return self._hit(entry_id, 1.0)
+
+    def lookup(self, query_vector, index_version):
+        """Retorna a entrada mais parecida (com a chave `similarity`) ou None."""
+        query = self._normalize(query_vector)
+        with self._lock:
+            self._purge(index_version)
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.stack([self._entries[i]["vector"] for i in self._matrix_ids])
+            similarities = self._matrix @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            return self._hit(self._matrix_ids[best], similarity)
+
+    def store(self, query_vector, question, answer, index_version):
+        with self._lock:
+            self._entries[self._next_id] = {
+                "vector": self._normalize(query_vector),
+                "question": question,
+                "answer": answer,
+                "index_version": index_version,
+                "created_at": time.time(),
+            }
+            self._by_text[self.normalize_question(question)] = self._next_id
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+            self._matrix = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "entries": len(self._entries),
+        }
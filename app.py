@@ -1,125 +1,166 @@
 import os
 import streamlit as st
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.vectorstores import Chroma
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
+import time
+from rag import build_llm, build_rag_chain
+from answer_cache import SemanticAnswerCache
+from manifest import read_index_version
+from lexical_index import LexicalIndex, HybridSearcher
+from vector_export import MemmapVectorIndex
+from partitions import OBJECT_CATEGORIES, PartitionedSearcher
+from context_builder import ContextBuilder, format_context_stats
+from rag_service import stream_answer, service_stats
+from tracing import tracer, format_trace_breakdown
+from snapshots import INDEX_ROOT, LiveIndex, close_vectorstore
 
 # Carrega a API Key do arquivo .env
 load_dotenv("keys.env")
 
 API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Cache semântico de respostas: similaridade mínima entre perguntas, validade e tamanho
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60
+ANSWER_CACHE_MAX_ENTRIES = 1000
+# Orçamento de tokens do CONTEXTO enviado ao Gemini em cada pergunta
+CONTEXT_MAX_TOKENS = 600
+# Serviço de consultas (rag_service.py): definido, o app só exibe as respostas geradas por ele
+RAG_SERVICE_URL = os.getenv("RAG_SERVICE_URL")
+
 # --- Configurações Iniciais ---
 st.set_page_config(page_title="GeneXus AI Assistant (RAG)", layout="wide")
 st.title("🤖 GeneXus AI Assistant (Protótipo RAG)")
 st.caption("Especialista em GeneXus alimentado pela documentação oficial e Gemini API.")
 
-# O Prompt Template é a otimização crucial para especializar o LLM
-PROMPT_TEMPLATE_OLD = """
-Você é um assistente de programação **perito em GeneXus**. Sua função é auxiliar o desenvolvedor a escrever código, modelar objetos e entender conceitos GeneXus.
-**Seu foco deve ser na sintaxe e nos objetos GeneXus (Transactions, Data Providers, Procedures, Web Panels) e não em linguagens de programação subjacentes (Java, C#, etc.).**
-
-**INSTRUÇÕES:**
-1.  Use **APENAS** as informações contidas no 'CONTEXTO' abaixo para formular sua resposta.
-2.  Responda de forma clara e técnica.
-3.  Quando gerar código GeneXus, use blocos de código (` ``` `) e especifique o tipo (ex: ` ```genexus` ou ` ```sql`).
-4.  Se o contexto não for suficiente, diga educadamente que, com a sua base de conhecimento atual, você não pode responder à pergunta específica sobre GeneXus.
-5.  Mantenha a resposta focada no tema GeneXus.
-
-CONTEXTO:
-{context}
-
-PERGUNTA DO USUÁRIO: {question}
-"""
+@st.cache_resource
+def get_embeddings():
+    """Modelo de embeddings das perguntas (o mesmo para todos os snapshots do índice)."""
+    # Garante que a API Key esteja disponível
+    if not API_KEY:
+        st.error("A variável de ambiente GEMINI_API_KEY não está configurada.")
+        st.stop()
+        
+    return GoogleGenerativeAIEmbeddings(
+        model="text-embedding-004",
+        google_api_key=API_KEY
+        )
 
-PROMPT_TEMPLATE_OTIMIZED = """
-Você é o **GeneXus Code Assistant**, um especialista sênior em GeneXus (todas as versões) e engenharia de software Low-Code.
-Sua missão é fornecer soluções completas, robustas e que sigam as **melhores práticas de modelagem e programação GeneXus**.
+@st.cache_resource
+def get_answer_cache():
+    """Cache de respostas compartilhado por todas as sessões do processo."""
+    return SemanticAnswerCache(
+        threshold=ANSWER_CACHE_THRESHOLD,
+        ttl=ANSWER_CACHE_TTL_SECONDS,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES
+    )
 
-**DIRETRIZES DE CÓDIGO E RESPOSTA:**
-1.  **Prioridade GeneXus:** Sempre que a pergunta for sobre implementação ou sintaxe, priorize a criação de código **EXCLUSIVAMENTE em sintaxe GeneXus**.
-2.  **Formato:** O código GeneXus deve ser envolto em blocos de código (` ```genexus`) para clareza. Para regras SQL/Data Selectors, use (` ```sql`).
-3.  **Melhores Práticas:** Se o contexto recuperado mencionar otimizações (ex: uso de For Each com condições *inferred*, minimização de acessos a banco de dados), **integre-as** na sua sugestão de código.
-4.  **Estrita Fidelidade ao Contexto (RAG):** Sua resposta deve ser **inteiramente baseada no 'CONTEXTO'** fornecido. Não invente ou combine informações de conhecimento geral.
-5.  **Rejeição Inteligente:** Se o contexto for insuficiente ou irrelevante, recuse-se a responder, informando que a base de conhecimento (documentação) não cobre o tópico.
-6.  **Foco em Objeto:** Para requisições de modelagem (ex: 'criar um Data Provider'), entregue o código completo da estrutura do objeto.
+@st.cache_resource
+def get_context_builder():
+    """Seleção por MMR dos chunks do contexto, dentro do orçamento de tokens."""
+    return ContextBuilder(max_tokens=CONTEXT_MAX_TOKENS)
 
-CONTEXTO (Documentação GeneXus e Tutoriais):
-{context}
 
-PERGUNTA DO USUÁRIO: {question}
-"""
+class AppIndex:
+    """ChromaDB, busca e cadeia RAG de um snapshot do índice, abertos e aquecidos juntos.
 
-PROMPT_TEMPLATE = """
-Você é o **GeneXus Code Assistant**, um especialista sênior em GeneXus. Sua missão é fornecer soluções completas e robustas, seguindo as melhores práticas.
+    Criado fora do caminho das perguntas (na abertura do app ou pela thread do LiveIndex
+    quando uma ingestão publica um snapshot novo): nada aqui chama o Streamlit.
+    """
 
-**DIRETRIZES DE CÓDIGO E RESPOSTA:**
-1.  **Prioridade GeneXus:** Sempre gere código **EXCLUSIVAMENTE em sintaxe GeneXus**. Use blocos de código (` ```genexus`).
-2.  **Foco em Dados Estruturados:** Priorize informações encontradas em **tabelas, listas de propriedades e definições de sintaxe** dentro do 'CONTEXTO'. Estes dados textuais são a sua fonte de verdade, compensando a ausência de diagramas visuais.
-3.  **Inferência Contextual:** Se o 'CONTEXTO' descrever um processo ou fluxo de dados (que pode ter sido originalmente um diagrama), **infira o fluxo lógico** e traduza-o para a sintaxe GeneXus correta (ex: *parâmetros, comandos de Procedure*).
-4.  **Estrita Fidelidade ao Contexto (RAG):** Sua resposta deve ser **inteiramente baseada no 'CONTEXTO'** fornecido.
-5.  **Rejeição Inteligente:** Se o contexto for insuficiente, recuse-se a responder.
-6.  **Idioma: Deve interpretar todos os idiomas que conhece mas a resposta deve ser sempre em PT-BR ou no idioma fornecido.
+    def __init__(self, path, embeddings, llm, context_builder):
+        self.path = path
+        self.version = read_index_version(path)
+        self.warnings = []
+        # Conecta ao Vector Store persistido do snapshot
+        self.vectorstore = Chroma(
+            persist_directory=path,
+            embedding_function=embeddings
+        )
+        self.searcher = self._open_searcher()
+        # Páginas dos vetores no cache do sistema antes da primeira pergunta neste snapshot
+        self.searcher.warm()
+        self.rag_chain = build_rag_chain(self.searcher, llm, context_builder=context_builder)
 
-CONTEXTO (Documentação GeneXus e Tutoriais):
-{context}
+    def _open_searcher(self):
+        """Busca híbrida: ChromaDB + índice BM25 gerado na ingestão (só vetorial se ele não existir)."""
+        # Partições por versão/tipo de fonte: a busca só abre as relevantes para a pergunta
+        partitioned = PartitionedSearcher.load(self.vectorstore, self.path, k=3)
+        if partitioned is not None and partitioned.index_version == self.version:
+            return partitioned
+        if partitioned is not None:
+            partitioned.close()
+        lexical_index = LexicalIndex.load(self.path)
+        if lexical_index is None:
+            self.warnings.append("Índice lexical (BM25) não encontrado. Execute 'python ingest.py' para criá-lo.")
+        # Exportação memory-mapped dos vetores: só é usada se corresponder à versão do snapshot
+        vector_index = MemmapVectorIndex.load(self.path)
+        if vector_index is not None and vector_index.index_version != self.version:
+            vector_index.close()
+            vector_index = None
+        return HybridSearcher(self.vectorstore, lexical_index, k=3, vector_index=vector_index)
 
-PERGUNTA DO USUÁRIO: {question}
-"""
+    def close(self):
+        self.searcher.close()
+        close_vectorstore(self.vectorstore)
 
 
 @st.cache_resource
-def get_retriever():
-    """Carrega o banco de dados vetorial e cria o Retriever."""
-    # Garante que a API Key esteja disponível
-    if not API_KEY:
-        st.error("A variável de ambiente GEMINI_API_KEY não está configurada.")
-        st.stop()
-        
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model="text-embedding-004",
-        google_api_key=API_KEY
-        )
-    
-    # Conecta ao Vector Store persistido
+def get_live_index():
+    """Snapshot publicado do índice, trocado a quente quando uma ingestão publica outro."""
+    embeddings, llm, context_builder = get_embeddings(), build_llm(), get_context_builder()
     try:
-        vectorstore = Chroma(
-            persist_directory="./chroma_db",
-            embedding_function=embeddings
-        )
-        # k=3: busca os 3 chunks mais relevantes
-        return vectorstore.as_retriever(search_kwargs={"k": 3}) 
+        return LiveIndex(lambda path: AppIndex(path, embeddings, llm, context_builder), INDEX_ROOT)
     except Exception as e:
         st.error(f"Erro ao carregar o banco de dados. Execute 'python ingest.py'. Erro: {e}")
         st.stop()
 
-# 1. Obter o Retriever
-retriever = get_retriever()
+# 1. Obter o índice (ChromaDB, busca híbrida e Cadeia RAG do snapshot atual) e o cache de respostas
+if RAG_SERVICE_URL:
+    # Busca, LLM e cache ficam no serviço, compartilhados com as outras sessões e ferramentas
+    live_index = searcher = context_builder = answer_cache = None
+else:
+    live_index = get_live_index()
+    # Só para a barra lateral: as perguntas fixam o snapshot com `live_index.use()`
+    searcher = live_index.current.searcher
+    context_builder = get_context_builder()
+    answer_cache = get_answer_cache()
+
+def format_latency(ttft_ms, total_ms):
+    return f"⏱️ Primeiro token em {ttft_ms:.0f} ms · total {total_ms:.0f} ms"
 
-# 2. Configurar o LLM (Gemini)
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.1)
 
-# 3. Criar a Cadeia RAG (LangChain Expression Language - LCEL)
-prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+def format_search_timings(timings):
+    parts = []
+    if "vector_ms" in timings:
+        parts.append(f"vetorial {timings['vector_ms']:.0f} ms")
+    if "lexical_ms" in timings:
+        parts.append(f"BM25 {timings['lexical_ms']:.1f} ms")
+    return "🔎 Busca: " + ", ".join(parts) if parts else ""
 
-def format_docs(docs):
-    """Formata os documentos recuperados em uma string simples."""
-    return "\n\n".join(doc.page_content for doc in docs)
 
-# O pipe RAG: Contexto -> Prompt -> LLM -> Resposta
-rag_chain = (
-    {"context": retriever | format_docs, "question": RunnablePassthrough()}
-    | prompt
-    | llm
-    | StrOutputParser()
-)
+def format_partitions(names):
+    return "🗂️ Partições: " + ", ".join(names)
 
 # --- Interface Streamlit ---
 
+# Filtros da busca por partição (sem eles, versão e tipo de fonte vêm da pergunta)
+filters = {}
+if isinstance(searcher, PartitionedSearcher):
+    st.sidebar.subheader("Filtros da busca")
+    versions = st.sidebar.multiselect("Versão do GeneXus", searcher.versions,
+                                      help="Vazio: a versão citada na pergunta ou todas.")
+    source_types = st.sidebar.multiselect("Tipo de fonte", searcher.source_types,
+                                          help="Vazio: todos (ou o citado na pergunta).")
+    category = st.sidebar.selectbox("Tipo de objeto", ["automática"] + list(OBJECT_CATEGORIES))
+    if versions:
+        filters["versions"] = versions
+    if source_types:
+        filters["source_types"] = source_types
+    if category != "automática":
+        filters["category"] = category
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
@@ -127,6 +168,8 @@ if "messages" not in st.session_state:
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
+        if message.get("latency"):
+            st.caption(message["latency"])
 
 # Capturar nova entrada do usuário
 if prompt_input := st.chat_input("Pergunte algo sobre GeneXus..."):
@@ -136,14 +179,151 @@ if prompt_input := st.chat_input("Pergunte algo sobre GeneXus..."):
 
     # Gerar resposta da IA
     with st.chat_message("assistant"):
-        with st.spinner("Pensando como um especialista GeneXus..."):
-            response = rag_chain.invoke(prompt_input)
-            st.markdown(response)
+        start = time.perf_counter()
+        if RAG_SERVICE_URL:
+            cached = None
+            first_token_at = []
+
+            def service_stream():
+                # Os pedaços chegam do serviço à medida que o Gemini gera a resposta
+                for piece in stream_answer(RAG_SERVICE_URL, prompt_input):
+                    if not first_token_at:
+                        first_token_at.append(time.perf_counter())
+                    yield piece
+
+            try:
+                response = st.write_stream(service_stream())
+            except Exception as e:
+                response = f"Não foi possível consultar o serviço em {RAG_SERVICE_URL}: {e}"
+                st.error(response)
+            total_ms = (time.perf_counter() - start) * 1000
+            ttft_ms = ((first_token_at[0] if first_token_at else time.perf_counter()) - start) * 1000
+            latency = format_latency(ttft_ms, total_ms) + " · 🌐 via serviço de consultas"
+        else:
+            # A pergunta inteira usa o mesmo snapshot, mesmo que outro seja publicado no meio;
+            # com o rastreamento ligado, cada etapa dela entra no trace "query"
+            with live_index.use() as index, tracer.trace("query", question_chars=len(prompt_input)) as query_span:
+                with st.spinner("Pensando como um especialista GeneXus..."):
+                    index_version = index.version
+                    # Com filtros escolhidos a resposta depende deles: o cache (por pergunta) fica de fora
+                    use_cache = not filters
+                    cached = None
+                    # Pergunta idêntica: resposta direto do cache, sem nenhuma chamada de rede
+                    if use_cache:
+                        with tracer.span("answer_cache", kind="text") as span:
+                            cached = answer_cache.lookup_text(prompt_input, index_version)
+                            span.set(cache_hit=bool(cached))
+                    query_vector = None
+                    if not cached and index.searcher.needs_embedding(prompt_input):
+                        # Um único embedding da pergunta serve para o cache e para a busca no ChromaDB
+                        with tracer.span("embed_query"):
+                            query_vector = index.vectorstore.embeddings.embed_query(prompt_input)
+                    if use_cache and query_vector is not None:
+                        with tracer.span("answer_cache", kind="semantic") as span:
+                            cached = answer_cache.lookup(query_vector, index_version)
+                            span.set(cache_hit=bool(cached))
+                    # Sem embedding: a pergunta é só um identificador GeneXus (&Var, For Each...)
+                    # e a busca lexical (BM25) responde sem a chamada de rede
+
+                if cached:
+                    response = cached["answer"]
+                    st.markdown(response)
+                    ttft_ms = total_ms = (time.perf_counter() - start) * 1000
+                else:
+                    first_token_at = []
+                    # Tempos e métricas desta pergunta (o searcher é compartilhado entre sessões)
+                    query_stats = {}
+
+                    def token_stream():
+                        # Os tokens são exibidos à medida que o Gemini os gera
+                        chain_inputs = {"question": prompt_input, "query_vector": query_vector, "filters": filters,
+                                        "stats": query_stats}
+                        for token in index.rag_chain.stream(chain_inputs):
+                            if not first_token_at:
+                                first_token_at.append(time.perf_counter())
+                            yield token
+
+                    response = st.write_stream(token_stream())
+                    query_span.set(answer_chars=len(response))
+                    total_ms = (time.perf_counter() - start) * 1000
+                    ttft_ms = ((first_token_at[0] if first_token_at else time.perf_counter()) - start) * 1000
+                    if use_cache and query_vector is not None:
+                        answer_cache.store(query_vector, prompt_input, response, index_version)
+
+                latency = format_latency(ttft_ms, total_ms)
+                if cached:
+                    latency = f"⚡ Resposta em cache (similaridade {cached['similarity']:.2f}) · " + latency
+                else:
+                    search_timings = query_stats.get("search") or {}
+                    if format_search_timings(search_timings):
+                        latency += " · " + format_search_timings(search_timings)
+                    if search_timings.get("partition_names"):
+                        latency += " · " + format_partitions(search_timings["partition_names"])
+                    if query_stats.get("context"):
+                        latency += " · 📄 " + format_context_stats(query_stats["context"])
+            if tracer.enabled:
+                # O trace desta pergunta (e não o último do processo, que pode ser de outra sessão)
+                if getattr(query_span, "record", None):
+                    latency += " · " + format_trace_breakdown(query_span.record)
+                tracer.write_prometheus()
+        st.caption(latency)
             
-    st.session_state.messages.append({"role": "assistant", "content": response})
+    st.session_state.messages.append({
+        "role": "assistant",
+        "content": response,
+        "cached": bool(cached),
+        "latency": latency,
+    })
 
 # Sidebar para informações adicionais
 st.sidebar.header("Status do Protótipo")
 st.sidebar.markdown(f"**Framework RAG:** LangChain")
 st.sidebar.markdown(f"**LLM:** Gemini 2.5 Flash")
 st.sidebar.markdown(f"**Vector Store:** ChromaDB")
+if live_index is not None:
+    snapshot = f"{live_index.name or 'layout antigo'} (versão {live_index.current.version})"
+    if live_index.warming:
+        snapshot += f" · aquecendo {live_index.warming}"
+    st.sidebar.markdown(f"**Snapshot do índice:** {snapshot}")
+    for warning in live_index.current.warnings:
+        st.sidebar.warning(warning)
+    if live_index.last_error:
+        st.sidebar.warning(f"Falha ao carregar o snapshot novo: {live_index.last_error}")
+if isinstance(searcher, PartitionedSearcher):
+    partition_stats = searcher.stats()
+    st.sidebar.markdown(f"**Busca por partição:** vetorial + BM25 em {partition_stats['partitions']} partições "
+                        f"({partition_stats['chunks']} chunks, versões {', '.join(partition_stats['versions']) or '-'})")
+if searcher is not None and searcher.vector_index is not None:
+    st.sidebar.markdown(f"**Busca vetorial:** matriz memory-mapped ({searcher.vector_index.meta['count']} vetores, "
+                        f"{searcher.vector_index.meta['dtype']})")
+if searcher is not None and searcher.lexical_index is not None:
+    lexical_stats = searcher.lexical_index.stats()
+    st.sidebar.markdown(f"**Busca híbrida:** vetorial + BM25 ({lexical_stats['documents']} chunks, "
+                        f"{lexical_stats['terms']} termos)")
+if answer_cache is not None:
+    cache_stats = answer_cache.stats()
+    st.sidebar.markdown(f"**Cache de respostas:** {cache_stats['entries']} entradas, "
+                        f"{cache_stats['hit_rate']:.0%} de acerto")
+else:
+    try:
+        remote = service_stats(RAG_SERVICE_URL)
+        st.sidebar.markdown(f"**Serviço de consultas:** {RAG_SERVICE_URL} ({remote['requests']} perguntas, "
+                            f"{remote['coalesced']} coalescidas, {remote['answer_cache']['hit_rate']:.0%} "
+                            f"de acerto no cache)")
+    except Exception:
+        st.sidebar.markdown(f"**Serviço de consultas:** {RAG_SERVICE_URL} (indisponível)")
+if tracer.enabled:
+    # Onde o tempo das perguntas desta sessão do servidor está indo, etapa por etapa
+    st.sidebar.subheader("Latência por etapa")
+    stages = tracer.stage_summary()
+    if stages:
+        st.sidebar.dataframe(
+            [{"etapa": row["stage"], "n": row["count"], "p50 (ms)": round(row["p50_ms"]),
+              "p95 (ms)": round(row["p95_ms"]), "média (ms)": round(row["mean_ms"])} for row in stages],
+            hide_index=True,
+        )
+        last_query = tracer.last_trace("query")
+        if last_query:
+            st.sidebar.caption("Última pergunta: " + format_trace_breakdown(last_query))
+    else:
+        st.sidebar.caption("Nenhuma pergunta rastreada ainda.")
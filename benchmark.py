@@ -0,0 +1,569 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+
+from fakes import FakeEmbeddings, FakeChatModel, RemoteFakeEmbeddings, serve_fake_embeddings
+from synthetic_corpus import (generate_articles, labelled_queries, write_pdf_corpus, serve_articles, article_text,
+                              article_html)
+from manifest import SourceManifest, hash_file, hash_text, replace_source_chunks
+from pdf_pipeline import run_pdf_pipeline, parse_and_split
+from web_fetcher import fetch_documents, html_to_document
+from lexical_index import LexicalIndex, HybridSearcher, build_lexical_index, reciprocal_rank_fusion
+from vector_export import MemmapVectorIndex, export_vectors
+from partitions import PartitionedSearcher, build_partitions, tag_chunks, partition_name
+from rag import build_rag_chain, format_docs, PROMPT_TEMPLATE
+from context_builder import ContextBuilder
+from embedding_scheduler import BatchedEmbeddings, estimate_tokens
+from chunker import STRUCTURE, RECURSIVE, make_splitter
+from rate_limit import retry_with_backoff
+from tracing import tracer
+
+
+# Benchmark offline: corpus sintético, embeddings e LLM falsos, nenhuma chamada ao Gemini
+RESULTS_DIR = "./.cache/benchmarks"
+# Configuração de cada splitter comparado: (tamanho, sobreposição); o recursivo é o antigo
+SPLITTERS = {STRUCTURE: (1200, 0), RECURSIVE: (1000, 200)}
+# Orçamento do contexto no benchmark: os chunks do corpus sintético são menores que os da
+# documentação real, então o orçamento é proporcionalmente menor que o do app
+BENCH_CONTEXT_TOKENS = 450
+# Métricas comparadas com `--compare` (caminho no JSON, maior é melhor?)
+COMPARED_METRICS = [
+    ("ingestion.pdf.chunks_per_second", True),
+    ("ingestion.web.chunks_per_second", True),
+    ("embedding_scheduler.batched.chunks_per_second", True),
+    ("chunking.structure.tokens", False),
+    ("chunking.structure.recall.hybrid", True),
+    ("retrieval.hybrid.p50_ms", False),
+    ("retrieval.hybrid.p99_ms", False),
+    ("retrieval.hybrid.recall", True),
+    ("context.mmr.prompt_tokens.p50", False),
+    ("context.mmr.grounded", True),
+    ("end_to_end.ttft.p50_ms", False),
+    ("end_to_end.total.p50_ms", False),
+    ("tracing.off.span_us", False),
+    ("partitions.8.partitioned.p50_ms", False),
+    ("partitions.8.partitioned.recall", True),
+    ("partitions.8.partitioned.no_version.p50_ms", False),
+    ("partitions.8.partitioned.no_version.recall", True),
+]
+# Etapas medidas no teste de custo do rastreamento
+TRACING_ITERATIONS = 20000
+# Teste das partições: quantidades de versões do GeneXus no índice e artigos por versão
+PARTITION_VERSION_COUNTS = (1, 2, 4, 8)
+PARTITION_ARTICLES = 100
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+            "mean_ms": float(np.mean(samples_ms))}
+
+
+def bench_pdf_ingestion(articles, work_dir, vectorstore, manifest, embeddings, chunker=STRUCTURE):
+    placement = write_pdf_corpus(articles, os.path.join(work_dir, "docs"))
+    pdf_hashes = {path: hash_file(path) for path in sorted({path for path, _ in placement})}
+    chunk_size, chunk_overlap = SPLITTERS[chunker]
+    start = time.perf_counter()
+    result = run_pdf_pipeline(pdf_hashes, vectorstore, manifest, embeddings, chunk_size=chunk_size,
+                              chunk_overlap=chunk_overlap, splitter=chunker)
+    seconds = time.perf_counter() - start
+    return placement, {
+        "pdfs": len(pdf_hashes),
+        "pages": result["pages"],
+        "chunks": result["chunks"],
+        "seconds": seconds,
+        "pages_per_second": result["pages"] / seconds if seconds else 0.0,
+        "chunks_per_second": result["chunks"] / seconds if seconds else 0.0,
+    }
+
+
+def bench_web_ingestion(articles, work_dir, vectorstore, manifest, chunker=STRUCTURE):
+    server, urls = serve_articles(articles)
+    try:
+        start = time.perf_counter()
+        documents, report = fetch_documents(sorted(urls), cache_dir=os.path.join(work_dir, "http"))
+        fetched = time.perf_counter()
+        text_splitter = make_splitter(chunker, *SPLITTERS[chunker])
+        chunks = 0
+        for document in documents:
+            source_chunks = text_splitter.split_documents([document])
+            replace_source_chunks(vectorstore, manifest, document.metadata["source"], "web",
+                                  hash_text(document.page_content), source_chunks)
+            chunks += len(source_chunks)
+        seconds = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    return urls, {
+        "articles": len(documents),
+        "chunks": chunks,
+        "bytes": report["bytes"],
+        "raw_tokens": report["raw_tokens"],
+        "content_tokens": report["content_tokens"],
+        "fetch_seconds": fetched - start,
+        "seconds": seconds,
+        "articles_per_second": len(documents) / seconds if seconds else 0.0,
+        "chunks_per_second": chunks / seconds if seconds else 0.0,
+    }
+
+
+def bench_embedding_scheduler(texts, requests_per_second, latency, workers):
+    """Lotes sequenciais de 100 (como antes) x BatchedEmbeddings, contra um endpoint local com cota."""
+    results = {}
+    for name in ("sequential", "batched"):
+        server, url, server_stats = serve_fake_embeddings(requests_per_second=requests_per_second, latency=latency)
+        client = RemoteFakeEmbeddings(url)
+        try:
+            start = time.perf_counter()
+            if name == "sequential":
+                for i in range(0, len(texts), 100):
+                    retry_with_backoff(lambda: client.embed_documents(texts[i:i + 100]), retries=8, base_delay=0.2)
+                stats = {}
+            else:
+                scheduler = BatchedEmbeddings(client, workers=workers, requests_per_minute=requests_per_second * 120,
+                                              tokens_per_minute=10 ** 9, base_delay=0.2, retries=8)
+                scheduler.embed_documents(texts)
+                stats = scheduler.stats()
+                scheduler.close()
+            seconds = time.perf_counter() - start
+        finally:
+            server.shutdown()
+        results[name] = {
+            "chunks": len(texts),
+            "seconds": seconds,
+            "chunks_per_second": len(texts) / seconds if seconds else 0.0,
+            "server_requests": server_stats["requests"],
+            "server_throttled": server_stats["throttled"],
+            **{key: stats[key] for key in ("throttle_events", "batch_size", "concurrency") if key in stats},
+        }
+    return results
+
+
+def _chunk_corpus(articles, work_dir, kind):
+    """Chunks do corpus nos dois formatos (páginas de PDF e markdown da Web), com o artigo de cada um."""
+    chunk_size, chunk_overlap = SPLITTERS[kind]
+    placement = write_pdf_corpus(articles, os.path.join(work_dir, "chunking_docs"))
+    chunks = []
+    for path in sorted({path for path, _ in placement}):
+        pages = sum(1 for pdf_path, _ in placement if pdf_path == path)
+        for chunk in parse_and_split(path, 0, pages, pages, chunk_size, chunk_overlap, kind):
+            chunks.append((placement[(path, chunk.metadata["page"])], chunk.page_content))
+    splitter = make_splitter(kind, chunk_size, chunk_overlap)
+    for article in articles:
+        document = html_to_document(f"http://docs.local/{article['id']}", article_html(article).decode("utf-8"))
+        chunks.extend((article["id"], chunk.page_content) for chunk in splitter.split_documents([document]))
+    return chunks
+
+
+def bench_chunking(articles, work_dir, queries, k):
+    """Splitter por estrutura x RecursiveCharacterTextSplitter(1000, 200) sobre os mesmos textos.
+
+    Compara número de chunks, tokens enviados ao modelo de embeddings (custo), blocos de
+    código que ficaram inteiros em um chunk e recall@k (vetorial, BM25 e híbrida).
+    """
+    results = {}
+    for kind in SPLITTERS:
+        start = time.perf_counter()
+        chunks = _chunk_corpus(articles, work_dir, kind)
+        seconds = time.perf_counter() - start
+        ids = [f"c{i}" for i in range(len(chunks))]
+        article_of = {chunk_id: article_id for chunk_id, (article_id, _) in zip(ids, chunks)}
+        texts = [text for _, text in chunks]
+
+        # Blocos de código inteiros: o trecho completo aparece em algum chunk do mesmo artigo
+        normalized = {}
+        for article_id, text in chunks:
+            normalized.setdefault(article_id, []).append(" ".join(text.split()))
+        intact = sum(
+            sum(" ".join(article["code"].split()) in text for text in normalized.get(article["id"], []))
+            for article in articles)
+
+        embeddings = FakeEmbeddings()
+        matrix = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+        lexical_index = LexicalIndex.build(zip(ids, texts))
+        hits = {"vector": 0, "bm25": 0, "hybrid": 0}
+        for query in queries:
+            scores = matrix @ np.array(embeddings.embed_query(query["question"]), dtype=np.float32)
+            vector_ranking = [ids[i] for i in np.argsort(-scores)[:20]]
+            lexical_ranking = [chunk_id for chunk_id, _ in lexical_index.search(query["question"], 20)]
+            rankings = {"vector": vector_ranking, "bm25": lexical_ranking,
+                        "hybrid": reciprocal_rank_fusion([vector_ranking, lexical_ranking])}
+            for name, ranking in rankings.items():
+                if query["relevant"] in {article_of[chunk_id] for chunk_id in ranking[:k]}:
+                    hits[name] += 1
+        tokens = sum(estimate_tokens(text) for text in texts)
+        results[kind] = {
+            "chunks": len(chunks),
+            "mean_chars": float(np.mean([len(text) for text in texts])) if texts else 0.0,
+            "max_chars": max((len(text) for text in texts), default=0),
+            "tokens": tokens,
+            "tokens_per_article": tokens / len(articles) if articles else 0.0,
+            # Cada artigo aparece duas vezes (PDF e Web)
+            "code_blocks_intact": intact / (2 * len(articles)) if articles else 0.0,
+            "recall": {name: count / len(queries) if queries else 0.0 for name, count in hits.items()},
+            "k": k,
+            "seconds": seconds,
+        }
+    return results
+
+
+def bench_retrieval(searchers, queries, embeddings, article_of, k, repeat):
+    """Latência e recall@k de cada estratégia de busca (o embedding da pergunta fica de fora)."""
+    vectors = [embeddings.embed_query(query["question"]) for query in queries]
+    results = {}
+    for name, (searcher, use_vector) in searchers.items():
+        latencies = []
+        hits = 0
+        for query, vector in zip(queries, vectors):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                docs, _ = searcher.search(query["question"], vector if use_vector else None)
+                latencies.append((time.perf_counter() - start) * 1000)
+            if query["relevant"] in {article_of(doc) for doc in docs[:k]}:
+                hits += 1
+        results[name] = {**percentiles(latencies), "recall": hits / len(queries) if queries else 0.0,
+                         "queries": len(queries), "k": k}
+    return results
+
+
+def bench_context(searcher, builder, queries, embeddings, article_of):
+    """Tokens do prompt e grounding: `k` chunks inteiros (format_docs) x ContextBuilder (MMR).
+
+    Grounding = fração das perguntas cujo artigo relevante está no contexto enviado ao LLM.
+    """
+    template_tokens = estimate_tokens(PROMPT_TEMPLATE)
+    samples = {"top_k": ([], 0), "mmr": ([], 0)}
+    for query in queries:
+        question = query["question"]
+        vector = embeddings.embed_query(question) if searcher.needs_embedding(question) else None
+        docs, _ = searcher.search(question, vector)
+        candidates, _ = searcher.search(question, vector, k=builder.candidates)
+        selected, _, stats = builder.select(candidates)
+        for name, context_tokens, used in (("top_k", estimate_tokens(format_docs(docs)), docs),
+                                           ("mmr", stats["context_tokens"], selected)):
+            tokens, grounded = samples[name]
+            tokens.append(template_tokens + estimate_tokens(question) + context_tokens)
+            samples[name] = (tokens, grounded + (query["relevant"] in {article_of(doc) for doc in used}))
+    return {
+        name: {
+            "prompt_tokens": {"p50": float(np.percentile(tokens, 50)), "p95": float(np.percentile(tokens, 95)),
+                              "mean": float(np.mean(tokens))},
+            "grounded": grounded / len(queries) if queries else 0.0,
+            "queries": len(queries),
+        }
+        for name, (tokens, grounded) in samples.items()
+    }
+
+
+def bench_end_to_end(searcher, llm, embeddings, queries, context_builder=None):
+    """Latência da pergunta até o primeiro token e até o fim da resposta (rag_chain.stream)."""
+    rag_chain = build_rag_chain(searcher, llm, context_builder=context_builder)
+    ttft, total = [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_vector = embeddings.embed_query(query["question"]) if searcher.needs_embedding(query["question"]) else None
+        first_token_at = None
+        for _ in rag_chain.stream({"question": query["question"], "query_vector": query_vector}):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+        end = time.perf_counter()
+        ttft.append(((first_token_at or end) - start) * 1000)
+        total.append((end - start) * 1000)
+    return {"queries": len(queries), "ttft": percentiles(ttft), "total": percentiles(total)}
+
+
+def bench_tracing(work_dir, iterations=TRACING_ITERATIONS):
+    """Custo por etapa (span) do rastreamento desligado e ligado, em microssegundos."""
+    saved = tracer.enabled, tracer.directory
+    tracer.directory = os.path.join(work_dir, "traces")
+    results = {}
+    try:
+        for enabled in (False, True):
+            tracer.enabled = enabled
+            # Tudo dentro de um único trace: mede a etapa, não a gravação do JSONL
+            with tracer.trace("benchmark"):
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    with tracer.span("stage", chunks=1) as span:
+                        span.set(cache_hit=False)
+                elapsed = time.perf_counter() - start
+            results["on" if enabled else "off"] = {"span_us": elapsed / iterations * 1e6}
+    finally:
+        tracer.enabled, tracer.directory = saved
+    results["iterations"] = iterations
+    return results
+
+
+def bench_partitions(work_dir, k, repeat, articles=PARTITION_ARTICLES, version_counts=PARTITION_VERSION_COUNTS,
+                     seed=0):
+    """Busca no índice inteiro x só na partição da versão citada, com cada vez mais versões.
+
+    Os mesmos artigos são publicados em cada versão (como na documentação real, em que
+    cada versão repete boa parte da anterior); as perguntas citam a versão e o acerto
+    exige o artigo da versão certa. A busca no índice inteiro cresce com o número de
+    versões, a busca por partição fica estável. As mesmas perguntas sem versão medem o
+    caminho que busca em todas as partições (`no_version`).
+    """
+    persist_directory = os.path.join(work_dir, "partitions_db")
+    embeddings = FakeEmbeddings()
+    vectorstore = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    topics = generate_articles(articles, seed=seed)
+    versions = [str(11 + i) for i in range(max(version_counts))]
+    for version in versions:
+        chunks = []
+        for article in topics:
+            document = html_to_document(f"http://docs.local/gx{version}/{article['id']}",
+                                        article_html({**article, "title": f"GeneXus {version}: {article['title']}"})
+                                        .decode("utf-8"))
+            document.metadata["article"] = article["id"]
+            chunks.append(document)
+        tag_chunks(chunks, "web", version)
+        texts = [chunk.page_content for chunk in chunks]
+        vectorstore._collection.add(ids=[f"{version}-{chunk.metadata['article']}" for chunk in chunks],
+                                    embeddings=embeddings.embed_documents(texts),
+                                    metadatas=[chunk.metadata for chunk in chunks], documents=texts)
+    build_partitions(vectorstore, persist_directory)
+    loaded = PartitionedSearcher.load(vectorstore, persist_directory, k=k)
+
+    queries = labelled_queries(topics, seed=seed)
+    results = {}
+    for count in version_counts:
+        included = versions[:count]
+        # Índice inteiro: uma exportação + BM25 com todas as versões incluídas
+        full_dir = os.path.join(work_dir, f"partitions_full_{count}")
+        os.makedirs(full_dir)
+        where = {"gx_version": {"$in": included}} if count > 1 else {"gx_version": included[0]}
+        lexical_index = build_lexical_index(vectorstore, full_dir, where=where)
+        export_vectors(vectorstore, full_dir, where=where)
+        vector_index = MemmapVectorIndex.load(full_dir)
+        full = HybridSearcher(vectorstore, lexical_index, k=k, vector_index=vector_index)
+        # Partições: as mesmas já montadas, limitadas às versões incluídas
+        names = [partition_name(version, "web") for version in included]
+        partitioned = PartitionedSearcher(vectorstore, {name: loaded.partitions[name] for name in names},
+                                          {"partitions": {name: loaded.catalog["partitions"][name] for name in names}},
+                                          k=k)
+        results[str(count)] = {}
+        for name, searcher in (("full", full), ("partitioned", partitioned)):
+            results[str(count)][name] = {}
+            # Com a versão na pergunta o acerto exige a versão certa; sem ela (todas as
+            # partições), vale o artigo em qualquer versão
+            for mode in ("version", "no_version"):
+                latencies, hits = [], 0
+                for i, query in enumerate(queries):
+                    version = included[i % count] if mode == "version" else None
+                    question = f"{query['question']} (GeneXus {version})" if version else query["question"]
+                    vector = embeddings.embed_query(question)
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        docs, _ = searcher.search(question, vector, k=k)
+                        latencies.append((time.perf_counter() - start) * 1000)
+                    if any(doc.metadata.get("article") == query["relevant"]
+                           and (version is None or doc.metadata.get("gx_version") == version)
+                           for doc in docs[:k]):
+                        hits += 1
+                result = {**percentiles(latencies), "recall": hits / len(queries)}
+                if mode == "version":
+                    results[str(count)][name].update(result)
+                else:
+                    results[str(count)][name]["no_version"] = result
+        results[str(count)]["chunks"] = count * len(topics)
+        vector_index.close()
+    loaded.close()
+    return results
+
+
+def run_benchmark(articles=200, k=3, repeat=3, e2e_queries=20, embed_latency=0.0,
+                  embed_per_text_latency=0.0, llm_first_token=0.2, llm_token=0.01, seed=0,
+                  endpoint_rps=5.0, endpoint_latency=0.1, embed_workers=4, chunker=STRUCTURE,
+                  context_tokens=BENCH_CONTEXT_TOKENS):
+    work_dir = tempfile.mkdtemp(prefix="genexus-bench-")
+    try:
+        persist_directory = os.path.join(work_dir, "chroma_db")
+        embeddings = FakeEmbeddings(latency=embed_latency, per_text_latency=embed_per_text_latency)
+        vectorstore = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+        manifest = SourceManifest.load(persist_directory)
+
+        corpus = generate_articles(articles, seed=seed)
+        pdf_articles, web_articles = corpus[:len(corpus) // 2], corpus[len(corpus) // 2:]
+
+        print(f"== Ingestão de PDFs ({len(pdf_articles)} artigos)")
+        placement, pdf_result = bench_pdf_ingestion(pdf_articles, work_dir, vectorstore, manifest, embeddings,
+                                                    chunker)
+        print(f"== Ingestão Web ({len(web_articles)} artigos, servidor local)")
+        urls, web_result = bench_web_ingestion(web_articles, work_dir, vectorstore, manifest, chunker)
+        manifest.bump_version()
+        manifest.save()
+
+        start = time.perf_counter()
+        build_lexical_index(vectorstore, persist_directory)
+        lexical_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        export_vectors(vectorstore, persist_directory, index_version=manifest.version)
+        export_seconds = time.perf_counter() - start
+
+        def article_of(doc):
+            source = doc.metadata.get("source")
+            return urls.get(source) or placement.get((source, doc.metadata.get("page")))
+
+        lexical_index = LexicalIndex.load(persist_directory)
+        vector_index = MemmapVectorIndex.load(persist_directory)
+        searchers = {
+            "vector": (HybridSearcher(vectorstore, None, k=k), True),
+            "bm25": (HybridSearcher(vectorstore, lexical_index, k=k), False),
+            "hybrid": (HybridSearcher(vectorstore, lexical_index, k=k), True),
+            "memmap": (HybridSearcher(vectorstore, None, k=k, vector_index=vector_index), True),
+            "hybrid_memmap": (HybridSearcher(vectorstore, lexical_index, k=k, vector_index=vector_index), True),
+        }
+        queries = labelled_queries(corpus, seed=seed)
+        print(f"== Agendador de embeddings (endpoint local com {endpoint_rps:.0f} req/s e 429)")
+        scheduler_texts = [paragraph for article in corpus for paragraph in article_text(article).split("\n\n")]
+        embedding_scheduler = bench_embedding_scheduler(scheduler_texts, endpoint_rps, endpoint_latency, embed_workers)
+
+        print(f"== Segmentação ({', '.join(SPLITTERS)}, {len(corpus)} artigos em PDF e Web)")
+        chunking = bench_chunking(corpus, work_dir, queries, k)
+
+        print(f"== Busca ({len(queries)} perguntas rotuladas, {repeat} repetições)")
+        retrieval = bench_retrieval(searchers, queries, embeddings, article_of, k, repeat)
+
+        print(f"== Contexto do prompt (format_docs x MMR com orçamento de {context_tokens} tokens)")
+        context_builder = ContextBuilder(max_tokens=context_tokens)
+        context = bench_context(searchers["hybrid_memmap"][0], context_builder, queries, embeddings, article_of)
+
+        print(f"== Ponta a ponta (rag_chain, {e2e_queries} perguntas)")
+        llm = FakeChatModel(first_token_latency=llm_first_token, token_latency=llm_token)
+        end_to_end = bench_end_to_end(searchers["hybrid_memmap"][0], llm, embeddings, queries[:e2e_queries],
+                                      context_builder)
+        vector_index.close()
+
+        print(f"== Rastreamento ({TRACING_ITERATIONS} etapas desligado x ligado)")
+        tracing = bench_tracing(work_dir)
+
+        print(f"== Partições ({', '.join(map(str, PARTITION_VERSION_COUNTS))} versões x {PARTITION_ARTICLES} artigos)")
+        partitions = bench_partitions(work_dir, k, repeat, seed=seed)
+
+        return {
+            "config": {
+                "articles": articles, "k": k, "repeat": repeat, "e2e_queries": e2e_queries,
+                "embed_latency": embed_latency, "embed_per_text_latency": embed_per_text_latency,
+                "llm_first_token": llm_first_token, "llm_token": llm_token, "seed": seed,
+                "endpoint_rps": endpoint_rps, "endpoint_latency": endpoint_latency, "embed_workers": embed_workers,
+                "chunker": chunker, "context_tokens": context_tokens,
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            "ingestion": {
+                "pdf": pdf_result,
+                "web": web_result,
+                "lexical_index_seconds": lexical_seconds,
+                "vector_export_seconds": export_seconds,
+                "embedding_calls": embeddings.calls,
+            },
+            "embedding_scheduler": embedding_scheduler,
+            "chunking": chunking,
+            "retrieval": retrieval,
+            "context": context,
+            "end_to_end": end_to_end,
+            "tracing": tracing,
+            "partitions": partitions,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _metric(results, path):
+    value = results
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def print_summary(results, baseline=None):
+    print("\nResumo:")
+    for name in ("pdf", "web"):
+        r = results["ingestion"][name]
+        print(f"   Ingestão {name}: {r['chunks']} chunks em {r['seconds']:.2f}s ({r['chunks_per_second']:.1f} chunks/s)")
+    for name, r in results["embedding_scheduler"].items():
+        print(f"   Embeddings {name}: {r['chunks_per_second']:.1f} chunks/s, "
+              f"{r['server_throttled']} respostas 429")
+    for name, r in results.get("chunking", {}).items():
+        print(f"   Segmentação {name}: {r['chunks']} chunks, ~{r['tokens']} tokens, "
+              f"{r['code_blocks_intact']:.0%} dos blocos de código inteiros, recall@{r['k']} "
+              + " · ".join(f"{mode} {value:.3f}" for mode, value in r["recall"].items()))
+    for name, r in results["retrieval"].items():
+        print(f"   Busca {name:<14} p50 {r['p50_ms']:7.2f} ms · p95 {r['p95_ms']:7.2f} ms · "
+              f"p99 {r['p99_ms']:7.2f} ms · recall@{r['k']} {r['recall']:.3f}")
+    for name, r in results.get("context", {}).items():
+        print(f"   Contexto {name:<6} prompt p50 ~{r['prompt_tokens']['p50']:.0f} tokens · "
+              f"p95 ~{r['prompt_tokens']['p95']:.0f} · grounding {r['grounded']:.3f}")
+    e2e = results["end_to_end"]
+    print(f"   Ponta a ponta: primeiro token p50 {e2e['ttft']['p50_ms']:.0f} ms · "
+          f"total p50 {e2e['total']['p50_ms']:.0f} ms · p99 {e2e['total']['p99_ms']:.0f} ms")
+    if "tracing" in results:
+        print(f"   Rastreamento: {results['tracing']['off']['span_us']:.2f} µs por etapa desligado · "
+              f"{results['tracing']['on']['span_us']:.2f} µs ligado")
+    for count, r in results.get("partitions", {}).items():
+        print(f"   Partições, {count} versões ({r['chunks']} chunks): índice inteiro p50 {r['full']['p50_ms']:.2f} ms "
+              f"recall {r['full']['recall']:.3f} · por partição p50 {r['partitioned']['p50_ms']:.2f} ms "
+              f"recall {r['partitioned']['recall']:.3f}")
+        print(f"      sem versão na pergunta: índice inteiro p50 {r['full']['no_version']['p50_ms']:.2f} ms "
+              f"recall {r['full']['no_version']['recall']:.3f} · todas as partições p50 "
+              f"{r['partitioned']['no_version']['p50_ms']:.2f} ms recall {r['partitioned']['no_version']['recall']:.3f}")
+    if baseline:
+        print("\nComparação com a execução anterior:")
+        for path, higher_is_better in COMPARED_METRICS:
+            old, new = _metric(baseline, path), _metric(results, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            better = change > 0 if higher_is_better else change < 0
+            print(f"   {path}: {old:.3f} -> {new:.3f} ({change:+.1%}{', melhor' if better and change else ''})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline da ingestão, da busca e da cadeia RAG.")
+    parser.add_argument("--articles", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3, help="repetições de cada busca")
+    parser.add_argument("--e2e-queries", type=int, default=20)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="segundos por chamada de embeddings")
+    parser.add_argument("--embed-per-text-latency", type=float, default=0.0, help="segundos por texto")
+    parser.add_argument("--llm-first-token", type=float, default=0.2, help="segundos até o primeiro token")
+    parser.add_argument("--llm-token", type=float, default=0.01, help="segundos entre tokens")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--endpoint-rps", type=float, default=5.0, help="cota do endpoint falso de embeddings")
+    parser.add_argument("--endpoint-latency", type=float, default=0.1, help="latência do endpoint falso")
+    parser.add_argument("--embed-workers", type=int, default=4)
+    parser.add_argument("--chunker", choices=sorted(SPLITTERS), default=STRUCTURE,
+                        help="splitter usado na ingestão do benchmark")
+    parser.add_argument("--context-tokens", type=int, default=BENCH_CONTEXT_TOKENS, help="orçamento do contexto (MMR)")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: ./.cache/benchmarks/<data>.json)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.articles, args.k, args.repeat, args.e2e_queries, args.embed_latency,
+                            args.embed_per_text_latency, args.llm_first_token, args.llm_token, args.seed,
+                            args.endpoint_rps, args.endpoint_latency, args.embed_workers, args.chunker,
+                            args.context_tokens)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_summary(results, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("benchmark-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados salvos em {output}")
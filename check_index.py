@@ -1,57 +1,339 @@
 import os
-from dotenv import load_dotenv
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import Chroma
-
-# --- 1. CONFIGURAÇÃO DE AMBIENTE ---
-# Garante que a chave da API do Gemini seja carregada
-load_dotenv("keys.env") 
-API_KEY = os.getenv("GEMINI_API_KEY")
-
-if not API_KEY:
-    print("ERRO: GEMINI_API_KEY não configurada. Não é possível carregar o DB.")
-    exit()
-
-# --- 2. INICIALIZAÇÃO E CARREGAMENTO DO ÍNDICE ---
-# Inicializa embeddings (precisa ser o mesmo modelo usado para criar o índice)
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="text-embedding-004",
-    google_api_key=API_KEY
-)
-
-try:
-    print("Carregando ChromaDB da pasta ./chroma_db...")
-    # 1. Carrega o Vector Store persistido
-    vectorstore = Chroma(
-        persist_directory="./chroma_db",
-        embedding_function=embeddings
-    )
-    
-    # 2. Busca de similaridade (query simples)
-    # Buscamos um termo relevante para o novo conteúdo (GeneXus 18)
-    results = vectorstore.similarity_search("GeneXus 18 Super Apps", k=10) 
-    
-    print(f"\n✅ Total de documentos (chunks) no índice: {vectorstore._collection.count()}")
-    print("\n🔗 10 Exemplos de Artigos Indexados (Verificando a URL de Origem):")
-    print("-" * 60)
-    
-    # 3. Itera sobre os resultados para mostrar a fonte (source)
-    for i, doc in enumerate(results):
-        source_url = doc.metadata.get('source', 'Fonte não encontrada')
-        
-        # Classifica a origem
-        if "docs.genexus.com" in source_url:
-            source_type = "🌐 WEB ARTICLE"
-        elif source_url.endswith(".pdf"):
-            source_type = "📄 LOCAL PDF"
-        else:
-            source_type = "❓ OUTRA FONTE"
-
-        # Exibe a origem e a URL
-        print(f"[{source_type}]")
-        print(f"   {source_url}")
-        print(f"   Conteúdo Inicial: \"{doc.page_content[:80]}...\"")
-        print("-" * 60)
-            
-except Exception as e:
-    print(f"\nFalha ao carregar o ChromaDB: {e}")
\ No newline at end of file
+import json
+import time
+import sqlite3
+import argparse
+from collections import Counter
+
+from manifest import MANIFEST_FILENAME, read_index_version
+from lexical_index import LEXICAL_INDEX_FILENAME
+from vector_export import VECTOR_INDEX_DIRNAME, current_version_dir
+from partitions import CATALOG_FILENAME, PARTITIONS_DIRNAME
+from snapshots import snapshot_path
+from embedding_scheduler import estimate_tokens
+from dedup import NearDuplicateFilter, exact_key
+
+
+# Diagnóstico offline do índice: lê o chroma.sqlite3 direto, sem modelo de embeddings nem rede
+PERSIST_DIRECTORY = "./chroma_db"
+CHROMA_SQLITE_FILENAME = "chroma.sqlite3"
+# Coleção criada pelo LangChain quando nenhum nome é informado
+DEFAULT_COLLECTION = "langchain"
+# Chunks lidos por página (a memória não cresce com o tamanho da página, só com os contadores)
+PAGE_SIZE = 5000
+TOP_SOURCES = 10
+# Faixas dos histogramas: chunks por fonte e tamanho dos chunks (caracteres)
+CHUNKS_PER_SOURCE_BINS = (1, 5, 10, 50, 100, 500)
+CHUNK_LENGTH_BINS = (200, 500, 1000, 1500, 2500)
+# Chaves da metadata lidas do SQLite (o texto do chunk fica em "chroma:document")
+_DOCUMENT_KEY = "chroma:document"
+_METADATA_KEYS = (_DOCUMENT_KEY, "source", "simhash", "partition")
+
+
+def _bin_label(value, bins):
+    previous = 0
+    for bound in bins:
+        if value <= bound:
+            return f"{previous + 1}-{bound}" if bound > previous + 1 else str(bound)
+        previous = bound
+    return f">{bins[-1]}"
+
+
+def _histogram(counts, bins):
+    """Contagem por faixa (Counter de rótulos), na ordem das faixas e só as faixas com algum valor."""
+    labels = [_bin_label(bound, bins) for bound in bins] + [f">{bins[-1]}"]
+    return {label: counts[label] for label in labels if counts[label]}
+
+
+def source_kind(source, manifest_sources):
+    """Tipo da fonte pelo manifesto; sem ele, pela forma do nome (URL ou PDF)."""
+    entry = manifest_sources.get(source)
+    if entry:
+        return entry["kind"]
+    if not source:
+        return "sem fonte"
+    if source.startswith(("http://", "https://")):
+        return "web"
+    if source.lower().endswith(".pdf"):
+        return "pdf"
+    return "outro"
+
+
+def disk_usage(persist_directory):
+    """Bytes em disco por componente do índice (SQLite, HNSW, exportação, BM25, partições, outros)."""
+    usage = Counter()
+    for root, _, files in os.walk(persist_directory):
+        relative = os.path.relpath(root, persist_directory)
+        top = relative.split(os.sep)[0]
+        for name in files:
+            try:
+                size = os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+            if relative == "." and name.startswith(CHROMA_SQLITE_FILENAME):
+                usage["sqlite"] += size
+            elif relative == "." and name == LEXICAL_INDEX_FILENAME:
+                usage["bm25"] += size
+            elif top == VECTOR_INDEX_DIRNAME:
+                usage["vectors_export"] += size
+            elif top == PARTITIONS_DIRNAME:
+                usage["partitions"] += size
+            elif relative != "." and os.path.exists(os.path.join(persist_directory, top, "header.bin")):
+                usage["hnsw"] += size
+            else:
+                usage["other"] += size
+    return dict(usage)
+
+
+def _open_sqlite(persist_directory):
+    path = os.path.join(persist_directory, CHROMA_SQLITE_FILENAME)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} não encontrado. Execute 'python ingest.py'.")
+    # Somente leitura: pode rodar com o app ou a ingestão usando o índice
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def _metadata_segment(conn, collection):
+    row = conn.execute(
+        "SELECT s.id FROM segments s JOIN collections c ON c.id = s.collection "
+        "WHERE c.name = ? AND s.scope = 'METADATA'", (collection,)).fetchone()
+    if row is None:
+        names = [name for (name,) in conn.execute("SELECT name FROM collections")]
+        raise ValueError(f"Coleção '{collection}' não encontrada no ChromaDB (coleções: {', '.join(names) or 'nenhuma'}).")
+    return row[0]
+
+
+def iter_chunks(conn, segment_id, page_size=PAGE_SIZE):
+    """(id do chunk, metadata) de todos os chunks, em páginas pela chave primária do SQLite."""
+    placeholders = ", ".join("?" for _ in _METADATA_KEYS)
+    last = -1
+    while True:
+        rows = conn.execute(
+            "SELECT id, embedding_id FROM embeddings WHERE segment_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (segment_id, last, page_size)).fetchall()
+        if not rows:
+            break
+        metadata = {}
+        for row_id, key, value in conn.execute(
+                f"SELECT id, key, COALESCE(string_value, CAST(int_value AS TEXT)) FROM embedding_metadata "
+                f"WHERE id BETWEEN ? AND ? AND key IN ({placeholders})",
+                (rows[0][0], rows[-1][0], *_METADATA_KEYS)):
+            metadata.setdefault(row_id, {})[key] = value
+        for row_id, chunk_id in rows:
+            yield chunk_id, metadata.get(row_id, {})
+        last = rows[-1][0]
+
+
+def _load_manifest(persist_directory):
+    path = os.path.join(persist_directory, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _vector_export_meta(persist_directory):
+    path = os.path.join(current_version_dir(os.path.join(persist_directory, VECTOR_INDEX_DIRNAME)), "meta.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _partition_catalog(persist_directory):
+    path = os.path.join(current_version_dir(os.path.join(persist_directory, PARTITIONS_DIRNAME)), CATALOG_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def inspect_index(persist_directory=PERSIST_DIRECTORY, collection=DEFAULT_COLLECTION, page_size=PAGE_SIZE,
+                  top=TOP_SOURCES):
+    """Estatísticas do índice persistido, calculadas em uma passada pelos chunks."""
+    start = time.perf_counter()
+    manifest = _load_manifest(persist_directory)
+    manifest_sources = manifest["sources"] if manifest else {}
+    # ID do chunk -> fonte segundo o manifesto; os que sobrarem no fim não estão no ChromaDB
+    expected_ids = {chunk_id: source for source, entry in manifest_sources.items()
+                    for chunk_id in entry["chunk_ids"]}
+
+    conn = _open_sqlite(persist_directory)
+    try:
+        segment_id = _metadata_segment(conn, collection)
+        chunks_per_source = Counter()
+        chunks_per_partition = Counter()
+        lengths = Counter()
+        total_chars = total_tokens = 0
+        seen_texts = set()
+        near_filter = NearDuplicateFilter()
+        exact_duplicates = near_duplicates = with_simhash = 0
+        orphans = Counter()
+        orphan_examples = []
+        chunks = 0
+        for chunk_id, metadata in iter_chunks(conn, segment_id, page_size):
+            chunks += 1
+            text = metadata.get(_DOCUMENT_KEY)
+            source = metadata.get("source") or ""
+            chunks_per_source[source] += 1
+            chunks_per_partition[metadata.get("partition") or "(sem partição)"] += 1
+            if text is None:
+                orphans["sem texto"] += 1
+            else:
+                total_chars += len(text)
+                total_tokens += estimate_tokens(text)
+                lengths[_bin_label(len(text), CHUNK_LENGTH_BINS)] += 1
+                # 8 bytes da chave de conteúdo bastam para contar repetições sem guardar os textos
+                key = int(exact_key(text)[:16], 16)
+                if key in seen_texts:
+                    exact_duplicates += 1
+                else:
+                    seen_texts.add(key)
+                    # Quase idênticos: só pelos SimHash já gravados na ingestão (nada é recalculado)
+                    if metadata.get("simhash"):
+                        with_simhash += 1
+                        value = int(metadata["simhash"], 16)
+                        if near_filter.find(value) is not None:
+                            near_duplicates += 1
+                        else:
+                            near_filter.add(None, value)
+            if not source:
+                orphans["sem fonte"] += 1
+            if manifest is not None and expected_ids.pop(chunk_id, None) is None:
+                orphans["fora do manifesto"] += 1
+                if len(orphan_examples) < 5:
+                    orphan_examples.append((chunk_id, source))
+    finally:
+        conn.close()
+
+    if manifest is not None and expected_ids:
+        orphans["do manifesto ausentes no ChromaDB"] = len(expected_ids)
+    kinds = Counter()
+    for source, count in chunks_per_source.items():
+        kinds[source_kind(source, manifest_sources)] += count
+    export = _vector_export_meta(persist_directory)
+    catalog = _partition_catalog(persist_directory)
+    index_version = read_index_version(persist_directory)
+    text_chunks = sum(lengths.values())
+    return {
+        "persist_directory": persist_directory,
+        "collection": collection,
+        "chunks": chunks,
+        "sources": len(chunks_per_source),
+        "index_version": index_version,
+        "disk_bytes": disk_usage(persist_directory),
+        "source_types": dict(kinds.most_common()),
+        "top_sources": chunks_per_source.most_common(top),
+        "partitions": dict(sorted(chunks_per_partition.items())),
+        "chunks_per_source": _histogram(Counter(_bin_label(count, CHUNKS_PER_SOURCE_BINS)
+                                                for count in chunks_per_source.values()), CHUNKS_PER_SOURCE_BINS),
+        "chunk_length": {
+            "mean_chars": total_chars / text_chunks if text_chunks else 0.0,
+            "mean_tokens": total_tokens / text_chunks if text_chunks else 0.0,
+            "histogram": _histogram(lengths, CHUNK_LENGTH_BINS),
+        },
+        "duplicates": {
+            "exact": exact_duplicates,
+            "near": near_duplicates,
+            "with_simhash": with_simhash,
+            "ratio": (exact_duplicates + near_duplicates) / chunks if chunks else 0.0,
+        },
+        "orphans": dict(orphans),
+        "orphan_examples": orphan_examples,
+        "manifest_sources": len(manifest_sources) if manifest is not None else None,
+        "vector_export": {
+            "count": export.get("count"),
+            "index_version": export.get("index_version"),
+            "stale": export.get("index_version") != index_version or export.get("count") != chunks,
+        } if export else None,
+        "partition_catalog": {
+            "partitions": len(catalog["partitions"]),
+            "index_version": catalog.get("index_version"),
+            "stale": catalog.get("index_version") != index_version
+                     or sum(entry["chunks"] for entry in catalog["partitions"].values()) != chunks,
+        } if catalog else None,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _megabytes(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def print_report(report):
+    disk = report["disk_bytes"]
+    print(f"\n✅ Índice {report['persist_directory']} (coleção '{report['collection']}', "
+          f"versão {report['index_version']})")
+    print(f"   {report['chunks']} chunks de {report['sources']} fontes · "
+          f"{_megabytes(sum(disk.values()))} em disco ("
+          + ", ".join(f"{name} {_megabytes(size)}" for name, size in sorted(disk.items())) + ")")
+
+    print("\n📂 Chunks por tipo de fonte:")
+    for kind, count in report["source_types"].items():
+        print(f"   {kind:<12} {count:>9} ({count / report['chunks']:.1%})")
+
+    print("\n🗂️  Chunks por partição (versão do GeneXus + tipo de fonte):")
+    for name, count in report["partitions"].items():
+        print(f"   {name:<16} {count:>9} ({count / report['chunks']:.1%})")
+
+    print(f"\n🔗 {len(report['top_sources'])} fontes com mais chunks:")
+    for source, count in report["top_sources"]:
+        print(f"   {count:>7}  {source or '(sem fonte)'}")
+    print("\n📊 Fontes por quantidade de chunks: "
+          + " · ".join(f"{label}: {count}" for label, count in report["chunks_per_source"].items()))
+
+    length = report["chunk_length"]
+    print(f"\n📏 Tamanho médio: {length['mean_chars']:.0f} caracteres (~{length['mean_tokens']:.0f} tokens)")
+    print("   Por faixa de caracteres: "
+          + " · ".join(f"{label}: {count}" for label, count in length["histogram"].items()))
+
+    dup = report["duplicates"]
+    print(f"\n♻️  Duplicados: {dup['exact']} idênticos, {dup['near']} quase idênticos "
+          f"({dup['ratio']:.1%} dos chunks; SimHash gravado em {dup['with_simhash']} chunks)")
+
+    if report["manifest_sources"] is None:
+        print("\n⚠️  Manifesto da ingestão não encontrado: órfãos só pela falta de fonte/texto.")
+    orphans = report["orphans"]
+    if orphans:
+        print("\n⚠️  Órfãos: " + " · ".join(f"{name}: {count}" for name, count in orphans.items()))
+        for chunk_id, source in report["orphan_examples"]:
+            print(f"   ex.: {chunk_id} ({source or 'sem fonte'})")
+    else:
+        print("\n✅ Nenhum chunk órfão.")
+
+    catalog = report["partition_catalog"]
+    export = report["vector_export"]
+    if catalog is not None and catalog["stale"]:
+        print(f"⚠️  Partições desatualizadas: catálogo da versão {catalog['index_version']}. "
+              f"Execute a ingestão novamente.")
+    elif catalog is not None:
+        # Com as partições, o BM25 e a exportação globais não são usados (nem gerados)
+        print(f"✅ Busca pelas {catalog['partitions']} partições da versão {catalog['index_version']}.")
+    elif export is None:
+        print("ℹ️  Exportação memory-mapped dos vetores não encontrada (o app usa o cliente do Chroma).")
+    elif export["stale"]:
+        print(f"⚠️  Exportação dos vetores desatualizada: {export['count']} vetores da versão "
+              f"{export['index_version']}. Execute 'python vector_export.py'.")
+    print(f"\nAnalisado em {report['seconds']:.2f}s "
+          f"({report['chunks'] / report['seconds'] if report['seconds'] else 0:.0f} chunks/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diagnóstico offline do índice (sem embeddings e sem rede).")
+    parser.add_argument("--persist-directory", default=PERSIST_DIRECTORY)
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION)
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--top", type=int, default=TOP_SOURCES, help="fontes listadas com mais chunks")
+    parser.add_argument("--json", action="store_true", help="relatório em JSON")
+    args = parser.parse_args()
+
+    try:
+        # Com snapshots, o diagnóstico é do publicado (o ponteiro CURRENT)
+        report = inspect_index(snapshot_path(args.persist_directory), args.collection, args.page_size, args.top)
+    except (FileNotFoundError, ValueError, sqlite3.Error) as e:
+        print(f"\nFalha ao ler o ChromaDB: {e}")
+        raise SystemExit(1)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
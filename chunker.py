@@ -0,0 +1,373 @@
+import re
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+# Tamanho alvo dos chunks (caracteres): abaixo de MIN_CHARS um chunk continua na próxima
+# seção; código e tabelas podem passar de MAX_CHARS até MAX_ATOMIC_CHARS sem serem cortados
+MAX_CHARS = 1200
+MIN_CHARS = 300
+MAX_ATOMIC_CHARS = 2400
+SECTION_SEPARATOR = " > "
+
+# Tipos de splitter aceitos pelos scripts de ingestão e pelo benchmark
+STRUCTURE = "structure"
+RECURSIVE = "recursive"
+# Versão da saída de cada splitter: entra no hash das fontes no manifesto, então uma mudança
+# na segmentação re-segmenta também os PDFs e artigos que não mudaram. Incremente ao alterar.
+SPLITTER_VERSIONS = {STRUCTURE: "structure-2", RECURSIVE: "recursive-1"}
+
+_MD_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+)$")
+_NUMBERED_HEADING_RE = re.compile(r"^(\d+(?:\.\d+){0,4})\.?\s+[A-ZÀ-Ý]")
+_LIST_ITEM_RE = re.compile(r"^\s*(?:[-*•▪◦‣–]|\d{1,2}[.)])\s+\S")
+_TERMINAL_RE = re.compile(r"[.;,:]$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+# Linhas que só aparecem em código GeneXus (bastam para reconhecer um bloco)
+_STRONG_CODE_RE = re.compile(
+    r"^\s*(?:for each\b|endfor\b|endif\b|endcase\b|enddo\b|endsub\b|endevent\b|endnew\b|endwhen\b|"
+    r"do case\b|do while\b|sub\s+'|do\s+'|parm\s*\(|&\w+(?:\.\w+)*\s*(?:[-+*/]?=|\.\w+\s*\())",
+    re.IGNORECASE,
+)
+# Linhas que podem ser código quando estão junto de uma linha "forte"
+_WEAK_CODE_RE = re.compile(
+    r"^\s*(?:where|order|defined by|when|if|else|elseif|case|otherwise|for\s+&|for\s+\w+\s+in\b|"
+    r"new|commit|rollback|return|msg\s*\(|call\s*\(|print|load|refresh|exit|event\s+['\w]|"
+    r"\w+(?:\.\w+)*\s*=\s*\S|//|/\*)",
+    re.IGNORECASE,
+)
+
+
+def _is_code_line(line, strong_only=False):
+    stripped = line.strip()
+    if not stripped or (stripped.endswith(".") and not stripped.endswith("..")):
+        # Código GeneXus não termina linhas com ponto; prosa termina
+        return False
+    if _STRONG_CODE_RE.match(stripped):
+        return True
+    return not strong_only and bool(_WEAK_CODE_RE.match(stripped)) and len(stripped.split()) <= 12
+
+
+class _Block:
+    def __init__(self, kind, text, level=0):
+        self.kind = kind
+        self.text = text
+        self.level = level
+
+
+def _typical_width(lines):
+    """Largura das linhas cheias (texto de PDF quebrado pelo layout da página)."""
+    lengths = sorted(len(line.rstrip()) for line in lines if line.strip())
+    return lengths[int(len(lengths) * 0.9)] if lengths else 0
+
+
+def _join_wrapped(lines):
+    text = ""
+    for line in lines:
+        line = line.strip()
+        if not text:
+            text = line
+        elif text.endswith("-"):
+            # Palavra hifenizada na quebra de linha (ex: "Recomenda-\nse")
+            text += line
+        else:
+            text += " " + line
+    return text
+
+
+def parse_blocks(text):
+    """Divide o texto (markdown do content_extractor ou texto extraído do PDF) em blocos.
+
+    Tipos: `heading` (com nível), `code`, `table`, `list` e `paragraph`. Nos PDFs os
+    títulos são reconhecidos por heurística (linha curta, sem pontuação final, após o fim
+    de um parágrafo) e os parágrafos terminam em linhas mais curtas que a largura da página.
+    """
+    lines = text.replace("\r\n", "\n").split("\n")
+    markdown = any(_MD_HEADING_RE.match(line) or line.startswith("```") for line in lines)
+    width = _typical_width(lines)
+    blocks = []
+    paragraph = []
+
+    def end_paragraph():
+        if paragraph:
+            blocks.append(_Block("paragraph", _join_wrapped(paragraph)))
+            paragraph.clear()
+
+    i, n = 0, len(lines)
+    while i < n:
+        line = lines[i]
+        stripped = line.strip()
+        if not stripped:
+            end_paragraph()
+            i += 1
+            continue
+
+        if stripped.startswith("```"):
+            end_paragraph()
+            j = i + 1
+            while j < n and not lines[j].strip().startswith("```"):
+                j += 1
+            blocks.append(_Block("code", "\n".join(lines[i:j + 1]).strip()))
+            i = j + 1
+            continue
+
+        match = _MD_HEADING_RE.match(stripped)
+        if match:
+            end_paragraph()
+            blocks.append(_Block("heading", stripped, len(match.group(1))))
+            i += 1
+            continue
+
+        if stripped.startswith("|") or ("\t" in stripped and i + 1 < n and "\t" in lines[i + 1]):
+            end_paragraph()
+            tab_table = not stripped.startswith("|")
+            j = i
+            while j < n and lines[j].strip() and (
+                    ("\t" in lines[j]) if tab_table else lines[j].strip().startswith("|")):
+                j += 1
+            blocks.append(_Block("table", "\n".join(line.strip() for line in lines[i:j])))
+            i = j
+            continue
+
+        if _is_code_line(line):
+            j = i
+            while j < n and _is_code_line(lines[j]):
+                j += 1
+            if any(_is_code_line(candidate, strong_only=True) for candidate in lines[i:j]):
+                end_paragraph()
+                blocks.append(_Block("code", "\n".join(candidate.rstrip() for candidate in lines[i:j])))
+                i = j
+                continue
+
+        if _LIST_ITEM_RE.match(line):
+            end_paragraph()
+            items = []
+            j = i
+            while j < n and lines[j].strip():
+                if _LIST_ITEM_RE.match(lines[j]):
+                    items.append([lines[j]])
+                elif markdown or _is_code_line(lines[j], strong_only=True):
+                    break
+                else:
+                    # Continuação de um item quebrado pelo layout do PDF
+                    items[-1].append(lines[j])
+                j += 1
+            # O recuo do primeiro item mantém o aninhamento das listas em markdown
+            blocks.append(_Block("list", "\n".join(
+                item[0][:len(item[0]) - len(item[0].lstrip())] + _join_wrapped(item) for item in items)))
+            i = j
+            continue
+
+        if not markdown and not paragraph and _looks_like_heading(stripped, lines, i, width):
+            numbered = _NUMBERED_HEADING_RE.match(stripped)
+            level = numbered.group(1).count(".") + 2 if numbered else 1
+            blocks.append(_Block("heading", stripped, level))
+            i += 1
+            continue
+
+        paragraph.append(line)
+        if not markdown and _TERMINAL_RE.search(stripped) and len(stripped) < width * 0.8:
+            # Linha curta terminada em pontuação: fim do parágrafo no texto do PDF
+            end_paragraph()
+        i += 1
+    end_paragraph()
+    return blocks
+
+
+def _looks_like_heading(stripped, lines, i, width):
+    if len(stripped) < 3 or len(stripped) > 90 or len(stripped.split()) > 12:
+        return False
+    if _TERMINAL_RE.search(stripped) or not (stripped[0].isupper() or stripped[0].isdigit()):
+        return False
+    if width and len(stripped) >= width * 0.7:
+        # Linha cheia: é o começo de um parágrafo quebrado, não um título
+        return False
+    following = lines[i + 1].strip() if i + 1 < len(lines) else ""
+    return bool(following)
+
+
+def _split_long_text(text, limit):
+    """Quebra um parágrafo grande em frases (ou palavras, em último caso) até `limit`."""
+    pieces, current = [], ""
+    for sentence in _SENTENCE_RE.split(text):
+        while len(sentence) > limit:
+            cut = sentence.rfind(" ", 0, limit)
+            cut = cut if cut > 0 else limit
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if current and len(current) + len(sentence) + 1 > limit:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _wrap_line(line, limit):
+    """Quebra uma linha maior que `limit` (ex: código minificado) no último espaço antes do limite."""
+    pieces = []
+    while len(line) > limit:
+        cut = line.rfind(" ", 0, limit)
+        cut = cut if cut > 0 else limit
+        pieces.append(line[:cut])
+        line = line[cut:].strip()
+    return pieces + [line] if line else pieces
+
+
+def _split_lines(lines, limit, header=()):
+    """Agrupa linhas (de código ou tabela) em pedaços até `limit`, repetindo o cabeçalho.
+
+    Uma linha que sozinha (com o cabeçalho) passa do limite é quebrada em várias.
+    """
+    if sum(len(x) + 1 for x in header) > limit // 2:
+        # Cabeçalho grande demais para se repetir em cada pedaço: vira uma linha comum
+        lines, header = list(header) + list(lines), ()
+    pieces, current = [], list(header)
+    line_limit = max(1, limit - sum(len(x) + 1 for x in header))
+    lines = [piece for line in lines for piece in (_wrap_line(line, line_limit) if len(line) > line_limit else [line])]
+    for line in lines:
+        if len(current) > len(header) and sum(len(x) + 1 for x in current) + len(line) > limit:
+            pieces.append("\n".join(current))
+            current = list(header)
+        current.append(line)
+    if len(current) > len(header):
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def _split_block(block, max_chars, max_atomic_chars):
+    """Pedaços de um bloco: código e tabelas só são divididos acima de `max_atomic_chars`."""
+    if block.kind in ("code", "table"):
+        if len(block.text) <= max_atomic_chars:
+            return [block.text]
+        lines = block.text.split("\n")
+        if block.kind == "table":
+            header = lines[:2] if len(lines) > 1 and set(lines[1]) <= set("|-: ") else lines[:1]
+            return _split_lines(lines[len(header):], max_atomic_chars, header)
+        if lines[0].startswith("```"):
+            # Cada pedaço continua sendo um bloco de código completo (com as cercas)
+            body = lines[1:-1] if lines[-1].strip().startswith("```") else lines[1:]
+            return [f"```\n{piece}\n```" for piece in _split_lines(body, max_atomic_chars - 8)]
+        return _split_lines(lines, max_atomic_chars)
+    if len(block.text) <= max_chars:
+        return [block.text]
+    if block.kind == "list":
+        pieces = []
+        for item in block.text.split("\n"):
+            pieces.extend(_split_long_text(item, max_chars) if len(item) > max_chars else [item])
+        return _split_lines(pieces, max_chars)
+    return _split_long_text(block.text, max_chars)
+
+
+class StructureAwareSplitter:
+    """Segmenta a documentação GeneXus respeitando títulos, código, tabelas e listas.
+
+    Os chunks têm tamanho variável (até `max_chars`, ou `max_atomic_chars` para um bloco
+    de código/tabela inteiro) e não têm sobreposição: cada um começa em um limite de
+    bloco e, quando não começa no título da seção, recebe o caminho da seção na primeira
+    linha. A metadata ganha `section_path` (ex: "For Each command > Syntax") e `has_code`.
+    Mesma interface do RecursiveCharacterTextSplitter (`split_documents`).
+    """
+
+    def __init__(self, max_chars=MAX_CHARS, min_chars=MIN_CHARS, max_atomic_chars=MAX_ATOMIC_CHARS):
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+        self.max_atomic_chars = max(max_atomic_chars, max_chars)
+
+    def _chunks(self, blocks, sections):
+        """Gera (texto, caminho da seção, tem código); `sections` continua entre páginas."""
+        state = {}
+
+        def reset():
+            state.update(parts=[], size=0, path=None, leading=0, has_code=False)
+
+        def context():
+            """Caminho da seção adicionado no topo do chunk (sem os títulos que já o abrem)."""
+            path = state["path"] if state["path"] is not None else [text for _, text in sections]
+            return _section_header(path[:len(path) - state["leading"]])
+
+        def flush():
+            path = state["path"] if state["path"] is not None else [text for _, text in sections]
+            return context() + "\n\n".join(state["parts"]), path, state["has_code"]
+
+        reset()
+        for block in blocks:
+            if block.kind == "heading":
+                if state["path"] is not None and state["size"] >= self.min_chars:
+                    yield flush()
+                    reset()
+                while sections and sections[-1][0] >= block.level:
+                    sections.pop()
+                sections.append((block.level, block.text))
+                if state["path"] is None:
+                    state["leading"] += 1
+                state["parts"].append(block.text)
+                state["size"] += len(block.text) + 2
+                continue
+            atomic = block.kind in ("code", "table")
+            if atomic and state["path"] is not None and state["size"] >= self.min_chars:
+                # Código e tabelas abrem um chunk próprio (com o caminho da seção no topo)
+                # em vez de dividir o espaço com parágrafos sem relação direta
+                yield flush()
+                reset()
+            limit = self.max_atomic_chars if atomic else self.max_chars
+            # Em código e tabelas `max_atomic_chars` é um teto: o que vai antes de cada pedaço
+            # conta nele (os títulos que abrem o chunk atual ou, num chunk novo, o caminho da seção)
+            reserve = 0
+            if atomic:
+                reserve = len(_section_header([text for _, text in sections]))
+                if state["path"] is None:
+                    reserve = max(reserve, state["size"] + len(context()))
+            atomic_limit = max(self.min_chars, self.max_atomic_chars - reserve)
+            for piece in _split_block(block, self.max_chars, atomic_limit):
+                current = state["size"] + len(piece) + (len(context()) if atomic else 0)
+                if state["path"] is not None and current > limit:
+                    yield flush()
+                    reset()
+                if state["path"] is None:
+                    state["path"] = [text for _, text in sections]
+                state["parts"].append(piece)
+                state["size"] += len(piece) + 2
+                state["has_code"] = state["has_code"] or block.kind == "code"
+        if state["parts"]:
+            yield flush()
+
+    def split_text(self, text):
+        return [chunk for chunk, _, _ in self._chunks(parse_blocks(text), [])]
+
+    def split_documents(self, documents):
+        chunks = []
+        sections, previous_source = [], None
+        for document in documents:
+            source = document.metadata.get("source")
+            if source != previous_source:
+                # Páginas seguidas do mesmo PDF herdam a seção em que a anterior terminou
+                sections, previous_source = [], source
+            for text, path, has_code in self._chunks(parse_blocks(document.page_content), sections):
+                metadata = dict(document.metadata)
+                metadata["section_path"] = SECTION_SEPARATOR.join(_heading_title(title) for title in path or [])
+                metadata["has_code"] = has_code
+                chunks.append(Document(page_content=text, metadata=metadata))
+        return chunks
+
+
+def _heading_title(heading):
+    return heading.lstrip("#").strip()
+
+
+def _section_header(titles):
+    return SECTION_SEPARATOR.join(_heading_title(title) for title in titles) + "\n\n" if titles else ""
+
+
+def make_splitter(kind=STRUCTURE, chunk_size=MAX_CHARS, chunk_overlap=0):
+    """Splitter usado na ingestão; `recursive` mantém o comportamento antigo (com sobreposição)."""
+    if kind == RECURSIVE:
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len)
+    if kind == STRUCTURE:
+        return StructureAwareSplitter(max_chars=chunk_size)
+    raise ValueError(f"Splitter desconhecido: {kind}")
@@ -0,0 +1,173 @@
+import re
+
+from bs4 import BeautifulSoup, NavigableString, Tag, Comment
+
+
+# Contêineres do conteúdo principal, em ordem de preferência; sem nenhum deles o
+# bloco com mais texto (e menos links) da página é escolhido
+CONTENT_SELECTORS = ["#wikiContent", ".WikiContent", "#content", "main", "article", "[role=main]"]
+# Elementos que nunca fazem parte do conteúdo. `form` fica de fora: as páginas da
+# docs.genexus.com (GeneXus Web Forms) têm o corpo inteiro dentro do <form id="MAINFORM">
+BOILERPLATE_TAGS = ["script", "style", "noscript", "nav", "header", "footer", "aside",
+                    "iframe", "svg", "button", "input", "select", "template"]
+# id/class típicos de menus, barras laterais e rodapés da wiki ("header" não entra: classes
+# como "TableHeader" ou "ContentHeader" marcam títulos e tabelas do próprio artigo)
+BOILERPLATE_RE = re.compile(
+    r"(^|[\s_-])(nav|navbar|menu|sidebar|side-bar|footer|breadcrumbs?|toolbar|cookie|share|"
+    r"social|related|search|login|toc|skip|banner|advert|ads|feedback|rating|comments?)([\s_-]|$)",
+    re.IGNORECASE,
+)
+# Links demais em relação ao texto: é um menu, não conteúdo
+MAX_LINK_DENSITY = 0.5
+MIN_BLOCK_CHARS = 200
+
+_BLOCK_TAGS = {"p", "div", "section", "article", "main", "blockquote", "dl", "dd", "dt", "figure",
+               "figcaption", "center", "body"}
+_WHITESPACE_RE = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def _is_boilerplate(tag):
+    if tag.attrs is None:
+        return False
+    names = " ".join([tag.get("id") or ""] + list(tag.get("class") or []))
+    return bool(names.strip()) and bool(BOILERPLATE_RE.search(names))
+
+
+def strip_boilerplate(root):
+    """Remove do HTML navegação, rodapés, scripts e blocos com cara de menu."""
+    for comment in root.find_all(string=lambda s: isinstance(s, Comment)):
+        comment.extract()
+    for tag in root.find_all(BOILERPLATE_TAGS):
+        tag.decompose()
+    for tag in root.find_all(_is_boilerplate):
+        if not tag.decomposed and tag.name not in ("html", "body"):
+            tag.decompose()
+
+
+def _link_density(tag):
+    text = len(tag.get_text(" ", strip=True))
+    if not text:
+        return 1.0
+    links = sum(len(a.get_text(" ", strip=True)) for a in tag.find_all("a"))
+    return links / text
+
+
+def find_main_content(soup):
+    """Escolhe o contêiner do conteúdo principal (seletores conhecidos ou densidade de texto)."""
+    for selector in CONTENT_SELECTORS:
+        found = soup.select_one(selector)
+        if found and len(found.get_text(" ", strip=True)) >= MIN_BLOCK_CHARS:
+            return found
+    body = soup.body or soup
+    best, best_score = body, 0.0
+    for tag in body.find_all(["div", "section", "td"]):
+        text = len(tag.get_text(" ", strip=True))
+        if text < MIN_BLOCK_CHARS:
+            continue
+        density = _link_density(tag)
+        if density > MAX_LINK_DENSITY:
+            continue
+        # Parágrafos diretos pesam mais que texto espalhado em muitos filhos
+        score = text * (1 - density) * (1 + len(tag.find_all("p", recursive=False)))
+        if score > best_score:
+            best, best_score = tag, score
+    return best
+
+
+def _inline(node):
+    parts = []
+    for child in node.children:
+        if isinstance(child, NavigableString):
+            parts.append(_WHITESPACE_RE.sub(" ", str(child)).replace("\n", " "))
+        elif isinstance(child, Tag):
+            if child.name == "br":
+                parts.append("\n")
+            elif child.name == "code":
+                parts.append(f"`{child.get_text()}`")
+            elif child.name in ("b", "strong"):
+                text = _inline(child).strip()
+                parts.append(f"**{text}**" if text else "")
+            else:
+                parts.append(_inline(child))
+    return "".join(parts)
+
+
+def _table(table):
+    rows = []
+    for tr in table.find_all("tr"):
+        cells = [" ".join(_inline(cell).split()) for cell in tr.find_all(["th", "td"])]
+        if cells:
+            rows.append("| " + " | ".join(cells) + " |")
+            if len(rows) == 1:
+                rows.append("|" + "---|" * len(cells))
+    return "\n".join(rows)
+
+
+def _markdown(node, out, list_depth=0):
+    for child in node.children:
+        if isinstance(child, NavigableString):
+            text = _WHITESPACE_RE.sub(" ", str(child))
+            if text.strip():
+                out.append(text.replace("\n", " "))
+            continue
+        if not isinstance(child, Tag):
+            continue
+        name = child.name
+        if name in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            out.append(f"\n\n{'#' * int(name[1])} {' '.join(_inline(child).split())}\n\n")
+        elif name == "pre":
+            out.append(f"\n\n```\n{child.get_text().strip(chr(10))}\n```\n\n")
+        elif name in ("ul", "ol"):
+            out.append("\n")
+            for number, item in enumerate(child.find_all("li", recursive=False), start=1):
+                bullet = f"{number}." if name == "ol" else "-"
+                nested = item.find_all(["ul", "ol"], recursive=False)
+                for sub in nested:
+                    sub.extract()
+                out.append(f"\n{'  ' * list_depth}{bullet} {' '.join(_inline(item).split())}")
+                for sub in nested:
+                    _markdown(_wrap(sub), out, list_depth + 1)
+            out.append("\n\n")
+        elif name == "table":
+            out.append(f"\n\n{_table(child)}\n\n")
+        elif name == "br":
+            out.append("\n")
+        elif name in _BLOCK_TAGS or name == "li":
+            out.append("\n\n")
+            _markdown(child, out, list_depth)
+            out.append("\n\n")
+        elif name == "img":
+            alt = child.get("alt", "").strip()
+            if alt:
+                out.append(f"[Imagem: {alt}]")
+        else:
+            inline = _inline(child)
+            if inline.strip():
+                out.append(inline)
+
+
+def _wrap(tag):
+    """Envolve um elemento solto para que `_markdown` visite o próprio elemento."""
+    holder = BeautifulSoup("<div></div>", "html.parser").div
+    holder.append(tag)
+    return holder
+
+
+def to_markdown(node):
+    """Texto em markdown simples: títulos (#), listas (-), tabelas (|) e código (```)."""
+    out = []
+    _markdown(node, out)
+    lines = [line.rstrip() for line in "".join(out).split("\n")]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def extract_main_content(soup):
+    """Conteúdo principal de um artigo da docs.genexus.com, sem menus nem rodapés, em markdown.
+
+    Altera `soup` (remove o boilerplate); extraia a metadata antes. Se a extração não
+    encontrar nada, devolve o texto da página inteira em vez de um documento vazio.
+    """
+    fallback = soup.get_text(" ", strip=True)
+    strip_boilerplate(soup)
+    return to_markdown(find_main_content(soup)) or fallback
@@ -0,0 +1,179 @@
+import os
+import re
+
+from lexical_index import tokenize
+from embedding_scheduler import estimate_tokens
+
+
+# Orçamento de tokens do CONTEXTO no prompt (antes: 3 chunks inteiros, ~750-900 tokens sem controle)
+DEFAULT_CONTEXT_TOKENS = 600
+# Chunks pedidos à busca para a seleção por MMR (over-fetch)
+DEFAULT_CANDIDATES = 10
+# Peso da relevância x diversidade no MMR (1.0 = só relevância)
+DEFAULT_LAMBDA = 0.7
+# Candidatos mais parecidos que isso com um já escolhido são descartados como repetição
+DUPLICATE_SIMILARITY = 0.8
+# Sobreposição mínima (caracteres) para emendar dois chunks vizinhos
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 400
+# Parágrafos menores que isso (títulos, linhas soltas) nunca são removidos como repetidos
+MIN_DUPLICATE_PARAGRAPH = 40
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _overlap(previous, following):
+    """Tamanho do trecho final de `previous` repetido no começo de `following`."""
+    for size in range(min(len(previous), len(following), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return size
+    return 0
+
+
+def _adjacent(a, b):
+    """Chunks consecutivos da mesma fonte (mesma página ou a seguinte, no caso dos PDFs)."""
+    if a.metadata.get("source") != b.metadata.get("source"):
+        return False
+    index_a, index_b = a.metadata.get("chunk_index"), b.metadata.get("chunk_index")
+    if index_a is None or index_b is None or index_b != index_a + 1:
+        return False
+    page_a, page_b = a.metadata.get("page"), b.metadata.get("page")
+    return page_a is None or page_b is None or 0 <= page_b - page_a <= 1
+
+
+def _strip_section_line(doc):
+    """Remove a linha de caminho da seção que o chunker põe no topo das continuações."""
+    text = doc.page_content
+    section_path = doc.metadata.get("section_path")
+    if section_path and text.startswith(section_path + "\n\n"):
+        return text[len(section_path) + 2:]
+    return text
+
+
+def _label(doc):
+    metadata = doc.metadata
+    source = metadata.get("title") or os.path.basename(str(metadata.get("source", ""))) or "documento"
+    parts = [source]
+    if metadata.get("page") is not None:
+        parts.append(f"página {int(metadata['page']) + 1}")
+    if metadata.get("section_path"):
+        parts.append(metadata["section_path"])
+    return " · ".join(parts)
+
+
+class ContextBuilder:
+    """Monta o CONTEXTO do prompt dentro de um orçamento de tokens.
+
+    Recebe mais candidatos que o necessário (na ordem da busca híbrida) e escolhe entre
+    eles por Maximal Marginal Relevance: relevância pela posição no ranking e diversidade
+    pela similaridade lexical (Jaccard dos termos) com os já escolhidos. Chunks vizinhos
+    da mesma fonte são emendados sem a sobreposição, parágrafos repetidos saem e cada
+    trecho ganha uma linha de origem (arquivo/página/seção). As métricas de cada montagem
+    voltam junto com o CONTEXTO: o mesmo builder atende perguntas simultâneas.
+    """
+
+    def __init__(self, max_tokens=DEFAULT_CONTEXT_TOKENS, candidates=DEFAULT_CANDIDATES,
+                 lambda_mult=DEFAULT_LAMBDA, duplicate_similarity=DUPLICATE_SIMILARITY):
+        self.max_tokens = max_tokens
+        self.candidates = candidates
+        self.lambda_mult = lambda_mult
+        self.duplicate_similarity = duplicate_similarity
+
+    def _mmr_order(self, docs):
+        """Ordem de escolha dos candidatos por MMR; quase duplicados ficam de fora."""
+        terms = [set(tokenize(doc.page_content)) for doc in docs]
+        count = len(docs)
+        relevance = [1.0 - i / count for i in range(count)]
+        remaining = list(range(count))
+        chosen, duplicates = [], 0
+        while remaining:
+            best, best_score, best_similarity = None, None, 0.0
+            for i in remaining:
+                similarity = max((_jaccard(terms[i], terms[j]) for j in chosen), default=0.0)
+                score = self.lambda_mult * relevance[i] - (1 - self.lambda_mult) * similarity
+                if best_score is None or score > best_score:
+                    best, best_score, best_similarity = i, score, similarity
+            remaining.remove(best)
+            if best_similarity >= self.duplicate_similarity:
+                duplicates += 1
+                continue
+            chosen.append(best)
+        return chosen, duplicates
+
+    def _passages(self, docs):
+        """Agrupa os chunks escolhidos em trechos contínuos (vizinhos emendados sem sobreposição)."""
+        ordered = sorted(docs, key=lambda doc: (str(doc.metadata.get("source")), doc.metadata.get("page") or 0,
+                                                doc.metadata.get("chunk_index") or 0))
+        passages, merged = [], 0
+        for doc in ordered:
+            if passages and _adjacent(passages[-1]["last"], doc):
+                text = _strip_section_line(doc)
+                previous = passages[-1]["text"]
+                overlap = _overlap(previous, text)
+                passages[-1]["text"] = previous + text[overlap:] if overlap else previous + "\n\n" + text
+                passages[-1]["last"] = doc
+                passages[-1]["members"].append(doc)
+                merged += 1
+            else:
+                passages.append({"label": _label(doc), "text": doc.page_content, "last": doc, "members": [doc]})
+        # Os trechos voltam para a ordem de relevância do primeiro chunk de cada um
+        rank = {id(doc): i for i, doc in enumerate(docs)}
+        passages.sort(key=lambda passage: min(rank[id(doc)] for doc in passage["members"]))
+        return passages, merged
+
+    def _render(self, docs):
+        passages, merged = self._passages(docs)
+        seen, removed, blocks = set(), 0, []
+        for passage in passages:
+            paragraphs = []
+            for paragraph in _PARAGRAPH_RE.split(passage["text"]):
+                key = " ".join(paragraph.lower().split())
+                if len(key) >= MIN_DUPLICATE_PARAGRAPH and key in seen:
+                    removed += 1
+                    continue
+                seen.add(key)
+                paragraphs.append(paragraph.strip())
+            if any(paragraphs):
+                blocks.append(f"[Fonte: {passage['label']}]\n" + "\n\n".join(p for p in paragraphs if p))
+        return "\n\n---\n\n".join(blocks), len(blocks), merged, removed
+
+    def build(self, docs):
+        """Retorna (contexto, stats) para os `docs` candidatos (ordenados do mais relevante)."""
+        _, context, stats = self.select(docs)
+        return context, stats
+
+    def select(self, docs):
+        """Retorna (chunks escolhidos, contexto, stats): `build` com os chunks que entraram."""
+        docs = list(docs)
+        order, duplicates = self._mmr_order(docs)
+        selected = []
+        context, passages, merged, removed = "", 0, 0, 0
+        for i in order:
+            attempt = self._render(selected + [docs[i]])
+            # O primeiro chunk sempre entra, mesmo acima do orçamento
+            if selected and estimate_tokens(attempt[0]) > self.max_tokens:
+                continue
+            selected.append(docs[i])
+            context, passages, merged, removed = attempt
+        stats = {
+            "candidates": len(docs),
+            "selected": len(selected),
+            "passages": passages,
+            "merged": merged,
+            "duplicates": duplicates,
+            "paragraphs_removed": removed,
+            "context_tokens": estimate_tokens(context) if context else 0,
+        }
+        return selected, context, stats
+
+
+def format_context_stats(stats):
+    """Resumo das métricas do contexto para a legenda de latência do app."""
+    return (f"contexto ~{stats['context_tokens']} tokens ({stats['selected']} de "
+            f"{stats['candidates']} chunks em {stats['passages']} trechos)")
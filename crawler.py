@@ -0,0 +1,438 @@
+import os
+import re
+import gzip
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+import xml.etree.ElementTree as ET
+
+import requests
+from bs4 import BeautifulSoup
+
+from rate_limit import TokenBucket
+from web_fetcher import HttpCache, HTTP_CACHE_DIR, DEFAULT_HEADERS
+
+
+# Estado persistente do rastreamento (fronteira em SQLite + filtro de Bloom dos visitados)
+CRAWLER_STATE_DIR = "./.cache/crawler"
+# Seletor dos resultados na página de busca (renderizada via JavaScript)
+SEARCH_RESULT_SELECTOR = "span.Search__Title > a"
+# Espera explícita máxima pelo resultado da busca quando o navegador é necessário
+BROWSER_WAIT_SECONDS = 20
+ASSET_EXTENSIONS = (".png", ".jpg", ".gif", ".css", ".js", ".svg")
+
+# Estados e tipos das URLs na fronteira
+PENDING, DONE, FAILED = 0, 1, 2
+SITEMAP, SEARCH, PAGE = "sitemap", "search", "page"
+_KIND_PRIORITY = f"CASE kind WHEN '{SITEMAP}' THEN 0 WHEN '{SEARCH}' THEN 1 ELSE 2 END"
+
+_SEARCH_PAGE_RE = re.compile(r",(\d+)$")
+
+
+def is_article_url(url):
+    """Mesmo filtro usado no scraper original: artigos da wiki, sem âncoras nem arquivos."""
+    return (
+        "/en/wiki?" in url
+        and "#" not in url
+        and not any(ext in url for ext in ASSET_EXTENSIONS)
+    )
+
+
+def normalize_url(href, base_url):
+    """Torna a URL absoluta e remove o fragmento (#...)."""
+    parts = urlsplit(urljoin(base_url, href.strip()))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, parts.query, ""))
+
+
+def search_page_number(url):
+    match = _SEARCH_PAGE_RE.search(url)
+    return int(match.group(1)) if match else 1
+
+
+def next_search_page(url):
+    """A busca paginada usa o sufixo ',N' (a primeira página não tem sufixo)."""
+    base = _SEARCH_PAGE_RE.sub("", url)
+    return f"{base},{search_page_number(url) + 1}"
+
+
+class BloomFilter:
+    """Conjunto aproximado e compacto de URLs já vistas (sem falsos negativos).
+
+    Com 200 mil URLs e taxa de erro de 0,1% ocupa cerca de 350 KB, contra dezenas
+    de MB de um `set` de strings.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def add(self, item):
+        """Adiciona o item; retorna False se ele (provavelmente) já estava no filtro."""
+        added = False
+        for p in self._positions(item):
+            mask = 1 << (p & 7)
+            if not self.bits[p >> 3] & mask:
+                self.bits[p >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            header = f"{self.capacity} {self.error_rate} {self.count}\n".encode("ascii")
+            f.write(header)
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, capacity, error_rate=0.001):
+        if not os.path.exists(path):
+            return cls(capacity, error_rate)
+        with open(path, "rb") as f:
+            capacity, error_rate, count = f.readline().decode("ascii").split()
+            bloom = cls(int(capacity), float(error_rate))
+            bloom.bits = bytearray(f.read())
+            bloom.count = int(count)
+        return bloom
+
+
+class DocsCrawler:
+    """Rastreador de docs.genexus.com com fronteira persistente e limite de taxa por host.
+
+    Descobre artigos `/en/wiki?` a partir de sitemaps e de HTML simples; o navegador
+    (Selenium) só é usado nas páginas de busca cujo resultado depende de JavaScript.
+    Com `follow_links=False` os artigos só entram pelas sementes (busca/sitemaps) e não
+    são baixados no rastreamento: os links de cada artigo levariam à wiki inteira.
+    Se o processo for interrompido, a próxima chamada de `crawl()` continua de onde parou.
+    """
+
+    def __init__(self, state_dir=CRAWLER_STATE_DIR, cache_dir=HTTP_CACHE_DIR, rate=2.0, workers=4,
+                 max_articles=50_000, max_depth=None, max_search_pages=500,
+                 capacity=200_000, browser_factory=None, timeout=30, follow_links=True):
+        self.state_dir = state_dir
+        self.rate = rate
+        self.workers = workers
+        self.max_articles = max_articles
+        self.max_depth = max_depth
+        self.max_search_pages = max_search_pages
+        self.capacity = capacity
+        self.browser_factory = browser_factory
+        self.timeout = timeout
+        self.follow_links = follow_links
+        self.http_cache = HttpCache(cache_dir)
+        self.stats = {"requests": 0, "not_modified": 0, "browser_renders": 0, "robots_blocked": 0}
+        # As contagens são atualizadas pelas threads do pool
+        self._stats_lock = threading.Lock()
+
+        if not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+        self._bloom_path = os.path.join(state_dir, "visited.bloom")
+        self._conn = sqlite3.connect(os.path.join(state_dir, "frontier.sqlite"))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS frontier ("
+            " url TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " depth INTEGER NOT NULL,"
+            " state INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_frontier_state ON frontier(state, kind, depth)")
+        self._conn.commit()
+        self._bloom = BloomFilter.load(self._bloom_path, capacity)
+
+        self._local = threading.local()
+        self._hosts_lock = threading.Lock()
+        self._throttles = {}
+        self._robots = {}
+        self._browser = None
+        self._browser_lock = threading.Lock()
+
+    # --- Fronteira ---
+
+    def _pending_count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM frontier WHERE state = ?", (PENDING,)).fetchone()[0]
+
+    def _count_articles(self):
+        return self._conn.execute("SELECT COUNT(*) FROM frontier WHERE kind = ?", (PAGE,)).fetchone()[0]
+
+    def _enqueue(self, url, kind, depth):
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        if kind == PAGE and self._articles >= self.max_articles:
+            self._truncated = True
+            return False
+        # O filtro de Bloom evita consultar o SQLite para URLs que já foram vistas
+        if not self._bloom.add(url):
+            return False
+        if not self._allowed(url):
+            return False
+        inserted = self._conn.execute(
+            "INSERT OR IGNORE INTO frontier (url, kind, depth, state) VALUES (?, ?, ?, ?)",
+            (url, kind, depth, PENDING),
+        ).rowcount
+        if inserted and kind == PAGE:
+            self._articles += 1
+        return bool(inserted)
+
+    def _reset(self):
+        """Começa um rastreamento novo (o anterior terminou por completo)."""
+        self._conn.execute("DELETE FROM frontier")
+        self._conn.commit()
+        self._bloom = BloomFilter(self.capacity)
+        self._articles = 0
+
+    def _checkpoint(self):
+        self._conn.commit()
+        self._bloom.save(self._bloom_path)
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    # --- Rede e boas maneiras (politeness) ---
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            self._local.session = session
+        return session
+
+    def _host_state(self, url):
+        """Retorna (limitador de taxa, robots.txt) do host, criando-os na primeira visita."""
+        parts = urlsplit(url)
+        host = parts.netloc
+        with self._hosts_lock:
+            if host not in self._throttles:
+                robots = RobotFileParser()
+                try:
+                    response = self._session().get(f"{parts.scheme}://{host}/robots.txt", timeout=self.timeout)
+                    robots.parse(response.text.splitlines() if response.status_code == 200 else [])
+                except requests.RequestException:
+                    robots.parse([])
+                rate = self.rate
+                crawl_delay = robots.crawl_delay(DEFAULT_HEADERS["User-Agent"])
+                if crawl_delay:
+                    rate = min(rate, 1.0 / float(crawl_delay))
+                self._throttles[host] = TokenBucket(rate, capacity=1)
+                self._robots[host] = robots
+            return self._throttles[host], self._robots[host]
+
+    def _allowed(self, url):
+        """O robots.txt do host permite acessar a URL?"""
+        _, robots = self._host_state(url)
+        if robots.can_fetch(DEFAULT_HEADERS["User-Agent"], url):
+            return True
+        self._count("robots_blocked")
+        return False
+
+    def sitemaps_for(self, url):
+        """Sitemaps anunciados no robots.txt do host (mais o /sitemap.xml padrão)."""
+        _, robots = self._host_state(url)
+        parts = urlsplit(url)
+        sitemaps = list(robots.site_maps() or [])
+        default = f"{parts.scheme}://{parts.netloc}/sitemap.xml"
+        if default not in sitemaps:
+            sitemaps.append(default)
+        return sitemaps
+
+    def _get(self, url, use_cache=False):
+        """GET respeitando robots.txt e o limite por host; retorna o corpo ou None."""
+        if not self._allowed(url):
+            return None
+        throttle, _ = self._host_state(url)
+
+        entry = self.http_cache.get(url) if use_cache else None
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        for attempt in range(3):
+            throttle.acquire()
+            self._count("requests")
+            try:
+                response = self._session().get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                if attempt == 2:
+                    print(f" !! ERRO ao acessar {url}: {e}")
+                    return None
+                time.sleep(2 ** attempt)
+                continue
+            if response.status_code == 304 and entry:
+                self._count("not_modified")
+                entry["fetched_at"] = time.time()
+                self.http_cache.put(url, entry)
+                return entry["body"]
+            if response.status_code == 429 or response.status_code >= 500:
+                # Servidor sobrecarregado: respeita o Retry-After (ou recua exponencialmente)
+                retry_after = response.headers.get("Retry-After", "")
+                time.sleep(int(retry_after) if retry_after.isdigit() else 2 ** (attempt + 1))
+                continue
+            if response.status_code != 200:
+                return None
+            if use_cache:
+                # Guardado no mesmo cache do web_fetcher: o carregamento do conteúdo reaproveita a página
+                self.http_cache.put(url, {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "server_max_age": 0,
+                    "fetched_at": time.time(),
+                    "body": response.text,
+                })
+            if url.endswith(".gz") and response.content[:2] == b"\x1f\x8b":
+                return gzip.decompress(response.content).decode("utf-8", errors="replace")
+            return response.text
+        return None
+
+    def _render_with_browser(self, url):
+        """Fallback para páginas geradas por JavaScript: espera explícita pelos resultados."""
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        with self._browser_lock:
+            if self._browser is None:
+                self._browser = self.browser_factory()
+            self._host_state(url)[0].acquire()
+            self._count("browser_renders")
+            self._browser.get(url)
+            try:
+                WebDriverWait(self._browser, BROWSER_WAIT_SECONDS).until(
+                    EC.presence_of_all_elements_located((By.CSS_SELECTOR, SEARCH_RESULT_SELECTOR))
+                )
+            except TimeoutException:
+                return ""
+            return self._browser.page_source
+
+    # --- Processamento de cada tipo de URL ---
+
+    def _parse_sitemap(self, url, body):
+        discovered = []
+        try:
+            root = ET.fromstring(body.encode("utf-8"))
+        except ET.ParseError as e:
+            print(f" !! Sitemap inválido {url}: {e}")
+            return discovered
+        for element in root.iter():
+            if not element.tag.endswith("loc") or not element.text:
+                continue
+            loc = element.text.strip()
+            if root.tag.endswith("sitemapindex"):
+                discovered.append((loc, SITEMAP))
+            elif is_article_url(loc):
+                discovered.append((loc, PAGE))
+        return discovered
+
+    def _article_links(self, url, html, selector="a[href]"):
+        soup = BeautifulSoup(html, "html.parser")
+        links = []
+        for element in soup.select(selector):
+            href = element.get("href")
+            if href:
+                full_url = normalize_url(href, url)
+                if is_article_url(full_url):
+                    links.append((full_url, PAGE))
+        return links
+
+    def _process(self, row):
+        """Executado nas threads do pool: baixa a URL e retorna (ok, URLs descobertas)."""
+        url, kind, _ = row
+        try:
+            if kind == SITEMAP:
+                body = self._get(url)
+                return body is not None, self._parse_sitemap(url, body) if body else []
+
+            if kind == SEARCH:
+                body = self._get(url) or ""
+                links = self._article_links(url, body, SEARCH_RESULT_SELECTOR)
+                if not links and self.browser_factory:
+                    links = self._article_links(url, self._render_with_browser(url), SEARCH_RESULT_SELECTOR)
+                # Só avança na paginação enquanto a busca continuar trazendo resultados
+                if links and search_page_number(url) < self.max_search_pages:
+                    links.append((next_search_page(url), SEARCH))
+                return True, links
+
+            if not self.follow_links:
+                # O artigo é baixado depois, pelo web_fetcher; aqui só interessava a URL
+                return True, []
+            body = self._get(url, use_cache=True)
+            return body is not None, self._article_links(url, body) if body else []
+        except Exception as e:
+            print(f" !! ERRO ao processar {url}: {e}")
+            return False, []
+
+    # --- Execução ---
+
+    def crawl(self, seeds, batch_size=64):
+        """Rastreia a partir de `seeds` [(url, tipo)] e retorna (artigos, rastreamento_completo).
+
+        `rastreamento_completo` é False se o limite de artigos foi atingido ou se houve
+        falhas, situação em que não é seguro concluir que um artigo ausente foi removido.
+        """
+        self._truncated = False
+        self._articles = self._count_articles()
+        if self._pending_count():
+            print(f" -> Retomando rastreamento anterior: {self._pending_count()} URLs pendentes.")
+        else:
+            self._reset()
+            for url, kind in seeds:
+                self._enqueue(url, kind, 0)
+            self._checkpoint()
+
+        started = time.perf_counter()
+        failures = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                rows = self._conn.execute(
+                    f"SELECT url, kind, depth FROM frontier WHERE state = ? "
+                    f"ORDER BY {_KIND_PRIORITY}, depth, rowid LIMIT ?",
+                    (PENDING, batch_size),
+                ).fetchall()
+                if not rows:
+                    break
+                for (url, kind, depth), (ok, discovered) in zip(rows, pool.map(self._process, rows)):
+                    self._conn.execute("UPDATE frontier SET state = ? WHERE url = ?", (DONE if ok else FAILED, url))
+                    failures += 0 if ok or kind == SITEMAP else 1
+                    for new_url, new_kind in discovered:
+                        self._enqueue(new_url, new_kind, depth + 1)
+                # Cada lote é gravado em disco: uma interrupção perde no máximo um lote
+                self._checkpoint()
+                elapsed = time.perf_counter() - started
+                print(f" -> {self._articles} artigos descobertos, {self._pending_count()} URLs pendentes "
+                      f"({self.stats['requests']} requisições em {elapsed:.0f}s)")
+
+        articles = [row[0] for row in self._conn.execute(
+            "SELECT url FROM frontier WHERE kind = ? ORDER BY rowid", (PAGE,))]
+        complete = not self._truncated and failures == 0
+        return articles, complete
+
+    def close(self):
+        if self._browser is not None:
+            self._browser.quit()
+            self._browser = None
+        self._conn.close()
@@ -0,0 +1,139 @@
+import re
+import hashlib
+
+from embedding_scheduler import estimate_tokens
+
+
+# Bits do SimHash e distância de Hamming máxima para dois chunks serem "o mesmo texto"
+SIMHASH_BITS = 64
+MAX_HAMMING_DISTANCE = 3
+# Palavras por shingle; chunks com menos palavras que isso só são comparados por igualdade exata
+SHINGLE_SIZE = 3
+MIN_WORDS = 8
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _words(text):
+    return _WORD_RE.findall(text.lower())
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def simhash(text, bits=SIMHASH_BITS):
+    """SimHash dos shingles de palavras: textos quase iguais diferem em poucos bits."""
+    words = _words(text)
+    shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))]
+    weights = [0] * bits
+    for shingle in shingles:
+        value = _hash64(shingle)
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+
+def exact_key(text):
+    """Chave dos textos iguais a menos de caixa, pontuação e espaços."""
+    return hashlib.sha1(" ".join(_words(text)).encode("utf-8")).hexdigest()
+
+
+class NearDuplicateFilter:
+    """Descarta chunks quase idênticos a outros do mesmo grupo antes do embedding.
+
+    Cada chamada de `filter` compara só os chunks recebidos (um artigo ou um intervalo
+    de páginas de um PDF): a cópia descartada e a mantida pertencem sempre à mesma fonte,
+    então substituir ou remover uma fonte nunca deixa outra sem o seu conteúdo, e o
+    resultado não depende da ordem em que as fontes terminam de ser processadas.
+
+    Limitação: cópias entre fontes diferentes (a mesma página no manual do GeneXus 17 e
+    no do 18, um artigo da wiki repetido em outro) continuam todas no índice; o
+    check_index as conta como duplicados pelo `simhash` gravado.
+
+    Cada chunk recebe um SimHash de 64 bits; o espaço é dividido em `max_distance + 1`
+    faixas e, pelo princípio da casa dos pombos, dois hashes a até `max_distance` bits
+    de distância coincidem em pelo menos uma faixa. Só os candidatos dessas faixas são
+    comparados. O hash fica na metadata (`simhash`) para o relatório do check_index.
+    """
+
+    def __init__(self, max_distance=MAX_HAMMING_DISTANCE, bits=SIMHASH_BITS):
+        self.max_distance = max_distance
+        self.bits = bits
+        self.band_count = max_distance + 1
+        self.band_bits = bits // self.band_count
+        self.clear()
+        self.chunks = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.tokens_saved = 0
+
+    def clear(self):
+        """Esquece os textos vistos (as estatísticas continuam acumuladas)."""
+        self._bands = [{} for _ in range(self.band_count)]
+        self._exact = set()
+
+    def _band_keys(self, value):
+        mask = (1 << self.band_bits) - 1
+        return [(value >> (band * self.band_bits)) & mask for band in range(self.band_count)]
+
+    def find(self, value):
+        """Um SimHash já conhecido a até `max_distance` bits de `value` (ou None)."""
+        for band, key in zip(self._bands, self._band_keys(value)):
+            for other in band.get(key, ()):
+                if bin(value ^ other).count("1") <= self.max_distance:
+                    return other
+        return None
+
+    def add(self, text, value=None):
+        """Registra um texto (ou, com `text` None, só o seu SimHash) como já visto."""
+        if text is not None:
+            self._exact.add(exact_key(text))
+        if value is not None:
+            for band, key in zip(self._bands, self._band_keys(value)):
+                band.setdefault(key, []).append(value)
+
+    def is_duplicate(self, text):
+        """Retorna (duplicado, simhash); o texto não duplicado passa a ser conhecido pelo filtro."""
+        key = exact_key(text)
+        if key in self._exact:
+            self.exact_duplicates += 1
+            return True, None
+        value = simhash(text, self.bits) if len(_words(text)) >= MIN_WORDS else None
+        if value is not None and self.find(value) is not None:
+            self.near_duplicates += 1
+            return True, value
+        self.add(text, value)
+        return False, value
+
+    def filter(self, chunks):
+        """Mantém só os chunks inéditos dentro de `chunks`, na ordem original, com o `simhash` na metadata."""
+        self.clear()
+        kept = []
+        for chunk in chunks:
+            self.chunks += 1
+            duplicate, value = self.is_duplicate(chunk.page_content)
+            if duplicate:
+                self.tokens_saved += estimate_tokens(chunk.page_content)
+                continue
+            if value is not None:
+                chunk.metadata["simhash"] = format(value, "016x")
+            kept.append(chunk)
+        return kept
+
+    def report(self):
+        duplicates = self.exact_duplicates + self.near_duplicates
+        return {
+            "chunks": self.chunks,
+            "duplicates": duplicates,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+            "tokens_saved": self.tokens_saved,
+            "ratio": (duplicates / self.chunks) if self.chunks else 0.0,
+        }
+
+    def summary(self):
+        report = self.report()
+        return (f"{report['duplicates']} de {report['chunks']} chunks descartados como duplicados "
+                f"({report['exact_duplicates']} idênticos, {report['near_duplicates']} quase idênticos, "
+                f"{report['ratio']:.1%}); ~{report['tokens_saved']} tokens de embedding economizados")
@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+
+# Local padrão do cache persistente de embeddings (compartilhado pelos scripts de ingestão)
+DEFAULT_CACHE_PATH = "./.cache/embeddings.sqlite"
+# Limite de vetores mantidos em disco antes de começar a despejar os menos usados
+DEFAULT_MAX_ENTRIES = 200_000
+# O SQLite limita a quantidade de parâmetros por consulta
+_SQLITE_BATCH = 500
+
+
+def normalize_text(text):
+    """Normaliza o texto do chunk para que variações triviais gerem a mesma chave."""
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+def cache_key(model_name, text):
+    """Chave endereçada por conteúdo: hash de (modelo, texto normalizado)."""
+    payload = f"{model_name}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Envolve um objeto de embeddings e guarda os vetores dos documentos em um SQLite local.
+
+    Funciona com qualquer backend que implemente `embed_documents`/`embed_query`
+    (GoogleGenerativeAIEmbeddings ou um backend falso para testes offline).
+    Apenas `embed_documents` é cacheado: as consultas usam outro tipo de tarefa
+    no modelo do Google e são sempre repassadas ao backend.
+    """
+
+    def __init__(self, embeddings, model_name, cache_path=DEFAULT_CACHE_PATH,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        # A conexão é compartilhada entre threads do pipeline; o lock serializa o acesso
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+        # `last_used` é um contador crescente, não o relógio: a ordem do LRU não depende da
+        # resolução de time.time() nem de ajustes do relógio do sistema
+        self._clock = self._conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM embeddings").fetchone()[0]
+
+    # --- Interface de Embeddings (LangChain) ---
+
+    def embed_documents(self, texts):
+        """Retorna os vetores dos textos, chamando o backend só para os que faltam no cache."""
+        texts = list(texts)
+        if not texts:
+            return []
+
+        keys = [cache_key(self.model_name, text) for text in texts]
+        found = self._lookup(set(keys))
+
+        # Textos repetidos no mesmo lote são enviados ao backend uma única vez
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        hits = sum(1 for key in keys if key in found)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        if missing:
+            missing_keys = list(missing)
+            vectors = self.embeddings.embed_documents([missing[k] for k in missing_keys])
+            new_entries = dict(zip(missing_keys, vectors))
+            self._store(new_entries)
+            found.update(new_entries)
+
+        return [list(found[key]) for key in keys]
+
+    def embed_query(self, text):
+        """Consultas não são cacheadas (tipo de tarefa diferente no modelo)."""
+        return self.embeddings.embed_query(text)
+
+    # --- Estatísticas ---
+
+    def stats(self):
+        """Contadores de acerto/falha e tamanho atual do cache."""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / total) if total else 0.0,
+            "evictions": self.evictions,
+            "entries": size,
+            "max_entries": self.max_entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Armazenamento ---
+
+    def _tick(self):
+        """Próximo valor de `last_used` (chamado com o lock)."""
+        self._clock += 1
+        return self._clock
+
+    def _lookup(self, keys):
+        """Busca as chaves no SQLite e atualiza o `last_used` das encontradas (LRU)."""
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            now = self._tick()
+            for start in range(0, len(keys), _SQLITE_BATCH):
+                batch = keys[start:start + _SQLITE_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows],
+                    )
+            self._conn.commit()
+        return found
+
+    def _store(self, entries):
+        """Grava os vetores novos e despeja os menos usados se passar do limite."""
+        with self._lock:
+            now = self._tick()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in entries.items()],
+            )
+            size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            excess = size - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+            self._conn.commit()
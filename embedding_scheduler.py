@@ -0,0 +1,189 @@
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from langchain_core.embeddings import Embeddings
+
+from rate_limit import TokenBucket, is_retryable, retry_with_backoff
+
+
+# Cota do text-embedding-004 no plano pago (ajuste conforme o projeto no Google AI Studio)
+EMBED_REQUESTS_PER_MINUTE = 1500
+EMBED_TOKENS_PER_MINUTE = 1_000_000
+# O batchEmbedContents aceita no máximo 100 textos por requisição
+MAX_BATCH_TEXTS = 100
+MAX_BATCH_TOKENS = 20_000
+MIN_BATCH_TEXTS = 8
+DEFAULT_WORKERS = 4
+# Lotes mais lentos que isso encolhem; bem mais rápidos crescem de novo
+TARGET_BATCH_SECONDS = 2.0
+# Estimativa grosseira de tokens (sem chamar o tokenizador do modelo)
+_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+
+class BatchedEmbeddings(Embeddings):
+    """Agenda as chamadas de `embed_documents` em lotes paralelos dentro da cota.
+
+    Os textos são agrupados em lotes limitados por quantidade e por tokens estimados,
+    e até `workers` lotes são enviados ao mesmo tempo, sempre passando pelos token
+    buckets de requisições e de tokens por minuto. Em caso de throttling (429) a
+    concorrência cai pela metade e a taxa é reduzida; a cada sequência de sucessos
+    ela volta a subir aos poucos (AIMD). O tamanho do lote acompanha a latência
+    observada. Fica por baixo do CachedEmbeddings: só os textos fora do cache chegam aqui.
+    """
+
+    def __init__(self, embeddings, workers=DEFAULT_WORKERS,
+                 requests_per_minute=EMBED_REQUESTS_PER_MINUTE, tokens_per_minute=EMBED_TOKENS_PER_MINUTE,
+                 max_batch_texts=MAX_BATCH_TEXTS, max_batch_tokens=MAX_BATCH_TOKENS,
+                 target_batch_seconds=TARGET_BATCH_SECONDS, retries=6, base_delay=1.0, max_delay=60.0):
+        self.embeddings = embeddings
+        self.workers = workers
+        self.max_batch_texts = max_batch_texts
+        self.max_batch_tokens = max_batch_tokens
+        self.target_batch_seconds = target_batch_seconds
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._request_rate = requests_per_minute / 60.0
+        self._token_rate = tokens_per_minute / 60.0
+        self._requests = TokenBucket(self._request_rate, capacity=max(1, workers))
+        self._tokens = TokenBucket(self._token_rate, capacity=max(max_batch_tokens, self._token_rate))
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embeddings")
+        self._lock = threading.Lock()
+
+        # Estado adaptativo
+        self.concurrency = workers
+        self.batch_size = max_batch_texts
+        self._rate_factor = 1.0
+        self._successes = 0
+
+        # Estatísticas
+        self.chunks = 0
+        self.batches = 0
+        self.requests = 0
+        self.throttle_events = 0
+        self.seconds = 0.0
+
+    # --- Interface de Embeddings (LangChain) ---
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        start = time.perf_counter()
+        results = [None] * len(texts)
+        pending = deque(range(len(texts)))
+        in_flight = {}
+        try:
+            while pending or in_flight:
+                # O tamanho do lote e a concorrência são relidos a cada rodada (podem ter mudado)
+                while pending and len(in_flight) < self.concurrency:
+                    batch = self._next_batch(pending, texts)
+                    future = self._pool.submit(self._embed_batch, [texts[i] for i in batch])
+                    in_flight[future] = batch
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = in_flight.pop(future)
+                    for index, vector in zip(batch, future.result()):
+                        results[index] = vector
+        finally:
+            for future in in_flight:
+                future.cancel()
+            with self._lock:
+                self.seconds += time.perf_counter() - start
+        return results
+
+    def embed_query(self, text):
+        def call():
+            self._requests.acquire()
+            return self.embeddings.embed_query(text)
+        return retry_with_backoff(call, self.retries, self.base_delay, self.max_delay)
+
+    # --- Agendamento ---
+
+    def _next_batch(self, pending, texts):
+        """Retira da fila o próximo lote respeitando o limite de textos e de tokens."""
+        batch, tokens = [], 0
+        while pending and len(batch) < self.batch_size:
+            cost = estimate_tokens(texts[pending[0]])
+            if batch and tokens + cost > self.max_batch_tokens:
+                break
+            batch.append(pending.popleft())
+            tokens += cost
+        return batch
+
+    def _embed_batch(self, batch_texts):
+        tokens = sum(estimate_tokens(text) for text in batch_texts)
+        for attempt in range(self.retries + 1):
+            self._requests.acquire()
+            self._tokens.acquire(tokens)
+            with self._lock:
+                self.requests += 1
+            t0 = time.perf_counter()
+            try:
+                vectors = self.embeddings.embed_documents(batch_texts)
+            except Exception as e:
+                if attempt >= self.retries or not is_retryable(e):
+                    raise
+                self._on_throttle()
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                continue
+            self._on_success(len(batch_texts), time.perf_counter() - t0)
+            return vectors
+
+    def _on_throttle(self):
+        """Diminuição multiplicativa: metade da concorrência e 80% da taxa."""
+        with self._lock:
+            self.throttle_events += 1
+            self._successes = 0
+            self.concurrency = max(1, self.concurrency // 2)
+            self._rate_factor = max(0.05, self._rate_factor * 0.8)
+            self._apply_rate()
+
+    def _on_success(self, count, seconds):
+        """Aumento aditivo da concorrência/taxa e ajuste do lote pela latência."""
+        with self._lock:
+            self.chunks += count
+            self.batches += 1
+            self._successes += 1
+            if self._successes >= self.workers:
+                self._successes = 0
+                self.concurrency = min(self.workers, self.concurrency + 1)
+                if self._rate_factor < 1.0:
+                    self._rate_factor = min(1.0, self._rate_factor * 1.1)
+                    self._apply_rate()
+            if seconds > self.target_batch_seconds:
+                self.batch_size = max(MIN_BATCH_TEXTS, int(self.batch_size * 0.75))
+            elif seconds < self.target_batch_seconds / 2:
+                self.batch_size = min(self.max_batch_texts, self.batch_size + max(1, self.batch_size // 10))
+
+    def _apply_rate(self):
+        self._requests.set_rate(self._request_rate * self._rate_factor)
+        self._tokens.set_rate(self._token_rate * self._rate_factor)
+
+    # --- Estatísticas ---
+
+    def stats(self):
+        """Vazão (chunks/s no tempo de parede das chamadas), throttling e estado adaptativo."""
+        return {
+            "chunks": self.chunks,
+            "batches": self.batches,
+            "requests": self.requests,
+            "throttle_events": self.throttle_events,
+            "seconds": self.seconds,
+            "chunks_per_second": (self.chunks / self.seconds) if self.seconds else 0.0,
+            "concurrency": self.concurrency,
+            "batch_size": self.batch_size,
+            "rate_factor": self._rate_factor,
+        }
+
+    def close(self):
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,174 @@
+import json
+import time
+import hashlib
+import threading
+import http.server
+
+import numpy as np
+import requests
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from lexical_index import tokenize
+from rate_limit import TokenBucket
+
+
+# Substitutos locais e determinísticos do Gemini para benchmarks e testes sem rede
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings por hashing de palavras: textos com vocabulário parecido ficam próximos.
+
+    Determinístico entre execuções (não usa o `hash()` do Python) e com latência
+    configurável por chamada (`latency`) e por texto (`per_text_latency`), para simular
+    o tempo de rede do GoogleGenerativeAIEmbeddings.
+    """
+
+    def __init__(self, dimension=256, latency=0.0, per_text_latency=0.0):
+        self.dimension = dimension
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.calls = 0
+        self.texts = 0
+        self._buckets = {}
+
+    def _bucket(self, token):
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            bucket = self._buckets[token] = (value % self.dimension, 1.0 if value >> 63 else -1.0)
+        return bucket
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in tokenize(text):
+            index, sign = self._bucket(token)
+            vector[index] += sign
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def _wait(self, count):
+        self.calls += 1
+        self.texts += count
+        delay = self.latency + self.per_text_latency * count
+        if delay:
+            time.sleep(delay)
+
+    def embed_documents(self, texts):
+        self._wait(len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self._wait(1)
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model que responde um texto fixo, com latência de primeiro token e por token.
+
+    Suporta `invoke` e `stream`, como o ChatGoogleGenerativeAI na cadeia RAG.
+    """
+
+    first_token_latency: float = 0.2
+    token_latency: float = 0.01
+    response_tokens: int = 64
+
+    @property
+    def _llm_type(self):
+        return "fake-genexus-chat"
+
+    def _tokens(self, messages):
+        question = messages[-1].content if messages else ""
+        words = ["Resposta", "simulada", "com", "base", "no", "contexto", "recuperado:"]
+        words += question.split()[-8:]
+        while len(words) < self.response_tokens:
+            words.extend(["For", "Each", "Customer", "Where", "&CustomerId", "EndFor"])
+        return [word + " " for word in words[:self.response_tokens]]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens(messages)
+        time.sleep(self.first_token_latency + self.token_latency * max(len(tokens) - 1, 0))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for i, token in enumerate(self._tokens(messages)):
+            time.sleep(self.first_token_latency if i == 0 else self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeRateLimitError(Exception):
+    """Erro HTTP do endpoint falso; `status_code` permite ao `is_retryable` reconhecer o 429."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def serve_fake_embeddings(requests_per_second=10.0, tokens_per_second=None, latency=0.05,
+                          per_text_latency=0.0, dimension=256):
+    """Endpoint local de embeddings (POST {"texts": [...]}) que responde 429 acima da cota.
+
+    Retorna (server, url, stats); `stats` conta requisições atendidas e recusadas.
+    Encerre com `server.shutdown()`.
+    """
+    embeddings = FakeEmbeddings(dimension)
+    request_bucket = TokenBucket(requests_per_second)
+    token_bucket = TokenBucket(tokens_per_second) if tokens_per_second else None
+    stats = {"requests": 0, "throttled": 0, "texts": 0}
+    stats_lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            texts = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))["texts"]
+            tokens = sum(len(text) // 4 + 1 for text in texts)
+            allowed = request_bucket.try_acquire() and (token_bucket is None or token_bucket.try_acquire(tokens))
+            with stats_lock:
+                stats["requests" if allowed else "throttled"] += 1
+                stats["texts"] += len(texts) if allowed else 0
+            if not allowed:
+                self._reply(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}})
+                return
+            time.sleep(latency + per_text_latency * len(texts))
+            self._reply(200, {"embeddings": [embeddings._embed(text) for text in texts]})
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/embed", stats
+
+
+class RemoteFakeEmbeddings(Embeddings):
+    """Cliente do `serve_fake_embeddings`: faz uma requisição HTTP por chamada, como o Gemini."""
+
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+
+    def embed_documents(self, texts):
+        response = requests.post(self.url, json={"texts": list(texts)}, timeout=self.timeout)
+        if response.status_code != 200:
+            raise FakeRateLimitError(response.text, response.status_code)
+        return response.json()["embeddings"]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
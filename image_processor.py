@@ -1,9 +1,16 @@
 import os
+import sys
 from dotenv import load_dotenv
 from google import genai
 from PIL import Image
 from io import BytesIO
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pdf2image import convert_from_path
+from rate_limit import TokenBucket, retry_with_backoff
+from vision_cache import VisionDescriptionCache
+from page_triage import iter_page_triage
+from tracing import tracer
 
 # Certifique-se de que load_dotenv("keys.env") está correto
 load_dotenv("keys.env") 
@@ -15,8 +22,21 @@ if not API_KEY:
 # Inicializa o cliente Gemini
 gemini_client = genai.Client(api_key=API_KEY)
 
-def describe_image_with_gemini(image_path_or_bytes):
-    """Envia uma imagem para o Gemini Vision para gerar uma descrição detalhada."""
+# Limite de requisições ao modelo de visão (ajuste conforme a cota do seu projeto)
+REQUESTS_PER_MINUTE = 60
+# Quantas descrições podem estar em andamento ao mesmo tempo
+DESCRIBE_WORKERS = 8
+
+VISION_MODEL = 'gemini-2.5-flash'
+# Descrições já geradas para páginas iguais ou quase iguais (hash perceptual) são reaproveitadas
+vision_cache = VisionDescriptionCache()
+
+def describe_image_with_gemini(image_path_or_bytes, limiter=None):
+    """Envia uma imagem para o Gemini Vision para gerar uma descrição detalhada.
+
+    Consulta antes o cache de descrições; o `limiter` (token bucket) só é consumido
+    quando a chamada à API é realmente necessária.
+    """
     
     # Prompt de engenharia para obter uma descrição técnica e útil para RAG
     prompt = (
@@ -30,57 +50,133 @@ def describe_image_with_gemini(image_path_or_bytes):
         img = Image.open(image_path_or_bytes)
     else:
         img = Image.open(image_path_or_bytes)
-        
-    try:
+
+    with tracer.span("vision_describe") as span:
+        cached = vision_cache.get(img, prompt, VISION_MODEL)
+        span.set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+        return _describe_uncached(img, prompt, limiter)
+
+
+def _describe_uncached(img, prompt, limiter):
+    def call():
+        # Cada tentativa (inclusive as repetições após um 429) passa pelo limite de taxa
+        if limiter:
+            limiter.acquire()
         # Usamos o modelo Pro Vision para descrição
-        response = gemini_client.models.generate_content(
-            model='gemini-2.5-flash', # Gemini-2.5-Flash é multimodal e mais rápido
+        return gemini_client.models.generate_content(
+            model=VISION_MODEL, # Gemini-2.5-Flash é multimodal e mais rápido
             contents=[prompt, img]
         )
+
+    try:
+        # Erros transitórios (429, 503, timeouts) são repetidos com recuo exponencial
+        response = retry_with_backoff(call)
+        # Só descrições bem-sucedidas entram no cache
+        vision_cache.put(img, prompt, VISION_MODEL, response.text)
         return response.text
     except Exception as e:
         print(f"Erro ao descrever imagem com Gemini: {e}")
         return "[IMAGEM NÃO DESCRITA DEVIDO A ERRO]"
 
 
-def extract_and_describe_from_pdf(pdf_path, output_dir="./processed_text"):
-    """Simula a extração de texto e a descrição das imagens para enriquecimento."""
+def _text_section(page_number, text):
+    return f"\n\n--- INÍCIO DO TEXTO PÁGINA {page_number} ---\n{text.strip()}\n--- FIM DO TEXTO ---\n\n"
+
+
+def _page_section(page_number, description):
+    return f"\n\n--- INÍCIO DO CONTEÚDO VISUAL PÁGINA {page_number} ---\n{description}\n--- FIM DO CONTEÚDO VISUAL ---\n\n"
+
+
+def _describe_page(limiter, image_bytes):
+    """Executado no pool: respeita o limite de taxa antes de chamar o Gemini."""
+    return describe_image_with_gemini(BytesIO(image_bytes), limiter=limiter)
+
+
+def extract_and_describe_from_pdf(pdf_path, output_dir="./processed_text",
+                                  workers=DESCRIBE_WORKERS, requests_per_minute=REQUESTS_PER_MINUTE):
+    """Extrai o texto nativo das páginas e descreve as imagens para enriquecimento.
+
+    Cada página é classificada pela camada de texto e pela cobertura de imagens e
+    desenhos: páginas só de texto entram direto no resultado e apenas as páginas com
+    figuras, diagramas ou conteúdo escaneado são rasterizadas e descritas pelo Gemini,
+    em paralelo e sob um limite de requisições por minuto. As seções são gravadas no
+    arquivo em ordem de página, à medida que ficam prontas.
+    """
     
     print(f"Processando {pdf_path}...")
-    
-    # Esta é uma simplificação. A extração real em um PDF complexo é difícil.
-    # Aqui, convertemos cada página em uma imagem e descrevemos essa imagem.
-    
-    pages = convert_from_path(pdf_path)
-    enriched_text = ""
-    
-    for i, page_image in enumerate(pages):
-        # 1. Obter o texto da página (simulação/melhoria necessária para texto real)
-        # O método ideal aqui seria usar uma biblioteca OCR avançada para obter o layout
-        # Mas para o protótipo, focamos apenas na descrição visual.
-        
-        # 2. Descrever a Imagem da Página inteira (lenta, mas eficaz)
-        with BytesIO() as output:
-            page_image.save(output, format="PNG")
-            image_bytes = output.getvalue()
-        
-        # Envia a página (como imagem) para o Gemini
-        description = describe_image_with_gemini(BytesIO(image_bytes))
-        
-        # 3. Adiciona a descrição ao texto enriquecido
-        enriched_text += f"\n\n--- INÍCIO DO CONTEÚDO VISUAL PÁGINA {i+1} ---\n{description}\n--- FIM DO CONTEÚDO VISUAL ---\n\n"
-        
-        # Em um cenário real, você adicionaria o texto extraído por OCR aqui
-        # enriched_text += text_extractor.extract(pdf_path, page=i)
 
-    # Salva o texto enriquecido (com descrições) em um arquivo .txt
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-        
     output_filename = os.path.join(output_dir, os.path.basename(pdf_path).replace(".pdf", "_enriched.txt"))
-    with open(output_filename, 'w', encoding='utf-8') as f:
-        f.write(enriched_text)
+
+    limiter = TokenBucket(requests_per_minute / 60.0, capacity=workers)
+    # Páginas retidas em memória (rasterizadas aguardando descrição ou prontas fora de ordem,
+    # esperando uma página anterior): o resto do PDF ainda não foi analisado
+    max_in_flight = workers * 2
+    pending = {}
+    finished = {}
+    next_to_write = 1
+    counts = {"texto": 0, "visual": 0}
+
+    # Com o rastreamento ligado, o PDF vira um trace com as etapas de rasterização e descrição
+    with tracer.span("vision_pdf", pdf=os.path.basename(pdf_path)) as pdf_span:
+        with open(output_filename, 'w', encoding='utf-8') as f, ThreadPoolExecutor(max_workers=workers) as pool:
+
+            def drain(block_until):
+                """Grava as seções que já estão na ordem e espera descrições até restarem no
+                máximo `block_until` páginas retidas (em andamento + prontas fora de ordem)."""
+                nonlocal next_to_write
+                while True:
+                    while next_to_write in finished:
+                        f.write(finished.pop(next_to_write))
+                        f.flush()
+                        next_to_write += 1
+                    # Sem descrições em andamento, tudo o que estava pronto já foi gravado
+                    if not pending or len(pending) + len(finished) <= block_until:
+                        return
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        page = pending.pop(future)
+                        section = _page_section(page["page"], future.result())
+                        # O texto nativo da página (se houver) acompanha a descrição visual
+                        if page["text_chars"]:
+                            section = _text_section(page["page"], page["text"]) + section
+                        finished[page["page"]] = section
+
+            # 1. Triagem barata de cada página pela camada de texto e pelo content stream do PDF
+            for page in iter_page_triage(pdf_path):
+                if not page["needs_vision"]:
+                    counts["texto"] += 1
+                    finished[page["page"]] = _text_section(page["page"], page["text"])
+                else:
+                    counts["visual"] += 1
+                    # 2. Rasteriza só a página que realmente tem conteúdo visual
+                    with tracer.span("rasterize", pages=1):
+                        page_image = convert_from_path(pdf_path, first_page=page["page"], last_page=page["page"])[0]
+                        with BytesIO() as output:
+                            page_image.save(output, format="PNG")
+                            image_bytes = output.getvalue()
+                        page_image.close()
+
+                    # 3. Envia a página (como imagem) para o Gemini, sem esperar a resposta
+                    # (no contexto atual, para a descrição entrar no mesmo trace)
+                    pending[pool.submit(contextvars.copy_context().run, _describe_page, limiter, image_bytes)] = page
+
+                # 4. Backpressure: uma página visual lenta segura no máximo `max_in_flight` páginas
+                # seguintes (de texto ou já descritas) antes de a triagem continuar
+                drain(block_until=max_in_flight - 1)
+                if page["page"] % 25 == 0:
+                    print(f" -> {page['page']} páginas analisadas, {next_to_write - 1} gravadas")
+
+            drain(block_until=0)
+        pdf_span.set(pages=counts["texto"] + counts["visual"], visual_pages=counts["visual"])
         
+    print(f"Triagem: {counts['texto']} páginas de texto, {counts['visual']} páginas visuais enviadas ao modelo de visão")
+    stats = vision_cache.stats()
+    print(f"Cache de descrições: {stats['hits']} acertos exatos, {stats['near_hits']} quase-duplicatas, "
+          f"{stats['misses']} chamadas ao Gemini ({stats['hit_rate']:.0%} de acerto)")
     print(f"Conteúdo enriquecido salvo em: {output_filename}")
     return output_filename
 
@@ -91,6 +187,9 @@ if __name__ == "__main__":
     
     # Você precisará trocar 'seu_manual_genexus.pdf' por um arquivo real
     if os.path.exists(pdf_to_process):
+        if "--trace" in sys.argv:
+            tracer.enable()
         extract_and_describe_from_pdf(pdf_to_process)
+        tracer.write_prometheus()
     else:
         print("Caminho do PDF de teste não encontrado. Crie um PDF ou ajuste o caminho.")
\ No newline at end of file
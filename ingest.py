@@ -1,61 +1,175 @@
 import os
+import sys
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.vectorstores import Chroma
+from embedding_cache import CachedEmbeddings
+from embedding_scheduler import BatchedEmbeddings
+from manifest import SourceManifest, hash_file, purge_missing_sources
+from pdf_pipeline import run_pdf_pipeline
+from chunker import STRUCTURE, SPLITTER_VERSIONS
+from partitions import PARTITIONS_DIRNAME, build_partitions, detect_pdf_version, drop_global_indexes
+from snapshots import INDEX_ROOT, StagingSnapshot, close_vectorstore
+from ingest_journal import IngestJournal
+from dedup import NearDuplicateFilter
+from tracing import tracer
 
 
 # Carrega a API Key do arquivo .env
 load_dotenv("keys.env")
 
-def run_ingestion():
-    # 1. Carregar Documentos
-    print("Carregando documentos...")
+def run_ingestion(resume=False):
+    # Com o rastreamento ligado, a execução inteira vira um trace (traces/traces.jsonl)
+    with tracer.trace("ingest", kind="pdf", resume=resume):
+        _run_ingestion(resume)
+    tracer.write_prometheus()
+
+
+def _run_ingestion(resume):
+    # 1. Identificar Documentos (sem carregá-los ainda)
+    print("Verificando documentos...")
     docs_path = "./docs"
-    documents = []
-    
-    # Percorre todos os PDFs na pasta 'docs'
-    for filename in os.listdir(docs_path):
-        if filename.endswith(".pdf"):
-            loader = PyPDFLoader(os.path.join(docs_path, filename))
-            documents.extend(loader.load())
-            
-    if not documents:
+    # A ingestão trabalha em uma cópia do índice publicado, criada só depois que as
+    # alterações são detectadas: o app continua respondendo com o snapshot atual e só
+    # passa para o novo quando ele é publicado, no fim
+    staging = StagingSnapshot.begin(INDEX_ROOT, "pdf", resume)
+    manifest = SourceManifest.load(staging.read_path)
+
+    # Journal de progresso: com resume=True, os PDFs já gravados por uma execução
+    # interrompida voltam ao manifesto e não são processados de novo
+    journal = IngestJournal.open(staging.path, "pdf", resume)
+    replayed = journal.replay(manifest, "pdf") if resume else 0
+    if replayed:
+        print(f"Retomando a execução anterior: {replayed} PDFs já estavam gravados no ChromaDB.")
+
+    # Percorre todos os PDFs na pasta 'docs' e calcula o hash de cada arquivo (com a versão
+    # do splitter: uma segmentação nova re-segmenta também os PDFs que não mudaram)
+    pdf_hashes = {}
+    with tracer.span("hash_sources") as span:
+        for filename in os.listdir(docs_path):
+            if filename.endswith(".pdf"):
+                pdf_path = os.path.join(docs_path, filename)
+                pdf_hashes[pdf_path] = hash_file(pdf_path, version=SPLITTER_VERSIONS[STRUCTURE])
+        span.set(documents=len(pdf_hashes))
+
+    if not pdf_hashes:
         print("Nenhum PDF encontrado na pasta 'docs'. Abortando.")
+        journal.finish()
+        staging.discard()
         return
 
-    # 2. Segmentação (Chunking) - Ajuste o chunk_size e chunk_overlap conforme a necessidade
-    print(f"Segmentando {len(documents)} páginas em chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200, 
-        length_function=len
-    )
-    chunks = text_splitter.split_documents(documents)
-    print(f"Total de chunks criados: {len(chunks)}")
+    # Só os PDFs novos ou alterados desde a última ingestão serão carregados e vetorizados
+    changed = {path: h for path, h in pdf_hashes.items() if not manifest.is_unchanged(path, h)}
+    removed = manifest.sources_of_kind("pdf") - set(pdf_hashes)
+    print(f"{len(pdf_hashes)} PDFs encontrados: {len(changed)} novos/alterados, "
+          f"{len(pdf_hashes) - len(changed)} inalterados, {len(removed)} removidos.")
+
+    if not changed and not removed and not replayed:
+        print("Nenhuma alteração desde a última ingestão. Nada a fazer.")
+        journal.finish()
+        missing_partitions = not os.path.exists(os.path.join(staging.read_path, PARTITIONS_DIRNAME))
+        if missing_partitions:
+            # Base criada antes das partições: marca os chunks e monta as partições de busca
+            # (com os índices BM25), sem tocar nos embeddings
+            persist_directory = staging.prepare()
+            vectorstore = Chroma(persist_directory=persist_directory)
+            build_partitions(vectorstore, persist_directory, index_version=manifest.version)
+            drop_global_indexes(persist_directory)
+            close_vectorstore(vectorstore)
+        # A cópia só vira snapshot se algo mudou nela (partições novas ou uma execução retomada)
+        if missing_partitions or staging.resumed:
+            staging.publish(manifest.version)
+        else:
+            staging.discard()
+        return
 
-    # 3. Criação de Embeddings e Indexação
-    print("Criando embeddings com o GoogleGenerativeAI e indexando no ChromaDB...")
-    
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise ValueError("A chave GEMINI_API_KEY não foi carregada. Verifique seu arquivo keys.env.")
-    
+
+    # Há o que gravar: só agora a cópia de trabalho é criada, a partir do snapshot publicado
+    # neste momento. O manifesto é relido dela (outra ingestão pode ter publicado no meio).
+    persist_directory = staging.prepare()
+    manifest = SourceManifest.load(persist_directory)
+    if resume:
+        journal.replay(manifest, "pdf")
+    changed = {path: h for path, h in pdf_hashes.items() if not manifest.is_unchanged(path, h)}
+
     # Modelo robusto para criação de vetores de texto
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model="text-embedding-004",
-        google_api_key=api_key
-        ) 
-    
-    # Cria o Vector Store e armazena os vetores localmente
-    vectorstore = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory="./chroma_db" 
+    # O cache evita reenviar ao Gemini chunks que já foram vetorizados em execuções anteriores;
+    # os que faltam vão em lotes paralelos dentro da cota, com recuo em caso de 429
+    scheduler = BatchedEmbeddings(
+        GoogleGenerativeAIEmbeddings(
+            model="text-embedding-004",
+            google_api_key=api_key
+        )
     )
+    embeddings = CachedEmbeddings(scheduler, model_name="text-embedding-004")
+
+    # Abre (ou cria) o Vector Store local em vez de reconstruí-lo do zero
+    vectorstore = Chroma(
+        persist_directory=persist_directory,
+        embedding_function=embeddings
+    )
+
+    # Chunks repetidos dentro de um mesmo intervalo de páginas (cabeçalhos, avisos,
+    # trechos copiados) são vetorizados uma vez só
+    dedup = NearDuplicateFilter()
+
+    # 2 e 3. Segmentação (Chunking) e Criação de Embeddings em um pipeline de streaming:
+    # os PDFs são lidos e segmentados em paralelo e os chunks seguem em lotes limitados
+    # para os embeddings e para o ChromaDB, sem acumular o corpus inteiro na memória.
+    # A segmentação segue a estrutura do texto (títulos, código, tabelas, listas), sem sobreposição.
+    # Cada manual vai para a partição da sua versão do GeneXus (nome do arquivo ou capa)
+    versions = {pdf_path: detect_pdf_version(pdf_path) for pdf_path in changed}
+    print("Criando embeddings com o GoogleGenerativeAI e indexando no ChromaDB...")
+    with tracer.span("pdf_pipeline", documents=len(changed)) as span:
+        result = run_pdf_pipeline(
+            changed,
+            vectorstore,
+            manifest,
+            embeddings,
+            splitter=STRUCTURE,
+            journal=journal,
+            dedup=dedup,
+            versions=versions
+        )
+        span.set(pages=result["pages"])
+    total_chunks = result["chunks"]
+
+    with tracer.span("purge"):
+        purged = purge_missing_sources(vectorstore, manifest, "pdf", pdf_hashes)
+    for pdf_path in purged:
+        print(f" -> Removido do índice: {pdf_path}")
+
+    manifest.bump_version()
+    manifest.save()
     vectorstore.persist()
-    print("Ingestão concluída. Banco de dados vetorial salvo em ./chroma_db")
+    # Manifesto salvo: o journal da execução não é mais necessário
+    journal.finish()
+    # Uma exportação memory-mapped + BM25 por versão/tipo de fonte: a busca só abre as
+    # partições da pergunta. Só as partições dos PDFs gravados ou removidos são refeitas
+    # (as demais entram por hardlinks); uma execução retomada refaz todas.
+    resumed = replayed or staging.resumed
+    with tracer.span("partitions"):
+        build_partitions(vectorstore, persist_directory, index_version=manifest.version,
+                         changed_sources=None if resumed else set(changed) | set(purged))
+    # O BM25 e a exportação globais não são lidos com as partições: não ficam no snapshot
+    drop_global_indexes(persist_directory)
+    # Troca atômica do ponteiro CURRENT: o app carrega o snapshot novo sem reiniciar
+    close_vectorstore(vectorstore)
+    snapshot = staging.publish(manifest.version)
+    print(f"Total de chunks criados: {total_chunks}")
+    print(f"Duplicados: {dedup.summary()}")
+    stats = embeddings.stats()
+    print(f"Cache de embeddings: {stats['hits']} acertos, {stats['misses']} chamadas ao modelo "
+          f"({stats['entries']} vetores em cache)")
+    stats = scheduler.stats()
+    print(f"Agendador de embeddings: {stats['chunks']} chunks em {stats['batches']} lotes "
+          f"({stats['chunks_per_second']:.1f} chunks/s), {stats['throttle_events']} eventos de throttling")
+    print(f"Ingestão concluída. Banco de dados vetorial publicado em {INDEX_ROOT} (snapshot {snapshot})")
 
 if __name__ == "__main__":
-    run_ingestion()
+    if "--trace" in sys.argv:
+        tracer.enable()
+    run_ingestion(resume="--resume" in sys.argv)
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import threading
+
+
+# Um journal por tipo de ingestão (PDF e Web rodam em scripts separados)
+JOURNAL_FILENAME = "ingest_journal_{kind}.jsonl"
+# A cada quantas fontes gravadas o manifesto é salvo (checkpoint)
+CHECKPOINT_EVERY = 25
+
+
+class IngestJournal:
+    """Journal write-ahead (JSONL) do progresso de uma ingestão.
+
+    Cada evento (fontes baixadas, chunks gerados, lotes vetorizados, IDs gravados no
+    Chroma) é anexado e sincronizado no disco antes de seguir. Se o processo morrer,
+    `run_ingestion(resume=True)` reaplica no manifesto as fontes já gravadas e continua
+    dali: os IDs determinísticos garantem que nada é duplicado ao refazer o resto.
+    """
+
+    def __init__(self, path, events=None):
+        self.path = path
+        self.events = events or []
+        self._since_checkpoint = 0
+        # Os estágios do pipeline de PDFs registram eventos de threads diferentes
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    @classmethod
+    def open(cls, persist_directory, kind, resume=False):
+        """Abre o journal; sem `resume` o conteúdo de uma execução anterior é descartado."""
+        if not os.path.exists(persist_directory):
+            os.makedirs(persist_directory)
+        path = os.path.join(persist_directory, JOURNAL_FILENAME.format(kind=kind))
+        events = []
+        if os.path.exists(path):
+            if resume:
+                events = cls._read(path)
+            else:
+                print(f"Descartando o journal de uma execução interrompida ({path}). "
+                      f"Use --resume para continuar de onde ela parou.")
+                os.remove(path)
+        journal = cls(path, events)
+        journal.append("start", resume=bool(resume))
+        return journal
+
+    @staticmethod
+    def _read(path):
+        events = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # Última linha cortada pela queda do processo: o evento não chegou a valer
+                    break
+        return events
+
+    def append(self, event, **fields):
+        record = {"event": event, "at": time.time(), **fields}
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.events.append(record)
+
+    # --- Consultas (execução anterior + atual) ---
+
+    def committed(self):
+        """Fontes cujos chunks foram todos gravados: {fonte: (hash, ids)}."""
+        sources = {}
+        for record in self.events:
+            if record["event"] == "committed":
+                sources[record["source"]] = (record["hash"], record["ids"])
+        return sources
+
+    def last(self, event):
+        for record in reversed(self.events):
+            if record["event"] == event:
+                return record
+        return None
+
+    def replay(self, manifest, kind):
+        """Aplica no manifesto as fontes gravadas antes da queda; retorna quantas foram reaplicadas."""
+        replayed = 0
+        for source, (content_hash, ids) in self.committed().items():
+            if not manifest.is_unchanged(source, content_hash):
+                manifest.record(source, kind, content_hash, ids)
+                replayed += 1
+        return replayed
+
+    # --- Gravação ---
+
+    def commit(self, source, content_hash, ids):
+        self.append("committed", source=source, hash=content_hash, ids=list(ids))
+        self._since_checkpoint += 1
+
+    def maybe_checkpoint(self, manifest, vectorstore=None):
+        """Salva o manifesto (e persiste o Chroma) a cada CHECKPOINT_EVERY fontes gravadas.
+
+        A versão do índice também avança: se o processo morrer depois daqui, os caches
+        indexados por ela (ex: respostas) não continuam valendo para os chunks novos.
+        """
+        if self._since_checkpoint < CHECKPOINT_EVERY:
+            return False
+        manifest.bump_version()
+        manifest.save()
+        if vectorstore is not None:
+            vectorstore.persist()
+        self.append("checkpoint", sources=len(self.committed()))
+        self._since_checkpoint = 0
+        return True
+
+    def finish(self):
+        """Ingestão concluída e manifesto salvo: o journal não é mais necessário."""
+        self._file.close()
+        os.remove(self.path)
+
+    def close(self):
+        self._file.close()
@@ -1,32 +1,34 @@
 import os
+import sys
 from dotenv import load_dotenv
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.vectorstores import Chroma
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import WebBaseLoader
-from bs4 import BeautifulSoup
-import re 
-import requests
-
-# Dependências do Selenium
+from embedding_cache import CachedEmbeddings
+from embedding_scheduler import BatchedEmbeddings
+from manifest import SourceManifest, hash_text, replace_source_chunks, purge_missing_sources
+from web_fetcher import FETCH_BATCH_SIZE, iter_documents
+from chunker import STRUCTURE, SPLITTER_VERSIONS, StructureAwareSplitter
 import time 
-from selenium import webdriver 
-from selenium.webdriver.chrome.service import Service 
-from selenium.webdriver.common.by import By 
+from crawler import DocsCrawler, SEARCH
+from partitions import PARTITIONS_DIRNAME, build_partitions, detect_version, drop_global_indexes, tag_chunks
+from snapshots import INDEX_ROOT, StagingSnapshot, close_vectorstore
+from ingest_journal import IngestJournal
+from dedup import NearDuplicateFilter
+from tracing import tracer
 
 
 # --- 1. SETUP DE AMBIENTE E API KEY ---
 load_dotenv("keys.env") 
 API_KEY = os.getenv("GEMINI_API_KEY")
 
-if not API_KEY:
-    print("ERRO: A variável de ambiente GEMINI_API_KEY não está configurada.")
-    exit()
-
 # Define o limite de artigos a serem indexados
-MAX_ARTICLES_TO_INDEX = 50 
-# Define quantas páginas de busca serão rastreadas
-MAX_PAGES_TO_SCAN = 10 
+MAX_ARTICLES_TO_INDEX = 50000 
+# Define quantas páginas de busca serão rastreadas (fallback via navegador)
+MAX_PAGES_TO_SCAN = 500 
+# Limite de requisições por segundo ao docs.genexus.com (o Crawl-delay do robots.txt prevalece)
+CRAWL_REQUESTS_PER_SECOND = 2.0
+# Chunks vetorizados por etapa registrada no journal (o cache de embeddings é gravado a cada etapa)
+EMBED_GROUP_SIZE = 500
 
 # URLs (NOVA ESTRATÉGIA DE BUSCA PAGINADA)
 URL_SEARCH_BASE = "https://docs.genexus.com/en/hsearch?+category%3AGeneXus+18+Help"
@@ -36,7 +38,10 @@ CHROME_DRIVER_PATH = r"D:\genexus-ai-assistant\chromedriver.exe"
 
 
 def get_driver_with_selenium():
-    """Inicializa e configura o driver do Chrome."""
+    """Inicializa e configura o driver do Chrome (usado só como fallback pelo crawler)."""
+    # Dependências do Selenium (importadas só quando o navegador é realmente necessário)
+    from selenium import webdriver 
+    from selenium.webdriver.chrome.service import Service 
     
     options = webdriver.ChromeOptions()
     
@@ -45,175 +50,295 @@ def get_driver_with_selenium():
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
     options.add_argument("--window-size=1920,1080")
+    options.add_argument("--headless=new")
     
     service = Service(CHROME_DRIVER_PATH)
     driver = webdriver.Chrome(service=service, options=options)
     
-    # Espera implícita para elementos aparecerem (útil para JS)
-    driver.implicitly_wait(5)
-    
+    # Sem espera implícita: o crawler usa espera explícita pelos resultados da busca
     return driver
     
         
-def run_ingestion():
-    # Lista para armazenar novos documentos Web
-    documents = []
-    article_links = set()
-    driver = None 
-
-    # --- 2. CARREGAMENTO DA DOCUMENTAÇÃO WEB (SELENIUM e Paginação) ---
-    print(f"\nIniciando Scraper nas páginas de Busca do GeneXus 18 (até {MAX_PAGES_TO_SCAN} páginas)...")
-    
-    current_page = 1
-    
-    try:
-        # Inicializa o driver fora do loop para reutilizá-lo
-        driver = get_driver_with_selenium()
-
-        while current_page <= MAX_PAGES_TO_SCAN and len(article_links) < MAX_ARTICLES_TO_INDEX:
-            
-            # 1. Constrói a URL Paginada
-            if current_page == 1:
-                page_url = URL_SEARCH_BASE
-            else:
-                page_url = f"{URL_SEARCH_BASE},{current_page}"
-                
-            print(f"\n -> Processando Página {current_page}: {page_url}")
-
-            # 2. Navega e espera o conteúdo carregar
-            driver.get(page_url)
-            # Espera fixa para que os resultados da busca dinâmica sejam injetados
-            time.sleep(10) 
-            
-            # 3. Extração de Links Diretos (>> EXTRAÇÃO COM SELETOR ESPECÍFICO <<)
-            
-            # CSS Selector: Procura por tags <a> que são filhas diretas de 
-            # <span> com a classe "Search__Title" (que tem o padrão TITLE_XXXX)
-            CSS_SELECTOR = 'span.Search__Title > a'
-            
-            links_elements = driver.find_elements(By.CSS_SELECTOR, CSS_SELECTOR)
-                
-            if not links_elements:
-                if current_page > 1:
-                    print(" -> Nenhuma ligação encontrada. Fim da paginação.")
-                else:
-                    print(" -> Nenhuma ligação encontrada na primeira página.")
-                break 
-
-            print(f" -> {len(links_elements)} links de artigos encontrados na página {current_page}.")
-
-            new_links_on_page = 0
-            for link_element in links_elements:
-                relative_url = link_element.get_attribute('href')
-                
-                # Filtro para garantir que é um artigo wiki e não um arquivo ou âncora
-                if (relative_url and 
-                    '/en/wiki?' in relative_url and 
-                    '#' not in relative_url and 
-                    not any(ext in relative_url for ext in ['.png', '.jpg', '.gif', '.css', '.js', '.svg'])
-                ):
-                    full_url = relative_url
-                    
-                    # Garante que a URL seja absoluta
-                    if full_url.startswith('/'):
-                        full_url = BASE_DOCS_URL + full_url
-
-                    # Adiciona link se não for duplicata
-                    if full_url not in article_links:
-                        article_links.add(full_url)
-                        new_links_on_page += 1
-                        
-                        if len(article_links) >= MAX_ARTICLES_TO_INDEX:
-                            break
-            
-            print(f" -> {new_links_on_page} novos links adicionados. Total: {len(article_links)}/{MAX_ARTICLES_TO_INDEX}")
-
-            if len(article_links) >= MAX_ARTICLES_TO_INDEX:
-                break
-                
-            # Prepara para a próxima iteração
-            current_page += 1
-
-    except Exception as e:
-        print(f"ERRO durante a navegação ou extração: {e}. Interrompendo.")
-    finally:
-        # 4. Fechar o driver
-        if driver:
-            driver.quit() 
+def _open_embeddings():
+    """Embeddings do Gemini com cache em disco; retorna (agendador, embeddings)."""
+    # O cache evita reenviar ao Gemini chunks que já foram vetorizados em execuções anteriores;
+    # os que faltam vão em lotes paralelos dentro da cota, com recuo em caso de 429
+    scheduler = BatchedEmbeddings(
+        GoogleGenerativeAIEmbeddings(
+            model="text-embedding-004",
+            google_api_key=API_KEY
+        )
+    )
+    return scheduler, CachedEmbeddings(scheduler, model_name="text-embedding-004")
+
+
+def _group_by_source(documents):
+    """{fonte: (documents, hash)}; a versão do splitter entra no hash, então uma segmentação
+    nova re-segmenta todos os artigos."""
+    documents_by_source = {}
+    for doc in documents:
+        documents_by_source.setdefault(doc.metadata.get("source", ""), []).append(doc)
+    return {
+        source: (source_docs, hash_text("\n".join(doc.page_content for doc in source_docs),
+                                        version=SPLITTER_VERSIONS[STRUCTURE]))
+        for source, source_docs in documents_by_source.items()
+    }
+
+
+def _split_articles(articles, text_splitter, dedup):
+    """Chunks de cada artigo ({fonte: documents}), marcados com a partição e sem duplicados."""
+    with tracer.span("split", documents=len(articles)) as span:
+        chunks_by_source = {source: text_splitter.split_documents(documents) for source, documents in articles.items()}
+        # Cada artigo vai para a partição da versão citada no título ou, sem ela, da mais
+        # citada no texto; sem nenhuma, para a partição "any", que entra em todas as buscas
+        for source, chunks in chunks_by_source.items():
+            documents = articles[source]
+            title = documents[0].metadata.get("title", "") if documents else ""
+            version = detect_version(title, default=None) or detect_version(
+                "\n".join(document.page_content for document in documents))
+            tag_chunks(chunks, "web", version)
+        span.set(chunks=sum(len(c) for c in chunks_by_source.values()))
+    # Trechos repetidos dentro de um artigo (boilerplate que sobrou da extração, blocos
+    # copiados) são vetorizados uma vez só
+    with tracer.span("dedup"):
+        return {source: dedup.filter(chunks) for source, chunks in chunks_by_source.items()}
+
+
+def run_ingestion(resume=False):
+    # Com o rastreamento ligado, a execução inteira vira um trace (traces/traces.jsonl)
+    with tracer.trace("ingest", kind="web", resume=resume):
+        _run_ingestion(resume)
+    tracer.write_prometheus()
+
+
+def _run_ingestion(resume):
+    # A ingestão trabalha em uma cópia do índice publicado, criada só depois do rastreamento,
+    # dos downloads e dos embeddings, quando já se sabe o que mudou: o app continua
+    # respondendo com o snapshot atual e só passa para o novo quando ele é publicado, no fim
+    staging = StagingSnapshot.begin(INDEX_ROOT, "web", resume)
+    manifest = SourceManifest.load(staging.read_path)
+
+    # Journal de progresso: com resume=True, a descoberta e os artigos já gravados por uma
+    # execução interrompida são reaproveitados em vez de refeitos
+    journal = IngestJournal.open(staging.path, "web", resume)
+    replayed = journal.replay(manifest, "web") if resume else 0
+    discovered = journal.last("discovered") if resume else None
+    if replayed:
+        print(f"Retomando a execução anterior: {replayed} artigos já estavam gravados no ChromaDB.")
+
+    # --- 2. DESCOBERTA DOS ARTIGOS (Crawler com fronteira persistente) ---
+    # Só a busca da categoria "GeneXus 18 Help" é rastreada: os sitemaps e os links dos
+    # artigos cobrem a wiki inteira. O HTML simples vem primeiro; o Selenium só entra como
+    # fallback nas páginas geradas por JavaScript. Uma execução interrompida é retomada na próxima.
+    if discovered:
+        article_links = set(discovered["links"])
+        discovery_complete = discovered["complete"]
+        crawl_started = discovered["crawl_started"]
+        print(f"\n{len(article_links)} artigos descobertos na execução anterior (rastreamento não repetido).")
+    else:
+        print(f"\nIniciando rastreamento da documentação GeneXus 18 (até {MAX_ARTICLES_TO_INDEX} artigos)...")
+        crawl_started = time.time()
+
+        crawler = DocsCrawler(
+            rate=CRAWL_REQUESTS_PER_SECOND,
+            max_articles=MAX_ARTICLES_TO_INDEX,
+            max_search_pages=MAX_PAGES_TO_SCAN,
+            browser_factory=get_driver_with_selenium,
+            follow_links=False
+        )
+        try:
+            with tracer.span("crawl") as span:
+                links, discovery_complete = crawler.crawl([(URL_SEARCH_BASE, SEARCH)])
+                span.set(documents=len(links), requests=crawler.stats["requests"])
+            article_links = set(links)
+            print(f" -> {len(article_links)} artigos descobertos ({crawler.stats['requests']} requisições, "
+                  f"{crawler.stats['browser_renders']} páginas renderizadas no navegador).")
+        except Exception as e:
+            print(f"ERRO durante a navegação ou extração: {e}. Interrompendo.")
+            article_links = set()
+            discovery_complete = False
+        finally:
+            # Fecha o navegador (se o fallback chegou a ser usado)
+            crawler.close()
+        if article_links:
+            journal.append("discovered", links=sorted(article_links), complete=discovery_complete,
+                           crawl_started=crawl_started)
         
     # --- Continuação da Ingestão ---
     
     if not article_links:
         print("\nNenhum link de artigo foi extraído. Finalizando ingestão.")
+        journal.finish()
+        staging.discard()
         return
 
-    # 3. Carregar o CONTEÚDO COMPLETO de cada artigo selecionado
-    # ... (o restante do script permanece o mesmo: loading, chunking, embeddings)
-    
-    article_documents = []
-    print("\nIniciando carregamento do conteúdo dos artigos selecionados...")
-    
-    for i, link in enumerate(article_links):
-        print(f" -> Indexando Artigo {i+1}/{len(article_links)}: {link}")
-        
-        # WebBaseLoader é usado para carregar o conteúdo do artigo (URL por URL)
-        article_loader = WebBaseLoader(link)
-        # Tenta carregar, ignorando falhas individuais de URL (timeout, etc)
-        try:
-            article_documents.extend(article_loader.load())
-        except Exception as e:
-            print(f" !! ERRO ao carregar {link}: {e}")
-            
-    documents.extend(article_documents)
-    print(f"Total de artigos completos carregados: {len(article_documents)}")
+    # 3. Carregar o CONTEÚDO COMPLETO de cada artigo, em lotes: cada lote é comparado com o
+    # manifesto e os artigos novos/alterados são segmentados e vetorizados (o cache de
+    # embeddings guarda os vetores) antes do próximo download; só um lote fica na memória
+    fetch_urls = sorted(article_links)
+    if not discovery_complete:
+        # Sem a listagem completa não dá para concluir que um artigo ausente foi removido:
+        # os já indexados que não apareceram são revalidados (GET condicional) e só saem
+        # do índice se responderem 404/410
+        fetch_urls += sorted(manifest.sources_of_kind("web") - article_links)
+
+    print(f"\nIniciando carregamento do conteúdo de {len(fetch_urls)} artigos (lotes de {FETCH_BATCH_SIZE})...")
+
+    # O markdown do conteúdo principal é dividido por seções: blocos de código e tabelas
+    # ficam inteiros e cada chunk leva o caminho da seção (`section_path`) na metadata
+    text_splitter = StructureAwareSplitter()
+    # Embeddings só são abertos quando aparece o primeiro artigo novo/alterado
+    scheduler = embeddings = None
+    changed_sources = {}
+    fetch_report = {"failed": [], "gone": []}
+    loaded = unchanged = 0
 
+    # Download assíncrono com conexões reutilizadas e GET condicional (ETag/Last-Modified):
+    # artigos inalterados voltam como 304 ou direto do cache em disco
+    fetched_seconds = 0.0
+    for batch_documents, fetch_report in iter_documents(fetch_urls, max_age=time.time() - crawl_started):
+        tracer.record("fetch", fetch_report["seconds"] - fetched_seconds, documents=len(batch_documents))
+        fetched_seconds = fetch_report["seconds"]
+        loaded += len(batch_documents)
+        journal.append("fetched", sources=len(batch_documents), failed=len(fetch_report["failed"]),
+                       gone=len(fetch_report["gone"]))
 
-    if not documents:
+        # --- Comparação com o manifesto: só artigos novos ou alterados serão re-vetorizados ---
+        articles = {}
+        for source, (documents, content_hash) in _group_by_source(batch_documents).items():
+            if manifest.is_unchanged(source, content_hash):
+                unchanged += 1
+            else:
+                articles[source] = documents
+                changed_sources[source] = content_hash
+        if not articles:
+            continue
+
+        # --- DIVISÃO (CHUNKING) E EMBEDDINGS ---
+        chunks_by_source = _split_articles(articles, text_splitter, NearDuplicateFilter())
+        texts = [c.page_content for chunks in chunks_by_source.values() for c in chunks]
+        journal.append("chunks", sources=len(chunks_by_source), chunks=len(texts))
+        if embeddings is None:
+            print("\nInicializando Embeddings...")
+            scheduler, embeddings = _open_embeddings()
+        # Vetoriza os chunks do lote em grandes grupos (lotes paralelos); a gravação, depois,
+        # encontra os vetores no cache em vez de chamar o modelo artigo por artigo.
+        # Cada grupo fica no cache em disco: uma queda no meio não perde os já vetorizados.
+        for start in range(0, len(texts), EMBED_GROUP_SIZE):
+            with tracer.span("embed", chunks=len(texts[start:start + EMBED_GROUP_SIZE])):
+                embeddings.embed_documents(texts[start:start + EMBED_GROUP_SIZE])
+            journal.append("embedded", chunks=min(start + EMBED_GROUP_SIZE, len(texts)), total=len(texts))
+        print(f" -> {len(changed_sources)} artigos novos/alterados vetorizados até agora ({len(texts)} chunks neste lote).")
+
+    print(f"Total de artigos completos carregados: {loaded}")
+    if not loaded:
         print("\nNenhum documento Web foi carregado. Finalizando ingestão.")
+        journal.finish()
+        staging.discard()
         return
 
-    # --- 3. DIVISÃO (CHUNKING) ---
-    print(f"\nDividindo {len(documents)} novos documentos em chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200
-    )
-    new_chunks = text_splitter.split_documents(documents)
-    print(f"Total de novos Chunks criados: {len(new_chunks)}")
+    # Artigos que responderam 404/410 saíram da documentação, mesmo sem paginação completa
+    gone_sources = set(fetch_report["gone"]) & manifest.sources_of_kind("web")
+    removed_sources = set(gone_sources)
+    if discovery_complete:
+        removed_sources |= manifest.sources_of_kind("web") - set(article_links)
 
-    # --- 4. EMBEDDING E ARMAZENAMENTO (CHROMA DB) ---
-    print("\nInicializando Embeddings e manipulando o Chroma DB...")
-    
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model="text-embedding-004",
-        google_api_key=API_KEY
+    print(f"Artigos: {len(changed_sources)} novos/alterados, {unchanged} inalterados, "
+          f"{len(removed_sources)} removidos.")
+
+    if not changed_sources and not removed_sources and not replayed:
+        print("\n✅ Nenhuma alteração desde a última ingestão. Nada a fazer.")
+        journal.finish()
+        missing_partitions = not os.path.exists(os.path.join(staging.read_path, PARTITIONS_DIRNAME))
+        if missing_partitions:
+            # Base criada antes das partições: marca os chunks e monta as partições de busca
+            # (com os índices BM25), sem tocar nos embeddings
+            persist_directory = staging.prepare()
+            vectorstore = Chroma(persist_directory=persist_directory)
+            build_partitions(vectorstore, persist_directory, index_version=manifest.version)
+            drop_global_indexes(persist_directory)
+            close_vectorstore(vectorstore)
+        # A cópia só vira snapshot se algo mudou nela (partições novas ou uma execução retomada)
+        if missing_partitions or staging.resumed:
+            staging.publish(manifest.version)
+        else:
+            staging.discard()
+        return
+
+    # --- 4. ARMAZENAMENTO (CHROMA DB) ---
+    # Só agora a cópia de trabalho é criada, a partir do snapshot publicado neste momento
+    # (uma ingestão de PDFs pode ter publicado durante o rastreamento): o manifesto é relido dela
+    print("\nAtualizando os documentos Web em uma cópia do índice...")
+    persist_directory = staging.prepare()
+    manifest = SourceManifest.load(persist_directory)
+    if resume:
+        journal.replay(manifest, "web")
+    if embeddings is None:
+        scheduler, embeddings = _open_embeddings()
+    # Abre a base existente (incluindo PDFs)
+    vectorstore = Chroma(
+        persist_directory=persist_directory,
+        embedding_function=embeddings
     )
 
-    try:
-        # Tenta carregar a base de dados existente (para combinar)
-        vectorstore = Chroma(
-            persist_directory="./chroma_db",
-            embedding_function=embeddings
-        )
-        print("Base de dados existente (incluindo PDFs) carregada com sucesso.")
-        
-        # Adiciona os novos chunks da Web à base existente
-        print("Adicionando os novos documentos Web à base existente...")
-        vectorstore.add_documents(new_chunks)
-        
-    except Exception as e:
-        # Se a base não existir, cria uma nova
-        print(f"Erro ao carregar base existente ({e}). Criando nova base do zero...")
-        vectorstore = Chroma.from_documents(
-            documents=new_chunks,
-            embedding=embeddings,
-            persist_directory="./chroma_db"
-        )
-        
+    # Os artigos alterados são lidos de novo do cache HTTP, sem rede (é exatamente o conteúdo
+    # comparado acima, qualquer que seja a idade), e segmentados da mesma forma; os vetores
+    # saem do cache de embeddings. Os chunks antigos são apagados pelo ID.
+    dedup = NearDuplicateFilter()
+    written = 0
+    for batch_documents, _ in iter_documents(sorted(changed_sources), max_age=float("inf")):
+        # Um artigo que já está no manifesto relido com o mesmo hash (gravado pela execução
+        # retomada ou por outra ingestão) não é regravado
+        grouped = {source: item for source, item in _group_by_source(batch_documents).items()
+                   if not manifest.is_unchanged(source, item[1])}
+        chunks_by_source = _split_articles({source: item[0] for source, item in grouped.items()}, text_splitter, dedup)
+        with tracer.span("chroma_write", chunks=sum(len(c) for c in chunks_by_source.values())):
+            for source, (_, content_hash) in grouped.items():
+                replace_source_chunks(vectorstore, manifest, source, "web", content_hash, chunks_by_source[source])
+                journal.commit(source, content_hash, manifest.chunk_ids(source))
+                journal.maybe_checkpoint(manifest, vectorstore)
+                written += 1
+    print(f"Artigos gravados: {written}. Filtro de duplicados: {dedup.summary()}")
+
+    current_sources = manifest.sources_of_kind("web") - gone_sources
+    if discovery_complete:
+        current_sources &= set(article_links)
+    purged = purge_missing_sources(vectorstore, manifest, "web", current_sources)
+    for source in purged:
+        print(f" -> Removido do índice: {source}")
+
+    manifest.bump_version()
+    manifest.save()
+    # Manifesto salvo: o journal da execução não é mais necessário
+    journal.finish()
+
     # Salva as alterações, persistindo tanto os dados antigos quanto os novos
     vectorstore.persist()
+    # Uma exportação memory-mapped + BM25 por versão/tipo de fonte: a busca só abre as
+    # partições da pergunta. Só as partições dos artigos gravados ou removidos são refeitas
+    # (as demais, PDFs inclusive, entram por hardlinks); uma execução retomada refaz todas.
+    resumed = replayed or staging.resumed
+    with tracer.span("partitions"):
+        build_partitions(vectorstore, persist_directory, index_version=manifest.version,
+                         changed_sources=None if resumed else set(changed_sources) | set(purged))
+    # O BM25 e a exportação globais não são lidos com as partições: não ficam no snapshot
+    drop_global_indexes(persist_directory)
+    # Troca atômica do ponteiro CURRENT: o app carrega o snapshot novo sem reiniciar
+    close_vectorstore(vectorstore)
+    snapshot = staging.publish(manifest.version)
+    stats = embeddings.stats()
+    print(f"Cache de embeddings: {stats['hits']} acertos, {stats['misses']} chamadas ao modelo "
+          f"({stats['entries']} vetores em cache)")
+    stats = scheduler.stats()
+    print(f"Agendador de embeddings: {stats['chunks']} chunks em {stats['batches']} lotes "
+          f"({stats['chunks_per_second']:.1f} chunks/s), {stats['throttle_events']} eventos de throttling")
     print("\n✅ Ingestão concluída com sucesso!")
-    print(f"Os dados (antigos e novos) estão agora combinados em: ./chroma_db")
+    print(f"Os dados (antigos e novos) estão agora combinados em: {INDEX_ROOT} (snapshot {snapshot})")
 
 if __name__ == "__main__":
-    run_ingestion()
\ No newline at end of file
+    if not API_KEY:
+        print("ERRO: A variável de ambiente GEMINI_API_KEY não está configurada.")
+        sys.exit(1)
+    if "--trace" in sys.argv:
+        tracer.enable()
+    run_ingestion(resume="--resume" in sys.argv)
\ No newline at end of file
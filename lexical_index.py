@@ -0,0 +1,244 @@
+import os
+import re
+import gzip
+import json
+import math
+import time
+from collections import Counter
+
+from langchain_core.documents import Document
+
+
+# O índice BM25 fica ao lado do ChromaDB e é reconstruído a cada ingestão
+LEXICAL_INDEX_FILENAME = "bm25_index.json.gz"
+# Páginas lidas do Chroma por vez durante a construção
+_PAGE_SIZE = 1000
+
+# Variáveis (&Variavel), identificadores e palavras com acentos
+_TOKEN_RE = re.compile(r"&?\w+", re.UNICODE)
+# &Variavel, CamelCase, com sublinhado ou com dígitos depois de uma letra (CustomerId, Customer_Id, Tab2)
+_IDENTIFIER_RE = re.compile(r"^&\w+$|^\w*[a-z][A-Z]\w*$|^\w*_\w*$|^[^\W\d]\w*\d\w*$")
+
+STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas",
+    "um", "uma", "para", "por", "com", "que", "se", "ao", "the", "of", "and", "to", "in", "is",
+    "it", "on", "an", "as", "be", "this", "are", "or", "como", "qual", "quais", "what", "how",
+}
+
+# Comandos da linguagem de procedimentos GeneXus (sintaxe, não conceitos)
+GENEXUS_COMMANDS = {
+    "for", "each", "endfor", "where", "defined", "by", "order", "when", "none", "new", "endnew",
+    "do", "case", "endcase", "while", "enddo", "sub", "endsub", "call", "udp", "submit", "commit",
+    "rollback", "parm", "in", "out", "inout", "msg", "return", "if", "else", "endif",
+}
+# Comandos, tipos de objeto e outros termos GeneXus: só eles (e identificadores) podem
+# aparecer em uma consulta tratada como "identificador"
+GENEXUS_KEYWORDS = GENEXUS_COMMANDS | {
+    "transaction", "procedure",
+    "data", "provider", "selector", "web", "panel", "component", "sdt", "structured", "type",
+    "domain", "attribute", "attributes", "variable", "variables", "rules", "events", "conditions",
+    "subtypes", "subtype", "theme", "pattern", "workwith", "grid", "freestyle", "kb",
+}
+
+
+def tokenize(text):
+    return [token for token in (t.lower() for t in _TOKEN_RE.findall(text)) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """Índice invertido BM25 em memória, com os mesmos IDs dos chunks do ChromaDB."""
+
+    def __init__(self, ids, lengths, postings, k1=1.5, b=0.75):
+        self.ids = ids
+        self.lengths = lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avgdl = (sum(lengths) / len(lengths)) if lengths else 0.0
+        self.postings_count = sum(len(p) for p in postings.values())
+
+    @classmethod
+    def build(cls, texts_by_id):
+        """Constrói o índice a partir de pares (id, texto)."""
+        ids, lengths, postings = [], [], {}
+        for doc_index, (chunk_id, text) in enumerate(texts_by_id):
+            tokens = tokenize(text or "")
+            ids.append(chunk_id)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_index, tf))
+        return cls(ids, lengths, postings)
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "lengths": self.lengths, "postings": self.postings}, f)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    @classmethod
+    def load(cls, persist_directory):
+        """Carrega o índice salvo junto ao ChromaDB (ou None se ainda não existir)."""
+        path = os.path.join(persist_directory, LEXICAL_INDEX_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["ids"], data["lengths"], data["postings"])
+
+    def __contains__(self, term):
+        return term in self.postings
+
+    def search(self, query, k=10):
+        """Retorna [(id, score)] dos `k` chunks com maior pontuação BM25."""
+        total = len(self.ids)
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_index, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_index] / self.avgdl)
+                scores[doc_index] = scores.get(doc_index, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[doc_index], score) for doc_index, score in best]
+
+    def is_identifier_query(self, query, max_terms=5):
+        """A pergunta é só um identificador ou trecho de sintaxe GeneXus (ex: '&CustomerId', 'For Each')?
+
+        Todos os termos precisam ser identificadores ou palavras-chave GeneXus, e pelo menos
+        um deles um identificador (&Var, CamelCase...) ou um comando: perguntas em linguagem
+        natural ('What is a Transaction?') e nomes de conceitos ('Data Provider') continuam
+        na busca vetorial. Nesse caso a busca lexical basta e o embedding pode ser evitado.
+        """
+        if "?" in query:
+            return False
+        raw_tokens = _TOKEN_RE.findall(query)
+        if not raw_tokens or len(raw_tokens) > max_terms:
+            return False
+        has_syntax = False
+        for token in raw_tokens:
+            lowered = token.lower()
+            if _IDENTIFIER_RE.match(token):
+                has_syntax = True
+            elif lowered in GENEXUS_COMMANDS:
+                has_syntax = True
+            elif lowered not in GENEXUS_KEYWORDS:
+                return False
+            # Termos fora do índice: a busca lexical não acharia nada
+            if lowered not in STOPWORDS and lowered not in self.postings:
+                return False
+        return has_syntax
+
+    def stats(self):
+        return {
+            "documents": len(self.ids),
+            "terms": len(self.postings),
+            "postings": self.postings_count,
+        }
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Combina listas de IDs ordenadas: score = soma de 1 / (k + posição)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return [chunk_id for chunk_id, _ in sorted(scores.items(), key=lambda item: item[1], reverse=True)]
+
+
+def build_lexical_index(vectorstore, persist_directory, where=None):
+    """Reconstrói o índice BM25 a partir dos chunks gravados no ChromaDB (só os do filtro `where`, se houver)."""
+    start = time.perf_counter()
+
+    def iter_chunks():
+        offset = 0
+        while True:
+            page = vectorstore._collection.get(include=["documents"], where=where, limit=_PAGE_SIZE, offset=offset)
+            if not page["ids"]:
+                break
+            yield from zip(page["ids"], page["documents"])
+            offset += len(page["ids"])
+
+    index = LexicalIndex.build(iter_chunks())
+    size = index.save(os.path.join(persist_directory, LEXICAL_INDEX_FILENAME))
+    stats = index.stats()
+    print(f"Índice BM25: {stats['documents']} chunks, {stats['terms']} termos, "
+          f"{stats['postings']} postings, {size / 1024:.0f} KB em disco, "
+          f"construído em {time.perf_counter() - start:.1f}s")
+    return index
+
+
+class HybridSearcher:
+    """Busca híbrida: vetorial (ChromaDB) + lexical (BM25) fundidas por Reciprocal Rank Fusion.
+
+    Com `vector_index` (exportação memory-mapped do vector_export) a parte vetorial e a
+    leitura dos chunks não passam pelo cliente do Chroma.
+    """
+
+    def __init__(self, vectorstore, lexical_index=None, k=3, candidates=20, rrf_k=60, vector_index=None):
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.vector_index = vector_index
+        self.k = k
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+
+    def needs_embedding(self, question):
+        """False quando a pergunta pode ser respondida só pela busca lexical."""
+        return not (self.lexical_index and self.lexical_index.is_identifier_query(question))
+
+    def search(self, question, query_vector=None, k=None):
+        """Retorna (documents, timings): os `k` Documents mais relevantes e o tempo de cada busca (ms).
+
+        Sem `query_vector` usa só o BM25. Os tempos voltam junto com o resultado (e não em
+        um atributo) porque o mesmo searcher atende perguntas simultâneas.
+        """
+        k = k or self.k
+        candidates = max(self.candidates, k)
+        timings = {}
+        rankings = []
+        collection = self.vectorstore._collection
+        found = {}
+
+        if query_vector is not None and self.vector_index is not None:
+            start = time.perf_counter()
+            rankings.append([chunk_id for chunk_id, _ in self.vector_index.search(query_vector, candidates)])
+            timings["vector_ms"] = (time.perf_counter() - start) * 1000
+        elif query_vector is not None:
+            start = time.perf_counter()
+            dense = collection.query(
+                query_embeddings=[query_vector],
+                n_results=candidates,
+                include=["documents", "metadatas"],
+            )
+            timings["vector_ms"] = (time.perf_counter() - start) * 1000
+            rankings.append(dense["ids"][0])
+            for chunk_id, text, metadata in zip(dense["ids"][0], dense["documents"][0], dense["metadatas"][0]):
+                found[chunk_id] = Document(page_content=text, metadata=metadata or {})
+
+        if self.lexical_index is not None:
+            start = time.perf_counter()
+            rankings.append([chunk_id for chunk_id, _ in self.lexical_index.search(question, candidates)])
+            timings["lexical_ms"] = (time.perf_counter() - start) * 1000
+
+        ranked = reciprocal_rank_fusion(rankings, self.rrf_k)[:k] if rankings else []
+        missing = [chunk_id for chunk_id in ranked if chunk_id not in found]
+        if missing and self.vector_index is not None:
+            found.update(self.vector_index.get_documents(missing))
+        elif missing:
+            # Chunks encontrados só pelo BM25: lidos direto do Chroma, sem embedding
+            page = collection.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                found[chunk_id] = Document(page_content=text, metadata=metadata or {})
+
+        return [found[chunk_id] for chunk_id in ranked if chunk_id in found], timings
+
+    def warm(self):
+        if self.vector_index is not None:
+            self.vector_index.warm()
+
+    def close(self):
+        if self.vector_index is not None:
+            self.vector_index.close()
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import hashlib
+
+
+# O manifesto fica dentro do diretório do índice para andar sempre junto com os vetores
+MANIFEST_FILENAME = "ingest_manifest.json"
+# Arquivo pequeno com a versão do índice, lido a cada pergunta pelo app
+INDEX_VERSION_FILENAME = "index_version"
+
+
+def hash_file(path, block_size=1 << 20, version=None):
+    """Hash SHA-256 do arquivo, lido em blocos (não carrega o PDF inteiro na memória).
+
+    `version` (ex: a versão do splitter) entra no hash: se ela mudar, a fonte deixa de
+    constar como inalterada no manifesto e é processada de novo.
+    """
+    digest = hashlib.sha256()
+    if version:
+        digest.update(f"{version}\n".encode("utf-8"))
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_text(text, version=None):
+    """Hash SHA-256 do conteúdo textual de uma fonte (ex: artigo web); `version` como em `hash_file`."""
+    if version:
+        text = f"{version}\n{text}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_chunk_ids(source, content_hash, count, start=0, part=None):
+    """IDs determinísticos: a mesma versão de uma fonte sempre gera os mesmos IDs.
+
+    `part` identifica um trecho da fonte processado separadamente (ex: intervalo de páginas).
+    """
+    source_id = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+    prefix = f"{source_id}-{content_hash[:12]}-{part}" if part else f"{source_id}-{content_hash[:12]}"
+    return [f"{prefix}-{i}" for i in range(start, start + count)]
+
+
+class SourceManifest:
+    """Mapeia cada fonte (caminho do PDF ou URL da wiki) ao hash do conteúdo e aos IDs dos seus chunks."""
+
+    def __init__(self, path, data=None):
+        self.path = path
+        data = data or {}
+        self.version = data.get("version", 0)
+        self.sources = data.get("sources", {})
+        self._dirty = False
+
+    @classmethod
+    def load(cls, persist_directory):
+        """Carrega o manifesto do índice (ou cria um vazio se ainda não existir)."""
+        path = os.path.join(persist_directory, MANIFEST_FILENAME)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(path, json.load(f))
+        return cls(path)
+
+    def save(self):
+        """Grava o manifesto de forma atômica (arquivo temporário + rename)."""
+        if not self._dirty:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "sources": self.sources}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+        version_path = os.path.join(directory, INDEX_VERSION_FILENAME)
+        with open(version_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(str(self.version))
+        os.replace(version_path + ".tmp", version_path)
+        self._dirty = False
+
+    # --- Consultas ---
+
+    def is_unchanged(self, source, content_hash):
+        entry = self.sources.get(source)
+        return entry is not None and entry["hash"] == content_hash
+
+    def sources_of_kind(self, kind):
+        return {source for source, entry in self.sources.items() if entry["kind"] == kind}
+
+    def chunk_ids(self, source):
+        entry = self.sources.get(source)
+        return list(entry["chunk_ids"]) if entry else []
+
+    # --- Alterações ---
+
+    def record(self, source, kind, content_hash, chunk_ids):
+        self.sources[source] = {
+            "kind": kind,
+            "hash": content_hash,
+            "chunk_ids": list(chunk_ids),
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self._dirty = True
+
+    def remove(self, source):
+        entry = self.sources.pop(source, None)
+        if entry is not None:
+            self._dirty = True
+        return entry["chunk_ids"] if entry else []
+
+    def bump_version(self):
+        """Incrementa a versão do índice (usada para invalidar caches que dependem dele)."""
+        self.version += 1
+        self._dirty = True
+        return self.version
+
+
+def read_index_version(persist_directory):
+    """Versão atual do índice (incrementada a cada ingestão que altera o ChromaDB)."""
+    try:
+        with open(os.path.join(persist_directory, INDEX_VERSION_FILENAME), "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def replace_source_chunks(vectorstore, manifest, source, kind, content_hash, chunks):
+    """Remove os chunks antigos da fonte e grava os novos com IDs determinísticos."""
+    old_ids = manifest.chunk_ids(source)
+    ids = make_chunk_ids(source, content_hash, len(chunks))
+    if old_ids:
+        # Os novos IDs também são apagados para que uma execução interrompida possa ser refeita
+        vectorstore.delete(ids=old_ids + ids)
+    else:
+        # Índices criados antes do manifesto não têm IDs conhecidos: remove pela metadata
+        vectorstore.delete(where={"source": source})
+
+    for i, chunk in enumerate(chunks):
+        chunk.metadata["chunk_index"] = i
+    if chunks:
+        vectorstore.add_documents(chunks, ids=ids)
+    manifest.record(source, kind, content_hash, ids)
+    return ids
+
+
+def purge_missing_sources(vectorstore, manifest, kind, current_sources):
+    """Apaga do índice as fontes de um tipo que não existem mais na origem."""
+    removed = sorted(manifest.sources_of_kind(kind) - set(current_sources))
+    for source in removed:
+        ids = manifest.remove(source)
+        if ids:
+            vectorstore.delete(ids=ids)
+    return removed
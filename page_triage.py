@@ -0,0 +1,152 @@
+from pypdf import PdfReader
+from pypdf.generic import ContentStream
+
+
+# Fração da página coberta por imagens a partir da qual a página vai para o modelo de visão
+IMAGE_COVERAGE_THRESHOLD = 0.15
+# Fração coberta por desenhos vetoriais (diagramas) e quantidade mínima de segmentos
+DRAWING_COVERAGE_THRESHOLD = 0.20
+MIN_DRAWING_SEGMENTS = 30
+# Abaixo disso a camada de texto é considerada vazia (página escaneada ou só imagem)
+MIN_TEXT_CHARS = 50
+# Profundidade máxima de Form XObjects aninhados
+_MAX_FORM_DEPTH = 3
+
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+_PATH_PAINT_OPERATORS = {b"S", b"s", b"f", b"F", b"f*", b"B", b"B*", b"b", b"b*"}
+
+
+def _multiply(m1, m2):
+    """Produto de matrizes de transformação PDF [a b c d e f] (m1 aplicada primeiro)."""
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (
+        a1 * a2 + b1 * c2,
+        a1 * b2 + b1 * d2,
+        c1 * a2 + d1 * c2,
+        c1 * b2 + d1 * d2,
+        e1 * a2 + f1 * c2 + e2,
+        e1 * b2 + f1 * d2 + f2,
+    )
+
+
+def _transform(matrix, x, y):
+    a, b, c, d, e, f = matrix
+    return a * x + c * y + e, b * x + d * y + f
+
+
+class _PageVisitor:
+    """Percorre o content stream somando a área de imagens e de desenhos vetoriais."""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.image_area = 0.0
+        self.drawing_area = 0.0
+        self.drawing_segments = 0
+        self.image_count = 0
+
+    def visit(self, contents, resources, matrix, depth=0):
+        if contents is None:
+            return
+        xobjects = resources.get("/XObject") if resources else None
+        xobjects = xobjects.get_object() if xobjects is not None else {}
+        stack = []
+        ctm = matrix
+        path_points = []
+        path_segments = 0
+
+        for operands, operator in ContentStream(contents, self.reader).operations:
+            if operator == b"q":
+                stack.append(ctm)
+            elif operator == b"Q":
+                ctm = stack.pop() if stack else matrix
+            elif operator == b"cm":
+                ctm = _multiply(tuple(float(v) for v in operands), ctm)
+            elif operator == b"re":
+                x, y, w, h = (float(v) for v in operands)
+                path_points.extend(_transform(ctm, px, py) for px, py in ((x, y), (x + w, y + h), (x + w, y), (x, y + h)))
+                path_segments += 4
+            elif operator in (b"m", b"l"):
+                path_points.append(_transform(ctm, float(operands[0]), float(operands[1])))
+                path_segments += operator == b"l"
+            elif operator in (b"c", b"v", b"y"):
+                values = [float(v) for v in operands]
+                path_points.extend(_transform(ctm, values[i], values[i + 1]) for i in range(0, len(values), 2))
+                path_segments += 1
+            elif operator in _PATH_PAINT_OPERATORS:
+                if path_points:
+                    xs = [p[0] for p in path_points]
+                    ys = [p[1] for p in path_points]
+                    self.drawing_area += (max(xs) - min(xs)) * (max(ys) - min(ys))
+                self.drawing_segments += path_segments
+                path_points, path_segments = [], 0
+            elif operator == b"n":
+                # Caminho usado só como recorte (clipping): não é desenho
+                path_points, path_segments = [], 0
+            elif operator == b"INLINE IMAGE":
+                self._add_image(ctm)
+            elif operator == b"Do" and operands:
+                xobject = xobjects.get(operands[0])
+                if xobject is None:
+                    continue
+                xobject = xobject.get_object()
+                subtype = xobject.get("/Subtype")
+                if subtype == "/Image":
+                    self._add_image(ctm)
+                elif subtype == "/Form" and depth < _MAX_FORM_DEPTH:
+                    form_matrix = tuple(float(v) for v in xobject.get("/Matrix", _IDENTITY))
+                    form_resources = xobject.get("/Resources")
+                    self.visit(xobject, form_resources.get_object() if form_resources else resources,
+                               _multiply(form_matrix, ctm), depth + 1)
+
+    def _add_image(self, ctm):
+        # A imagem ocupa o quadrado unitário transformado pela CTM
+        a, b, c, d, _, _ = ctm
+        self.image_area += abs(a * d - b * c)
+        self.image_count += 1
+
+
+def triage_page(reader, page, page_number):
+    """Classifica uma página: texto nativo, cobertura de imagens/desenhos e se precisa de visão."""
+    text = page.extract_text() or ""
+    box = page.mediabox
+    page_area = max(float(box.width) * float(box.height), 1.0)
+
+    visitor = _PageVisitor(reader)
+    try:
+        resources = page.get("/Resources")
+        visitor.visit(page.get_contents(), resources.get_object() if resources else None, _IDENTITY)
+    except Exception:
+        # Content stream malformado: na dúvida, a página vai para o modelo de visão
+        visitor.image_area = page_area
+
+    image_coverage = min(visitor.image_area / page_area, 1.0)
+    drawing_coverage = min(visitor.drawing_area / page_area, 1.0)
+    text_chars = len(text.strip())
+
+    if image_coverage >= IMAGE_COVERAGE_THRESHOLD:
+        reason = "imagem"
+    elif drawing_coverage >= DRAWING_COVERAGE_THRESHOLD and visitor.drawing_segments >= MIN_DRAWING_SEGMENTS:
+        reason = "diagrama"
+    elif text_chars < MIN_TEXT_CHARS and (visitor.image_count or visitor.drawing_segments):
+        reason = "sem camada de texto"
+    else:
+        reason = None
+
+    return {
+        "page": page_number,
+        "text": text,
+        "text_chars": text_chars,
+        "image_coverage": image_coverage,
+        "drawing_coverage": drawing_coverage,
+        "drawing_segments": visitor.drawing_segments,
+        "needs_vision": reason is not None,
+        "reason": reason or "texto",
+    }
+
+
+def iter_page_triage(pdf_path):
+    """Gera a classificação de cada página do PDF, em ordem (páginas numeradas a partir de 1)."""
+    reader = PdfReader(pdf_path)
+    for index, page in enumerate(reader.pages):
+        yield triage_page(reader, page, index + 1)
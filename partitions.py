@@ -0,0 +1,428 @@
+import os
+import re
+import json
+import time
+import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from pypdf import PdfReader
+
+from lexical_index import LEXICAL_INDEX_FILENAME, LexicalIndex, build_lexical_index, reciprocal_rank_fusion
+from vector_export import VECTOR_INDEX_DIRNAME, MemmapVectorIndex, current_version_dir, export_vectors, \
+    new_version_dir, publish_version_dir, DEFAULT_DTYPE
+
+
+# Partições de busca: uma por versão do GeneXus e tipo de fonte (ex: gx18-web, gx17-pdf),
+# cada uma com a sua exportação de vetores e o seu índice BM25 em `partitions/<nome>/`
+PARTITIONS_DIRNAME = "partitions"
+CATALOG_FILENAME = "partitions.json"
+# Fontes de cada partição ({partição: [fontes]}), fora do catálogo que o app carrega: com
+# elas uma ingestão refaz só as partições das fontes que mudaram
+SOURCES_FILENAME = "sources.json"
+# Chunks sem versão identificada: a partição deles entra em todas as buscas
+ANY_VERSION = "any"
+GENERAL_CATEGORY = "geral"
+SOURCE_TYPES = ("pdf", "web")
+# Páginas do PDF lidas (além do nome do arquivo) para identificar a versão
+VERSION_SAMPLE_PAGES = 3
+# Partições buscadas ao mesmo tempo em uma pergunta
+FANOUT_WORKERS = 8
+# Chunks lidos do Chroma por vez ao marcar os chunks antigos (sem tags)
+_PAGE_SIZE = 1000
+# Fontes consultadas por vez (filtro `$in`) ao localizar os chunks novos
+_SOURCES_PER_QUERY = 200
+
+# "GeneXus 18", "GX17", "GeneXus X Ev3"
+_VERSION_RE = re.compile(r"\b(?:GeneXus|GX)\s*(X\s*Ev\s*\d|\d{2})\b", re.IGNORECASE)
+# Nas perguntas também vale "versão 17" / "version 17"
+_QUESTION_VERSION_RE = re.compile(r"\b(?:GeneXus|GX|vers[aã]o|version)\s*(X\s*Ev\s*\d|\d{2})\b", re.IGNORECASE)
+_SOURCE_TYPE_HINTS = {
+    "pdf": re.compile(r"\b(manual|manuais|pdf|apostila|guia)\b", re.IGNORECASE),
+    "web": re.compile(r"\b(wiki|site|artigo|docs\.genexus)\b", re.IGNORECASE),
+}
+# Categoria de objeto GeneXus de cada chunk (a mais citada no caminho da seção e no texto)
+OBJECT_CATEGORIES = {
+    "transaction": re.compile(r"\btransa(?:ctions?|ção|ções)\b", re.IGNORECASE),
+    "procedure": re.compile(r"\bprocedures?\b|\bprocedimentos?\b", re.IGNORECASE),
+    "data_provider": re.compile(r"\bdata\s*providers?\b", re.IGNORECASE),
+    "data_selector": re.compile(r"\bdata\s*selectors?\b", re.IGNORECASE),
+    "web_panel": re.compile(r"\bweb\s*panels?\b", re.IGNORECASE),
+    "panel": re.compile(r"(?<!web )\bpanels?\b", re.IGNORECASE),
+    "sdt": re.compile(r"\bstructured\s*data\s*types?\b|\bsdts?\b", re.IGNORECASE),
+    "business_component": re.compile(r"\bbusiness\s*components?\b", re.IGNORECASE),
+    "external_object": re.compile(r"\bexternal\s*objects?\b", re.IGNORECASE),
+    "domain": re.compile(r"\bdomains?\b|\bdomínios?\b", re.IGNORECASE),
+    "workflow": re.compile(r"\bbusiness\s*process\s*diagrams?\b|\bworkflow\b", re.IGNORECASE),
+}
+SECTION_WEIGHT = 3
+
+
+def normalize_version(raw):
+    """'18' -> '18'; 'X Ev3' -> 'xev3'."""
+    return re.sub(r"\s+", "", raw).lower()
+
+
+def _version_key(version):
+    """Ordem cronológica: X Ev1..Ev3 vieram antes do GeneXus 15."""
+    if version.isdigit():
+        return float(version)
+    digits = re.sub(r"\D", "", version)
+    return 10 + int(digits or 0) / 10
+
+
+def detect_version(text, default=ANY_VERSION):
+    """Versão do GeneXus mais citada no texto (ou `default`)."""
+    counts = Counter(normalize_version(match) for match in _VERSION_RE.findall(text or ""))
+    return counts.most_common(1)[0][0] if counts else default
+
+
+def detect_pdf_version(pdf_path, pages=VERSION_SAMPLE_PAGES):
+    """Versão de um manual pelo nome do arquivo ou, sem ela, pelas primeiras páginas."""
+    version = detect_version(os.path.basename(pdf_path).replace("_", " "), default=None)
+    if version:
+        return version
+    try:
+        reader = PdfReader(pdf_path)
+        text = "\n".join(reader.pages[i].extract_text() or "" for i in range(min(pages, len(reader.pages))))
+    except Exception:
+        return ANY_VERSION
+    return detect_version(text)
+
+
+def detect_category(text, section_path=""):
+    scores = Counter()
+    for category, pattern in OBJECT_CATEGORIES.items():
+        score = SECTION_WEIGHT * len(pattern.findall(section_path or "")) + len(pattern.findall(text or ""))
+        if score:
+            scores[category] = score
+    return scores.most_common(1)[0][0] if scores else GENERAL_CATEGORY
+
+
+def partition_name(version, source_type):
+    return f"gx{version}-{source_type}"
+
+
+def _tag(metadata, text, source_type, version):
+    metadata["gx_version"] = version
+    metadata["source_type"] = source_type
+    metadata["object_category"] = detect_category(text, metadata.get("section_path", ""))
+    metadata["partition"] = partition_name(version, source_type)
+    return metadata
+
+
+def tag_chunks(chunks, source_type, version=ANY_VERSION):
+    """Marca os chunks com versão, tipo de fonte, categoria de objeto e partição."""
+    for chunk in chunks:
+        _tag(chunk.metadata, chunk.page_content, source_type, version)
+    return chunks
+
+
+def infer_filters(question):
+    """Versões, tipos de fonte e categoria citados na pergunta (None quando não citados)."""
+    versions = sorted({normalize_version(match) for match in _QUESTION_VERSION_RE.findall(question)})
+    source_types = [kind for kind, pattern in _SOURCE_TYPE_HINTS.items() if pattern.search(question)]
+    category = detect_category(question)
+    return {
+        "versions": versions or None,
+        "source_types": source_types or None,
+        "category": None if category == GENERAL_CATEGORY else category,
+    }
+
+
+def _untagged_metadata(text, metadata):
+    """Tags dos chunks gravados antes das partições (a versão vem do próprio texto)."""
+    source = str(metadata.get("source", ""))
+    source_type = "web" if source.startswith(("http://", "https://")) else "pdf"
+    version = detect_version(f"{metadata.get('title') or ''}\n{text or ''}")
+    return _tag(dict(metadata), text or "", source_type, version)
+
+
+def _scan_partitions(collection):
+    """Uma passada por todos os chunks: fontes de cada partição e os chunks antigos marcados."""
+    sources, partitions, retagged = {}, {}, 0
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=_PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        update_ids, update_metadatas = [], []
+        for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            metadata = metadata or {}
+            if not metadata.get("partition"):
+                metadata = _untagged_metadata(text, metadata)
+                update_ids.append(chunk_id)
+                update_metadatas.append(metadata)
+            sources.setdefault(metadata["partition"], set()).add(str(metadata.get("source", "")))
+            partitions[metadata["partition"]] = (metadata["gx_version"], metadata["source_type"])
+        if update_ids:
+            collection.update(ids=update_ids, metadatas=update_metadatas)
+            retagged += len(update_ids)
+        offset += len(page["ids"])
+    return sources, partitions, retagged
+
+
+def _load_previous(parent):
+    """(catálogo, {partição: fontes}, diretório) da versão publicada, ou None se não há como reaproveitá-la."""
+    root = current_version_dir(parent)
+    try:
+        with open(os.path.join(root, CATALOG_FILENAME), "r", encoding="utf-8") as f:
+            catalog = json.load(f)
+        with open(os.path.join(root, SOURCES_FILENAME), "r", encoding="utf-8") as f:
+            sources = {name: set(names) for name, names in json.load(f).items()}
+    except (OSError, ValueError):
+        return None
+    return catalog, sources, root
+
+
+def _rescan_sources(collection, changed_sources, sources, partitions):
+    """Tira as fontes alteradas das partições e as devolve às partições dos chunks atuais delas.
+
+    Retorna as partições afetadas, ou None se algum chunk novo não tem partição (marcação completa necessária).
+    """
+    affected = {name for name, names in sources.items() if names & changed_sources}
+    for names in sources.values():
+        names -= changed_sources
+    changed = sorted(changed_sources)
+    for start in range(0, len(changed), _SOURCES_PER_QUERY):
+        page = collection.get(where={"source": {"$in": changed[start:start + _SOURCES_PER_QUERY]}},
+                              include=["metadatas"])
+        for metadata in page["metadatas"]:
+            metadata = metadata or {}
+            if not metadata.get("partition"):
+                return None
+            sources.setdefault(metadata["partition"], set()).add(str(metadata.get("source", "")))
+            partitions[metadata["partition"]] = (metadata["gx_version"], metadata["source_type"])
+            affected.add(metadata["partition"])
+    return affected
+
+
+def _link_tree(source, target):
+    """Cópia de uma partição inalterada: hardlinks (os arquivos nunca são alterados no lugar)."""
+    def link(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+        return dst
+
+    shutil.copytree(source, target, copy_function=link)
+
+
+def build_partitions(vectorstore, persist_directory, index_version=None, dtype=DEFAULT_DTYPE, changed_sources=None):
+    """Reconstrói as partições de busca a partir do ChromaDB (fonte da verdade dos chunks).
+
+    Sem `changed_sources`, uma passada por todos os chunks conta as fontes de cada
+    partição e marca os chunks antigos que ainda não têm tags, e todas as partições são
+    refeitas. Com `changed_sources` (fontes gravadas ou removidas nesta ingestão) só as
+    partições que as continham ou passam a conter são refeitas; as demais são
+    reaproveitadas da versão anterior por hardlinks. Cada partição refeita ganha a sua
+    exportação de vetores e o seu índice BM25 (só com os chunks dela, via filtro de
+    metadata) em um diretório de versão novo, publicado no fim pelo ponteiro
+    `partitions/CURRENT`.
+    """
+    start = time.perf_counter()
+    collection = vectorstore._collection
+    parent = os.path.join(persist_directory, PARTITIONS_DIRNAME)
+    previous = _load_previous(parent) if changed_sources is not None else None
+    affected = retagged = None
+    if previous is not None:
+        catalog, sources, previous_root = previous
+        partitions = {name: (entry["version"], entry["source_type"]) for name, entry in catalog["partitions"].items()}
+        affected = _rescan_sources(collection, set(changed_sources), sources, partitions)
+    if affected is None:
+        sources, partitions, retagged = _scan_partitions(collection)
+        affected = set(sources)
+
+    tmp_dir = new_version_dir(parent)
+    counts = {}
+    for name in sorted(name for name, names in sources.items() if names):
+        partition_dir = os.path.join(tmp_dir, name)
+        if name not in affected:
+            _link_tree(os.path.join(previous_root, name), partition_dir)
+            counts[name] = catalog["partitions"][name]["chunks"]
+            continue
+        os.makedirs(partition_dir)
+        counts[name] = len(collection.get(where={"partition": name}, include=[])["ids"])
+        print(f"Partição {name} ({counts[name]} chunks):")
+        build_lexical_index(vectorstore, partition_dir, where={"partition": name})
+        export_vectors(vectorstore, partition_dir, dtype, index_version=index_version, where={"partition": name})
+    with open(os.path.join(tmp_dir, CATALOG_FILENAME), "w", encoding="utf-8") as f:
+        json.dump({
+            "index_version": index_version,
+            "created_at": time.time(),
+            "partitions": {
+                name: {"version": partitions[name][0], "source_type": partitions[name][1], "chunks": counts[name]}
+                for name in sorted(counts)
+            },
+        }, f, ensure_ascii=False, indent=1)
+    with open(os.path.join(tmp_dir, SOURCES_FILENAME), "w", encoding="utf-8") as f:
+        json.dump({name: sorted(sources[name]) for name in sorted(counts)}, f, ensure_ascii=False)
+
+    # Mesma troca por ponteiro da exportação de vetores: as partições abertas não são apagadas
+    output_dir = publish_version_dir(parent, tmp_dir)
+    rebuilt = sorted(affected & set(counts))
+    detail = f" ({', '.join(rebuilt)})" if rebuilt and len(rebuilt) < len(counts) else ""
+    print(f"Partições: {len(counts)} ({', '.join(sorted(counts))}), {sum(counts.values())} chunks, "
+          f"{len(rebuilt)} refeitas{detail}{f', {retagged} chunks antigos marcados' if retagged else ''}, "
+          f"em {time.perf_counter() - start:.1f}s")
+    return output_dir
+
+
+def drop_global_indexes(persist_directory):
+    """Apaga o BM25 e a exportação de vetores globais: com as partições ninguém os lê.
+
+    Na cópia de trabalho de um snapshot eles são hardlinks; o publicado não é afetado.
+    """
+    path = os.path.join(persist_directory, LEXICAL_INDEX_FILENAME)
+    if os.path.exists(path):
+        os.remove(path)
+    shutil.rmtree(os.path.join(persist_directory, VECTOR_INDEX_DIRNAME), ignore_errors=True)
+
+
+class PartitionedSearcher:
+    """Busca híbrida só nas partições relevantes para a pergunta, em paralelo.
+
+    As partições vêm dos filtros informados (versões, tipos de fonte) ou, sem eles, do
+    que a pergunta cita; sem versão citada todas as versões são buscadas (a pergunta
+    pode ser sobre qualquer uma). A partição dos chunks sem versão entra sempre. Cada partição devolve os seus candidatos vetoriais e BM25;
+    os scores vetoriais são comparáveis entre partições (mesmo espaço de embeddings), os
+    do BM25 só aproximadamente (cada partição tem o seu IDF), e as duas listas globais são
+    fundidas por RRF, como no `HybridSearcher`. Com uma categoria de
+    objeto, os chunks dela passam à frente dos demais candidatos.
+    """
+
+    def __init__(self, vectorstore, partitions, catalog, k=3, candidates=20, rrf_k=60, workers=FANOUT_WORKERS):
+        self.vectorstore = vectorstore
+        self.partitions = partitions
+        self.catalog = catalog
+        self.k = k
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        # Compatibilidade com o HybridSearcher (o app mostra os índices únicos quando existem)
+        self.vector_index = None
+        self.lexical_index = None
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    @classmethod
+    def load(cls, vectorstore, persist_directory, **kwargs):
+        """Abre as partições do índice (ou None se elas ainda não foram geradas)."""
+        root = current_version_dir(os.path.join(persist_directory, PARTITIONS_DIRNAME))
+        path = os.path.join(root, CATALOG_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            catalog = json.load(f)
+        partitions = {}
+        for name in catalog["partitions"]:
+            partition_dir = os.path.join(root, name)
+            partitions[name] = (MemmapVectorIndex.load(partition_dir), LexicalIndex.load(partition_dir))
+        return cls(vectorstore, partitions, catalog, **kwargs)
+
+    @property
+    def index_version(self):
+        return self.catalog.get("index_version")
+
+    @property
+    def versions(self):
+        found = {entry["version"] for entry in self.catalog["partitions"].values()} - {ANY_VERSION}
+        return sorted(found, key=_version_key, reverse=True)
+
+    @property
+    def source_types(self):
+        return sorted({entry["source_type"] for entry in self.catalog["partitions"].values()})
+
+    def stats(self):
+        return {
+            "partitions": len(self.partitions),
+            "chunks": sum(entry["chunks"] for entry in self.catalog["partitions"].values()),
+            "versions": self.versions,
+        }
+
+    def needs_embedding(self, question):
+        """False quando a pergunta pode ser respondida só pela busca lexical."""
+        return not any(lexical and lexical.is_identifier_query(question) for _, lexical in self.partitions.values())
+
+    def select(self, question, versions=None, source_types=None):
+        """Nomes das partições a buscar para a pergunta."""
+        inferred = infer_filters(question)
+        versions = versions or inferred["versions"]
+        source_types = source_types or inferred["source_types"] or self.source_types
+        wanted = set(versions) | {ANY_VERSION} if versions else None
+        selected = [name for name, entry in self.catalog["partitions"].items()
+                    if (wanted is None or entry["version"] in wanted) and entry["source_type"] in source_types]
+        # Versão citada que não existe no índice: melhor buscar em tudo do que em nada
+        return selected or list(self.partitions)
+
+    def _search_partition(self, name, question, query_vector, candidates):
+        vector_index, lexical_index = self.partitions[name]
+        dense, sparse, timings = [], [], {}
+        if query_vector is not None and vector_index is not None:
+            start = time.perf_counter()
+            dense = vector_index.search(query_vector, candidates)
+            timings["vector_ms"] = (time.perf_counter() - start) * 1000
+        if lexical_index is not None:
+            start = time.perf_counter()
+            sparse = lexical_index.search(question, candidates)
+            timings["lexical_ms"] = (time.perf_counter() - start) * 1000
+        return name, dense, sparse, timings
+
+    def _documents(self, ids, owner):
+        by_partition = {}
+        for chunk_id in ids:
+            by_partition.setdefault(owner[chunk_id], []).append(chunk_id)
+        found = {}
+        for name, partition_ids in by_partition.items():
+            vector_index = self.partitions[name][0]
+            if vector_index is not None:
+                found.update(vector_index.get_documents(partition_ids))
+        return found
+
+    def search(self, question, query_vector=None, k=None, versions=None, source_types=None, category=None):
+        """Retorna (documents, timings) das partições selecionadas, como o `HybridSearcher`.
+
+        `timings` traz também as partições buscadas (`partition_names`).
+        """
+        k = k or self.k
+        candidates = max(self.candidates, k)
+        start = time.perf_counter()
+        names = self.select(question, versions, source_types)
+        results = list(self._pool.map(
+            lambda name: self._search_partition(name, question, query_vector, candidates), names))
+
+        owner, dense, sparse = {}, [], []
+        timings = {"partitions": len(names)}
+        for name, partition_dense, partition_sparse, partition_timings in results:
+            for chunk_id, _ in partition_dense + partition_sparse:
+                owner[chunk_id] = name
+            dense.extend(partition_dense)
+            sparse.extend(partition_sparse)
+            # As partições rodam em paralelo: vale a mais lenta
+            for key, value in partition_timings.items():
+                timings[key] = max(timings.get(key, 0.0), value)
+        rankings = [[chunk_id for chunk_id, _ in sorted(hits, key=lambda hit: hit[1], reverse=True)[:candidates]]
+                    for hits in (dense, sparse) if hits]
+        ranked = reciprocal_rank_fusion(rankings, self.rrf_k) if rankings else []
+
+        category = category or infer_filters(question)["category"]
+        if category:
+            found = self._documents(ranked, owner)
+            ranked = sorted((chunk_id for chunk_id in ranked if chunk_id in found),
+                            key=lambda chunk_id: found[chunk_id].metadata.get("object_category") != category)[:k]
+        else:
+            ranked = ranked[:k]
+            found = self._documents(ranked, owner)
+        timings["fanout_ms"] = (time.perf_counter() - start) * 1000
+        timings["partition_names"] = names
+        return [found[chunk_id] for chunk_id in ranked if chunk_id in found], timings
+
+    def warm(self):
+        for vector_index, _ in self.partitions.values():
+            if vector_index is not None:
+                vector_index.warm()
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        for vector_index, _ in self.partitions.values():
+            if vector_index is not None:
+                vector_index.close()
@@ -0,0 +1,308 @@
+import os
+import time
+import queue
+import threading
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from pypdf import PdfReader
+from langchain_core.documents import Document
+from chunker import STRUCTURE, MAX_CHARS, make_splitter
+from embedding_scheduler import DEFAULT_WORKERS, MAX_BATCH_TEXTS
+from manifest import make_chunk_ids
+from partitions import ANY_VERSION, tag_chunks
+from tracing import tracer
+
+
+# Quantas páginas cada tarefa do pool processa (limita a memória de PDFs muito grandes)
+PAGES_PER_UNIT = 20
+# Quantos chunks vão ao Chroma por escrita (os lotes enviados ao modelo de
+# embeddings são definidos pelo BatchedEmbeddings, quando usado)
+EMBED_BATCH_SIZE = 100
+# Chunks reunidos por chamada de `embed_documents`: as unidades já prontas na fila vão
+# juntas, para que o BatchedEmbeddings tenha lotes para enviar em paralelo
+EMBED_GROUP_CHUNKS = DEFAULT_WORKERS * MAX_BATCH_TEXTS
+# Tamanho máximo das filas entre os estágios (backpressure)
+QUEUE_SIZE = 4
+
+# Hash gravado no manifesto para um PDF que falhou depois de ter os chunks antigos
+# apagados: nunca coincide com o do arquivo, então a próxima ingestão o processa de novo
+FAILED_HASH = "failed"
+
+_DONE = object()
+
+
+class StageStats:
+    """Mede itens processados e tempo ativo de um estágio do pipeline."""
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+
+    def add(self, items, seconds):
+        if self.started is None:
+            self.started = time.perf_counter() - seconds
+        self.items += items
+        self.busy += seconds
+        self.finished = time.perf_counter()
+
+    def rate(self):
+        """Vazão do estágio considerando o tempo de parede desde o primeiro item."""
+        if self.started is None or self.finished <= self.started:
+            return 0.0
+        return self.items / (self.finished - self.started)
+
+    def summary(self):
+        return f"{self.name}: {self.items} {self.unit} em {self.busy:.1f}s ativos ({self.rate():.1f} {self.unit}/s)"
+
+
+def _plan_units(pdf_hashes):
+    """Divide cada PDF em intervalos de páginas (unidades de trabalho do pool)."""
+    units = []
+    for pdf_path, content_hash in pdf_hashes.items():
+        try:
+            total_pages = len(PdfReader(pdf_path).pages)
+        except Exception as e:
+            print(f" !! ERRO ao abrir {pdf_path}: {e}")
+            continue
+        # PDFs sem páginas geram uma unidade vazia para que o manifesto seja atualizado
+        for start in range(0, max(total_pages, 1), PAGES_PER_UNIT):
+            end = min(start + PAGES_PER_UNIT, total_pages)
+            units.append((pdf_path, content_hash, start, end, total_pages))
+    return units
+
+
+def parse_and_split(pdf_path, start, end, total_pages, chunk_size, chunk_overlap, splitter=STRUCTURE,
+                    version=ANY_VERSION):
+    """Executado em um processo do pool: extrai o texto de um intervalo de páginas, segmenta e marca a partição."""
+    reader = PdfReader(pdf_path)
+    pages = []
+    for page_number in range(start, end):
+        pages.append(Document(
+            page_content=reader.pages[page_number].extract_text() or "",
+            metadata={"source": pdf_path, "page": page_number, "total_pages": total_pages},
+        ))
+    return tag_chunks(make_splitter(splitter, chunk_size, chunk_overlap).split_documents(pages), "pdf", version)
+
+
+def _timed_parse_and_split(*args):
+    """`parse_and_split` com o tempo medido no próprio processo (sem a espera na fila do pool)."""
+    start = time.perf_counter()
+    chunks = parse_and_split(*args)
+    return chunks, time.perf_counter() - start
+
+
+def run_pdf_pipeline(pdf_hashes, vectorstore, manifest, embeddings, workers=None,
+                     chunk_size=MAX_CHARS, chunk_overlap=0, journal=None, dedup=None, splitter=STRUCTURE,
+                     versions=None):
+    """Ingestão em streaming: parse/split em processos -> embeddings -> escrita no Chroma.
+
+    As filas limitadas entre os estágios fazem o parse esperar quando o modelo de
+    embeddings ou o Chroma estão mais lentos, mantendo a memória estável
+    independentemente do número de manuais em docs/. Com `journal` (IngestJournal)
+    cada etapa é registrada e o manifesto é salvo periodicamente (checkpoints). Com
+    `dedup` (NearDuplicateFilter) chunks quase idênticos a outros do mesmo intervalo de
+    páginas não são vetorizados.
+    `versions` ({caminho: versão do GeneXus}) define a partição dos chunks de cada PDF.
+    """
+    workers = workers or os.cpu_count() or 1
+    versions = versions or {}
+    units = _plan_units(pdf_hashes)
+    remaining_units = {}
+    for pdf_path, *_ in units:
+        remaining_units[pdf_path] = remaining_units.get(pdf_path, 0) + 1
+
+    parse_stats = StageStats("Parse/split", "páginas")
+    embed_stats = StageStats("Embeddings", "chunks")
+    write_stats = StageStats("Escrita no Chroma", "chunks")
+
+    chunk_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    write_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    failed_sources = set()
+    errors = []
+
+    def next_group():
+        """Espera a próxima unidade e junta as que já estão na fila, até EMBED_GROUP_CHUNKS chunks.
+
+        Retorna (unidades, fim); `fim` indica que o parse terminou.
+        """
+        item = chunk_queue.get()
+        if item is _DONE:
+            return [], True
+        group, total = [item], len(item[1])
+        while total < EMBED_GROUP_CHUNKS:
+            try:
+                item = chunk_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return group, True
+            group.append(item)
+            total += len(item[1])
+        return group, False
+
+    def embed_group(group):
+        if dedup is not None:
+            # Único consumidor da fila: o filtro é usado sempre pela mesma thread, e cada
+            # unidade (intervalo de páginas) é filtrada separadamente
+            with tracer.span("dedup", chunks=sum(len(chunks) for _, chunks in group)):
+                group = [(unit, dedup.filter(chunks)) for unit, chunks in group]
+        texts = [c.page_content for _, chunks in group for c in chunks]
+        vectors = []
+        if texts:
+            # Várias unidades de uma vez: o agendador paraleliza os lotes dentro da cota
+            t0 = time.perf_counter()
+            with tracer.span("embed", chunks=len(texts), units=len(group)):
+                vectors = embeddings.embed_documents(texts)
+            embed_stats.add(len(texts), time.perf_counter() - t0)
+        offset = 0
+        for unit, chunks in group:
+            unit_vectors = vectors[offset:offset + len(chunks)]
+            offset += len(chunks)
+            if not chunks:
+                write_queue.put((unit, 0, [], [], True))
+                continue
+            if journal:
+                journal.append("embedded", source=unit[0], pages=[unit[2], unit[3]], chunks=len(chunks))
+            for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+                last = start + EMBED_BATCH_SIZE >= len(chunks)
+                write_queue.put((unit, start, chunks[start:start + EMBED_BATCH_SIZE],
+                                 unit_vectors[start:start + EMBED_BATCH_SIZE], last))
+
+    def embed_stage():
+        finished = False
+        while not finished:
+            group, finished = next_group()
+            if errors or not group:
+                # Após uma falha, apenas drena a fila para não travar o estágio anterior
+                continue
+            try:
+                embed_group(group)
+            except Exception as e:
+                errors.append(e)
+        write_queue.put(_DONE)
+
+    # Fontes cujos chunks antigos já foram apagados nesta execução
+    cleared = set()
+    produced_ids = {}
+
+    def write_batch(unit, offset, batch, vectors, last):
+        pdf_path, content_hash, unit_start, _, _ = unit
+        if pdf_path in failed_sources:
+            # Outro intervalo do PDF falhou: nada mais dele é gravado (os chunks antigos
+            # ficam, se ainda não foram apagados)
+            return
+        t0 = time.perf_counter()
+        if pdf_path not in cleared:
+            old_ids = manifest.chunk_ids(pdf_path)
+            if old_ids:
+                vectorstore.delete(ids=old_ids)
+            else:
+                vectorstore.delete(where={"source": pdf_path})
+            cleared.add(pdf_path)
+        if batch:
+            # O intervalo de páginas entra no ID para que ele seja estável entre execuções
+            ids = make_chunk_ids(pdf_path, content_hash, len(batch), start=offset, part=f"p{unit_start}")
+            for i, chunk in enumerate(batch):
+                chunk.metadata["chunk_index"] = offset + i
+            vectorstore._collection.upsert(
+                ids=ids,
+                embeddings=vectors,
+                metadatas=[chunk.metadata for chunk in batch],
+                documents=[chunk.page_content for chunk in batch],
+            )
+            produced_ids.setdefault(pdf_path, []).extend(ids)
+        write_stats.add(len(batch), time.perf_counter() - t0)
+        if last:
+            remaining_units[pdf_path] -= 1
+            if remaining_units[pdf_path] == 0 and pdf_path not in failed_sources:
+                manifest.record(pdf_path, "pdf", content_hash, produced_ids.get(pdf_path, []))
+                print(f" -> {pdf_path}: {len(produced_ids.get(pdf_path, []))} chunks indexados")
+                if journal:
+                    journal.commit(pdf_path, content_hash, produced_ids.get(pdf_path, []))
+                    journal.maybe_checkpoint(manifest, vectorstore)
+
+    def write_stage():
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                break
+            if errors:
+                continue
+            try:
+                with tracer.span("chroma_write", chunks=len(item[2])):
+                    write_batch(*item)
+            except Exception as e:
+                errors.append(e)
+
+    # As threads herdam a etapa atual do rastreamento (as etapas delas entram no mesmo trace)
+    embed_thread = threading.Thread(target=contextvars.copy_context().run, args=(embed_stage,), daemon=True)
+    write_thread = threading.Thread(target=contextvars.copy_context().run, args=(write_stage,), daemon=True)
+    embed_thread.start()
+    write_thread.start()
+
+    print(f"Pipeline: {len(units)} intervalos de páginas em {len(pdf_hashes)} PDFs, {workers} processos.")
+    pending_units = list(reversed(units))
+    in_flight = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while (pending_units or in_flight) and not errors:
+                # No máximo 2 tarefas por processo em andamento: o resto espera na lista
+                while pending_units and len(in_flight) < workers * 2:
+                    unit = pending_units.pop()
+                    pdf_path, _, start, end, total_pages = unit
+                    future = pool.submit(_timed_parse_and_split, pdf_path, start, end, total_pages,
+                                         chunk_size, chunk_overlap, splitter,
+                                         versions.get(pdf_path, ANY_VERSION))
+                    in_flight[future] = (unit, time.perf_counter())
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    unit, submitted = in_flight.pop(future)
+                    pdf_path, _, start, end, _ = unit
+                    try:
+                        chunks, seconds = future.result()
+                    except Exception as e:
+                        print(f" !! ERRO ao processar {pdf_path} (páginas {start + 1}-{end}): {e}")
+                        failed_sources.add(pdf_path)
+                        chunks, seconds = [], time.perf_counter() - submitted
+                    parse_stats.add(end - start, seconds)
+                    # O parse roda em outro processo, fora do rastreamento: registra o tempo
+                    # medido lá (a espera na fila do pool não conta como parse)
+                    tracer.record("parse_split", seconds, pages=end - start, chunks=len(chunks))
+                    if journal:
+                        journal.append("chunks", source=pdf_path, pages=[start, end], chunks=len(chunks))
+                    # Bloqueia se os estágios seguintes estiverem atrasados (backpressure)
+                    chunk_queue.put((unit, chunks))
+    finally:
+        chunk_queue.put(_DONE)
+        embed_thread.join()
+        write_thread.join()
+
+    if errors:
+        raise errors[0]
+
+    # PDFs com um intervalo de páginas que falhou depois que os chunks antigos foram apagados:
+    # os novos já gravados saem do índice (o documento não fica pela metade) e o manifesto
+    # registra o PDF sem chunks e com um hash que força o reprocessamento na próxima execução
+    for pdf_path in sorted(failed_sources & cleared):
+        partial_ids = produced_ids.pop(pdf_path, [])
+        if partial_ids:
+            vectorstore.delete(ids=partial_ids)
+        manifest.record(pdf_path, "pdf", FAILED_HASH, [])
+        print(f" !! {pdf_path}: {len(partial_ids)} chunks gravados antes da falha foram removidos; "
+              f"o PDF será processado de novo na próxima ingestão")
+
+    print("Vazão por estágio:")
+    for stats in (parse_stats, embed_stats, write_stats):
+        print(f"   {stats.summary()}")
+    return {
+        "pages": parse_stats.items,
+        "chunks": write_stats.items,
+        "failed_sources": sorted(failed_sources),
+        "pages_per_second": parse_stats.rate(),
+        "chunks_per_second": embed_stats.rate(),
+    }
@@ -0,0 +1,121 @@
+from operator import itemgetter
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langchain_core.output_parsers import StrOutputParser
+from tracing import tracer, RagTracingHandler
+
+
+# Modelo de geração usado pelo assistente
+LLM_MODEL = "gemini-2.5-flash"
+LLM_TEMPERATURE = 0.1
+
+# O Prompt Template é a otimização crucial para especializar o LLM
+PROMPT_TEMPLATE_OLD = """
+Você é um assistente de programação **perito em GeneXus**. Sua função é auxiliar o desenvolvedor a escrever código, modelar objetos e entender conceitos GeneXus.
+**Seu foco deve ser na sintaxe e nos objetos GeneXus (Transactions, Data Providers, Procedures, Web Panels) e não em linguagens de programação subjacentes (Java, C#, etc.).**
+
+**INSTRUÇÕES:**
+1.  Use **APENAS** as informações contidas no 'CONTEXTO' abaixo para formular sua resposta.
+2.  Responda de forma clara e técnica.
+3.  Quando gerar código GeneXus, use blocos de código (` ``` `) e especifique o tipo (ex: ` ```genexus` ou ` ```sql`).
+4.  Se o contexto não for suficiente, diga educadamente que, com a sua base de conhecimento atual, você não pode responder à pergunta específica sobre GeneXus.
+5.  Mantenha a resposta focada no tema GeneXus.
+
+CONTEXTO:
+{context}
+
+PERGUNTA DO USUÁRIO: {question}
+"""
+
+PROMPT_TEMPLATE_OTIMIZED = """
+Você é o **GeneXus Code Assistant**, um especialista sênior em GeneXus (todas as versões) e engenharia de software Low-Code.
+Sua missão é fornecer soluções completas, robustas e que sigam as **melhores práticas de modelagem e programação GeneXus**.
+
+**DIRETRIZES DE CÓDIGO E RESPOSTA:**
+1.  **Prioridade GeneXus:** Sempre que a pergunta for sobre implementação ou sintaxe, priorize a criação de código **EXCLUSIVAMENTE em sintaxe GeneXus**.
+2.  **Formato:** O código GeneXus deve ser envolto em blocos de código (` ```genexus`) para clareza. Para regras SQL/Data Selectors, use (` ```sql`).
+3.  **Melhores Práticas:** Se o contexto recuperado mencionar otimizações (ex: uso de For Each com condições *inferred*, minimização de acessos a banco de dados), **integre-as** na sua sugestão de código.
+4.  **Estrita Fidelidade ao Contexto (RAG):** Sua resposta deve ser **inteiramente baseada no 'CONTEXTO'** fornecido. Não invente ou combine informações de conhecimento geral.
+5.  **Rejeição Inteligente:** Se o contexto for insuficiente ou irrelevante, recuse-se a responder, informando que a base de conhecimento (documentação) não cobre o tópico.
+6.  **Foco em Objeto:** Para requisições de modelagem (ex: 'criar um Data Provider'), entregue o código completo da estrutura do objeto.
+
+CONTEXTO (Documentação GeneXus e Tutoriais):
+{context}
+
+PERGUNTA DO USUÁRIO: {question}
+"""
+
+PROMPT_TEMPLATE = """
+Você é o **GeneXus Code Assistant**, um especialista sênior em GeneXus. Sua missão é fornecer soluções completas e robustas, seguindo as melhores práticas.
+
+**DIRETRIZES DE CÓDIGO E RESPOSTA:**
+1.  **Prioridade GeneXus:** Sempre gere código **EXCLUSIVAMENTE em sintaxe GeneXus**. Use blocos de código (` ```genexus`).
+2.  **Foco em Dados Estruturados:** Priorize informações encontradas em **tabelas, listas de propriedades e definições de sintaxe** dentro do 'CONTEXTO'. Estes dados textuais são a sua fonte de verdade, compensando a ausência de diagramas visuais.
+3.  **Inferência Contextual:** Se o 'CONTEXTO' descrever um processo ou fluxo de dados (que pode ter sido originalmente um diagrama), **infira o fluxo lógico** e traduza-o para a sintaxe GeneXus correta (ex: *parâmetros, comandos de Procedure*).
+4.  **Estrita Fidelidade ao Contexto (RAG):** Sua resposta deve ser **inteiramente baseada no 'CONTEXTO'** fornecido.
+5.  **Rejeição Inteligente:** Se o contexto for insuficiente, recuse-se a responder.
+6.  **Idioma: Deve interpretar todos os idiomas que conhece mas a resposta deve ser sempre em PT-BR ou no idioma fornecido.
+
+CONTEXTO (Documentação GeneXus e Tutoriais):
+{context}
+
+PERGUNTA DO USUÁRIO: {question}
+"""
+
+
+def format_docs(docs):
+    """Formata os documentos recuperados em uma string simples."""
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def build_llm():
+    """Configura o LLM (Gemini) com streaming de tokens."""
+    return ChatGoogleGenerativeAI(model=LLM_MODEL, temperature=LLM_TEMPERATURE)
+
+
+def build_rag_chain(searcher, llm, prompt_template=PROMPT_TEMPLATE, context_builder=None):
+    """Cria a Cadeia RAG (LangChain Expression Language - LCEL).
+
+    Entrada: {"question": ..., "query_vector": ..., "filters": ...}. O embedding da pergunta vem
+    calculado de fora para ser reaproveitado (cache de respostas + busca no ChromaDB);
+    com `query_vector` None a busca é só lexical (BM25) no `HybridSearcher`. Os `filters`
+    opcionais (versions, source_types, category) vão para o `PartitionedSearcher`.
+    Com `context_builder` (ContextBuilder) a busca traz mais candidatos e o CONTEXTO é
+    montado por MMR dentro do orçamento de tokens; sem ele, os `k` chunks vão inteiros.
+    Com `stats` (dict da própria pergunta) a busca grava nele os tempos (`search`) e as
+    métricas do contexto (`context`), para a legenda do app.
+    Suporta `invoke` e `stream` (tokens da resposta à medida que são gerados).
+    Com o rastreamento ligado (tracing.py), busca, montagem do contexto e LLM viram etapas do trace.
+    """
+    prompt = ChatPromptTemplate.from_template(prompt_template)
+
+    def retrieve(inputs):
+        """Busca híbrida (vetorial + BM25) com o embedding da pergunta já calculado."""
+        k = context_builder.candidates if context_builder is not None else None
+        with tracer.span("search") as span:
+            docs, timings = searcher.search(inputs["question"], inputs.get("query_vector"), k=k,
+                                            **(inputs.get("filters") or {}))
+            span.set(chunks=len(docs), **timings)
+        stats = inputs.get("stats")
+        if stats is not None:
+            stats["search"] = timings
+        if context_builder is None:
+            return format_docs(docs)
+        with tracer.span("context_build") as span:
+            context, context_stats = context_builder.build(docs)
+            span.set(**context_stats)
+        if stats is not None:
+            stats["context"] = context_stats
+        return context
+
+    # O pipe RAG: Contexto -> Prompt -> LLM -> Resposta
+    chain = (
+        {"context": RunnableLambda(retrieve), "question": itemgetter("question")}
+        | prompt
+        | llm
+        | StrOutputParser()
+    )
+    if tracer.enabled:
+        chain = chain.with_config(callbacks=[RagTracingHandler(tracer)])
+    return chain
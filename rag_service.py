@@ -0,0 +1,526 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import inspect
+import argparse
+import tempfile
+
+import numpy as np
+import requests
+from aiohttp import web, ClientSession, ClientTimeout
+
+from rag import build_llm, build_rag_chain
+from answer_cache import SemanticAnswerCache
+from manifest import read_index_version
+from lexical_index import LexicalIndex, HybridSearcher
+from vector_export import MemmapVectorIndex
+from partitions import PartitionedSearcher
+from snapshots import INDEX_ROOT, POLL_SECONDS, LiveIndex, close_vectorstore
+from context_builder import ContextBuilder
+from rate_limit import retry_with_backoff
+from tracing import tracer, TRACING_ENV
+
+
+# Serviço HTTP de consultas: o mesmo rag_chain do app, compartilhado por todos os clientes
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Perguntas que chegam dentro dessa janela vão ao modelo de embeddings na mesma chamada
+EMBED_BATCH_WAIT_MS = 10
+EMBED_MAX_BATCH = 32
+# Respostas sendo geradas ao mesmo tempo pelo Gemini (as demais esperam na fila)
+LLM_CONCURRENCY = 4
+REQUEST_TIMEOUT = 120
+
+
+class QueryEmbeddingBatcher:
+    """Agrupa os embeddings de perguntas de requisições concorrentes em uma só chamada.
+
+    Cada `embed` espera no máximo `max_wait` segundos pelas perguntas seguintes (ou até
+    juntar `max_batch`); o lote vai ao modelo em uma thread, fora do event loop.
+    """
+
+    def __init__(self, embeddings, max_batch=EMBED_MAX_BATCH, max_wait=EMBED_BATCH_WAIT_MS / 1000):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        # O GoogleGenerativeAIEmbeddings vetoriza perguntas em lote com task_type=retrieval_query
+        self._task_type = "task_type" in inspect.signature(embeddings.embed_documents).parameters
+        self.batches = 0
+        self.texts = 0
+        self.largest_batch = 0
+
+    async def embed(self, text):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _embed_queries(self, texts):
+        if len(texts) == 1:
+            return [self.embeddings.embed_query(texts[0])]
+        if self._task_type:
+            return self.embeddings.embed_documents(texts, task_type="retrieval_query")
+        return self.embeddings.embed_documents(texts)
+
+    async def _run(self, batch):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batches += 1
+        self.texts += len(texts)
+        self.largest_batch = max(self.largest_batch, len(texts))
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: retry_with_backoff(lambda: self._embed_queries(texts)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "largest_batch": self.largest_batch,
+            "mean_batch": (self.texts / self.batches) if self.batches else 0.0,
+        }
+
+
+class _Answer:
+    """Resposta em andamento: os tokens ficam guardados e cada ouvinte os lê desde o início."""
+
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.cached = False
+        self.task = None
+        self._event = asyncio.Event()
+
+    def push(self, token):
+        self.tokens.append(token)
+        self._wake()
+
+    def finish(self, error=None):
+        self.error = error
+        self.done = True
+        self._wake()
+
+    def _wake(self):
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def stream(self):
+        position = 0
+        while True:
+            while position < len(self.tokens):
+                yield self.tokens[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._event.wait()
+
+
+class ServiceIndex:
+    """ChromaDB, busca e cadeia RAG de um snapshot do índice, abertos e aquecidos juntos.
+
+    Aberto pela thread do LiveIndex quando uma ingestão publica um snapshot novo, fora
+    do caminho das perguntas (como o AppIndex do app.py).
+    """
+
+    def __init__(self, path, embeddings, llm, context_builder=None):
+        from langchain_community.vectorstores import Chroma
+
+        self.path = path
+        self.version = read_index_version(path)
+        self.vectorstore = Chroma(persist_directory=path, embedding_function=embeddings)
+        self.searcher = self._open_searcher()
+        self.searcher.warm()
+        self.rag_chain = build_rag_chain(self.searcher, llm, context_builder=context_builder)
+
+    def _open_searcher(self):
+        # As partições de cada pergunta vêm do que ela cita (versão, tipo de fonte)
+        partitioned = PartitionedSearcher.load(self.vectorstore, self.path, k=3)
+        if partitioned is not None and partitioned.index_version == self.version:
+            return partitioned
+        if partitioned is not None:
+            partitioned.close()
+        lexical_index = LexicalIndex.load(self.path)
+        vector_index = MemmapVectorIndex.load(self.path)
+        if vector_index is not None and vector_index.index_version != self.version:
+            vector_index.close()
+            vector_index = None
+        return HybridSearcher(self.vectorstore, lexical_index, k=3, vector_index=vector_index)
+
+    def close(self):
+        self.searcher.close()
+        close_vectorstore(self.vectorstore)
+
+
+class RagService:
+    """Camada assíncrona sobre o rag_chain: cache de respostas, embeddings em micro-lotes,
+    coalescência de perguntas idênticas em andamento e limite de chamadas simultâneas ao LLM.
+
+    `live_index` (LiveIndex de ServiceIndex) troca o snapshot a quente: cada pergunta usa
+    o que estava publicado quando começou, do início ao fim.
+    """
+
+    def __init__(self, live_index, embeddings, answer_cache=None, llm_concurrency=LLM_CONCURRENCY,
+                 embed_max_batch=EMBED_MAX_BATCH, embed_wait_ms=EMBED_BATCH_WAIT_MS, coalesce=True):
+        self.live_index = live_index
+        self.answer_cache = answer_cache if answer_cache is not None else SemanticAnswerCache()
+        self.coalesce = coalesce
+        self.batcher = QueryEmbeddingBatcher(embeddings, embed_max_batch, embed_wait_ms / 1000)
+        self.llm_concurrency = llm_concurrency
+        self._llm_slots = asyncio.Semaphore(llm_concurrency)
+        self._in_flight = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self.llm_waiting = 0
+
+    def answer(self, question):
+        """Retorna (resposta em andamento, coalescida?); perguntas idênticas compartilham a geração."""
+        self.requests += 1
+        key = SemanticAnswerCache.normalize_question(question)
+        existing = self._in_flight.get(key) if self.coalesce else None
+        if existing is not None:
+            self.coalesced += 1
+            return existing, True
+        answer = _Answer()
+        if self.coalesce:
+            self._in_flight[key] = answer
+        answer.task = asyncio.ensure_future(self._produce(question, key, answer))
+        return answer, False
+
+    async def _produce(self, question, key, answer):
+        error = None
+        try:
+            # Cada pergunta produzida (não as coalescidas) vira um trace "query", se o rastreamento estiver ligado
+            with self.live_index.use() as index, tracer.trace("query", service=True) as query_span:
+                index_version = index.version
+                with tracer.span("answer_cache", kind="text") as span:
+                    cached = self.answer_cache.lookup_text(question, index_version)
+                    span.set(cache_hit=bool(cached))
+                query_vector = None
+                if not cached and index.searcher.needs_embedding(question):
+                    with tracer.span("embed_query"):
+                        query_vector = await self.batcher.embed(question)
+                    with tracer.span("answer_cache", kind="semantic") as span:
+                        cached = self.answer_cache.lookup(query_vector, index_version)
+                        span.set(cache_hit=bool(cached))
+                if cached:
+                    self.cache_hits += 1
+                    answer.cached = True
+                    answer.push(cached["answer"])
+                    return
+                self.llm_waiting += 1
+                with tracer.span("llm_queue"):
+                    await self._llm_slots.acquire()
+                try:
+                    self.llm_waiting -= 1
+                    self.llm_calls += 1
+                    async for token in index.rag_chain.astream({"question": question, "query_vector": query_vector}):
+                        answer.push(token)
+                finally:
+                    self._llm_slots.release()
+                query_span.set(answer_chars=sum(len(token) for token in answer.tokens))
+                if query_vector is not None:
+                    self.answer_cache.store(query_vector, question, "".join(answer.tokens), index_version)
+        except Exception as e:
+            error = e
+        finally:
+            if self._in_flight.get(key) is answer:
+                del self._in_flight[key]
+            answer.finish(error)
+
+    def stats(self):
+        return {
+            "snapshot": self.live_index.name,
+            "index_version": self.live_index.current.version,
+            "snapshot_swaps": self.live_index.swaps,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "llm_calls": self.llm_calls,
+            "llm_concurrency": self.llm_concurrency,
+            "llm_waiting": self.llm_waiting,
+            "in_flight": len(self._in_flight),
+            "embeddings": self.batcher.stats(),
+            "answer_cache": self.answer_cache.stats(),
+        }
+
+
+# --- HTTP ---
+
+async def _question(request):
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = {}
+    question = str(payload.get("question") or "").strip()
+    if not question:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Informe a pergunta em 'question'."}),
+                                 content_type="application/json")
+    return question
+
+
+async def handle_query(request):
+    """POST /query {"question": ...} -> resposta completa em JSON."""
+    service = request.app["service"]
+    question = await _question(request)
+    start = time.perf_counter()
+    answer, coalesced = service.answer(question)
+    try:
+        text = "".join([token async for token in answer.stream()])
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=502)
+    return web.json_response({
+        "answer": text,
+        "cached": answer.cached,
+        "coalesced": coalesced,
+        "latency_ms": (time.perf_counter() - start) * 1000,
+    })
+
+
+async def handle_stream(request):
+    """POST /query/stream {"question": ...} -> tokens em texto puro, à medida que são gerados."""
+    service = request.app["service"]
+    question = await _question(request)
+    answer, coalesced = service.answer(question)
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/plain; charset=utf-8",
+        "X-Coalesced": "1" if coalesced else "0",
+    })
+    await response.prepare(request)
+    try:
+        async for token in answer.stream():
+            await response.write(token.encode("utf-8"))
+    except Exception as e:
+        # O status já foi enviado: o erro vai no fim do corpo
+        await response.write(f"\n\n[erro no serviço: {e}]".encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+async def handle_stats(request):
+    return web.json_response(request.app["service"].stats())
+
+
+async def handle_metrics(request):
+    """GET /metrics -> métricas por etapa no formato do Prometheus (rastreamento ligado)."""
+    if not tracer.enabled:
+        raise web.HTTPNotFound(text=f"Rastreamento desligado: defina {TRACING_ENV}=1.")
+    return web.Response(text=tracer.prometheus_text(), content_type="text/plain", charset="utf-8")
+
+
+async def handle_health(request):
+    return web.json_response({"status": "ok"})
+
+
+def create_app(service):
+    app = web.Application()
+    app["service"] = service
+    app.router.add_post("/query", handle_query)
+    app.router.add_post("/query/stream", handle_stream)
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/health", handle_health)
+    return app
+
+
+# --- Backends ---
+
+def build_backends(root=INDEX_ROOT, poll_seconds=POLL_SECONDS):
+    """Backends reais (Gemini + ChromaDB + BM25) sobre o snapshot publicado em `root`.
+
+    Retorna (LiveIndex, embeddings das perguntas, diretório temporário a apagar no fim).
+    """
+    from dotenv import load_dotenv
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    load_dotenv("keys.env")
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("A chave GEMINI_API_KEY não foi carregada. Verifique seu arquivo keys.env.")
+    embeddings = GoogleGenerativeAIEmbeddings(model="text-embedding-004", google_api_key=api_key)
+    llm, context_builder = build_llm(), ContextBuilder()
+    # Uma thread verifica o CURRENT e abre/aquece o snapshot novo em segundo plano
+    live_index = LiveIndex(lambda path: ServiceIndex(path, embeddings, llm, context_builder), root, poll_seconds)
+    return live_index, embeddings, None
+
+
+def build_stub_backends(articles=200, embed_latency=0.05, llm_first_token=0.2, llm_token=0.01, seed=0,
+                        poll_seconds=POLL_SECONDS):
+    """Backends falsos sobre o corpus sintético, para testes de carga sem rede.
+
+    Retorna (LiveIndex, embeddings das perguntas, diretório temporário a apagar no fim).
+    """
+    from langchain_community.vectorstores import Chroma
+    from langchain_core.documents import Document
+    from fakes import FakeEmbeddings, FakeChatModel
+    from synthetic_corpus import generate_articles, article_text
+    from chunker import StructureAwareSplitter
+    from lexical_index import build_lexical_index
+
+    work_dir = tempfile.mkdtemp(prefix="genexus-service-")
+    root = os.path.join(work_dir, "chroma_db")
+    vectorstore = Chroma(persist_directory=root, embedding_function=FakeEmbeddings())
+    documents = [Document(page_content=article_text(article), metadata={"source": article["id"]})
+                 for article in generate_articles(articles, seed=seed)]
+    chunks = StructureAwareSplitter().split_documents(documents)
+    ids = [f"{chunk.metadata['source']}-{i}" for i, chunk in enumerate(chunks)]
+    vectorstore.add_documents(chunks, ids=ids)
+    build_lexical_index(vectorstore, root)
+    close_vectorstore(vectorstore)
+    llm = FakeChatModel(first_token_latency=llm_first_token, token_latency=llm_token)
+    live_index = LiveIndex(lambda path: ServiceIndex(path, FakeEmbeddings(), llm, ContextBuilder()), root,
+                           poll_seconds)
+    return live_index, FakeEmbeddings(latency=embed_latency), work_dir
+
+
+# --- Cliente (usado pelo app.py) ---
+
+def stream_answer(url, question, timeout=REQUEST_TIMEOUT):
+    """Gera os pedaços da resposta do serviço (para o `st.write_stream` do app)."""
+    with requests.post(url.rstrip("/") + "/query/stream", json={"question": question},
+                       stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        for piece in response.iter_content(chunk_size=None, decode_unicode=True):
+            if piece:
+                yield piece
+
+
+def service_stats(url, timeout=5):
+    response = requests.get(url.rstrip("/") + "/stats", timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+# --- Teste de carga ---
+
+async def load_test(url, questions, total=200, concurrency=50):
+    """Dispara `total` perguntas (com `concurrency` simultâneas) e mede a latência no cliente."""
+    latencies, errors = [], 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(session, question):
+        nonlocal errors
+        async with slots:
+            start = time.perf_counter()
+            try:
+                async with session.post(url + "/query", json={"question": question}) as response:
+                    await response.json()
+                    if response.status != 200:
+                        errors += 1
+                        return
+            except Exception:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    async with ClientSession(timeout=ClientTimeout(total=REQUEST_TIMEOUT)) as session:
+        await asyncio.gather(*(one(session, questions[i % len(questions)]) for i in range(total)))
+        seconds = time.perf_counter() - start
+        async with session.get(url + "/stats") as response:
+            stats = await response.json()
+    return {
+        "requests": total,
+        "errors": errors,
+        "seconds": seconds,
+        "requests_per_second": total / seconds if seconds else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "p95_ms": float(np.percentile(latencies, 95)) if latencies else 0.0,
+        "p99_ms": float(np.percentile(latencies, 99)) if latencies else 0.0,
+        "server": stats,
+    }
+
+
+async def _serve_and_load_test(backends, args, **service_options):
+    live_index, embeddings, _ = backends
+    service = RagService(live_index, embeddings, llm_concurrency=args.llm_concurrency, **service_options)
+    runner = web.AppRunner(create_app(service))
+    await runner.setup()
+    site = web.TCPSite(runner, DEFAULT_HOST, 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        from synthetic_corpus import generate_articles, labelled_queries
+        # Poucas perguntas distintas: várias chegam juntas, como vários usuários na mesma dúvida
+        questions = [query["question"] for query in labelled_queries(generate_articles(args.unique))]
+        return await load_test(f"http://{DEFAULT_HOST}:{port}", questions, args.requests, args.concurrency)
+    finally:
+        await runner.cleanup()
+
+
+def _print_load_test(name, result):
+    server = result["server"]
+    print(f"   {name}: {result['requests_per_second']:.1f} req/s · p50 {result['p50_ms']:.0f} ms · "
+          f"p95 {result['p95_ms']:.0f} ms · p99 {result['p99_ms']:.0f} ms · {result['errors']} erros")
+    print(f"      {server['embeddings']['batches']} chamadas de embedding "
+          f"(lote médio {server['embeddings']['mean_batch']:.1f}), {server['coalesced']} coalescidas, "
+          f"{server['cache_hits']} do cache, {server['llm_calls']} chamadas ao LLM")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serviço HTTP de consultas RAG (e teste de carga local).")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--persist-directory", default=INDEX_ROOT, help="raiz do índice (a do CURRENT)")
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_CONCURRENCY)
+    parser.add_argument("--stub", action="store_true", help="embeddings e LLM falsos sobre o corpus sintético")
+    parser.add_argument("--load-test", action="store_true",
+                        help="sobe o serviço, dispara as perguntas e compara com o atendimento uma a uma")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--unique", type=int, default=40, help="perguntas distintas no teste de carga")
+    args = parser.parse_args()
+
+    # O snapshot publicado fica marcado como em uso (a coleta de lixo não o apaga) e os
+    # publicados depois são abertos e trocados a quente, sem reiniciar o serviço
+    backends = build_stub_backends() if args.stub else build_backends(args.persist_directory)
+    print(f"Índice: snapshot {backends[0].name or '(layout antigo)'}")
+    try:
+        if args.load_test:
+            print(f"Teste de carga: {args.requests} perguntas ({args.unique} distintas), "
+                  f"{args.concurrency} simultâneas, {args.llm_concurrency} respostas do LLM em paralelo")
+            # Referência: sem micro-lotes nem coalescência (cada pergunta faz sua própria chamada)
+            baseline = asyncio.run(_serve_and_load_test(backends, args, embed_max_batch=1, coalesce=False))
+            result = asyncio.run(_serve_and_load_test(backends, args))
+            _print_load_test("Uma a uma", baseline)
+            _print_load_test("Serviço", result)
+        else:
+            service = RagService(*backends[:2], llm_concurrency=args.llm_concurrency)
+            print(f"Serviço de consultas em http://{args.host}:{args.port} (POST /query, /query/stream)")
+            web.run_app(create_app(service), host=args.host, port=args.port, print=None)
+    finally:
+        backends[0].close()
+        if backends[2]:
+            shutil.rmtree(backends[2], ignore_errors=True)
@@ -0,0 +1,83 @@
+import time
+import random
+import threading
+
+
+class TokenBucket:
+    """Limitador de taxa (token bucket) seguro para uso entre threads.
+
+    `rate` é a quantidade de tokens repostos por segundo e `capacity` o tamanho da
+    rajada permitida. `acquire()` bloqueia até haver tokens suficientes.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("A taxa do TokenBucket deve ser positiva.")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Consome os tokens se estiverem disponíveis agora; não bloqueia."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """Bloqueia até conseguir consumir `tokens`; retorna o tempo esperado em segundos."""
+        # Pedidos maiores que a capacidade nunca seriam atendidos: limita à capacidade
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def set_rate(self, rate):
+        """Altera a taxa em tempo de execução (ex: Crawl-delay do robots.txt)."""
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+
+
+# Códigos HTTP que indicam limite de taxa ou indisponibilidade temporária
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+_RETRYABLE_MARKERS = ("429", "RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "rate limit", "quota")
+
+
+def is_retryable(error):
+    """A falha é transitória (throttling, timeout, 5xx) e vale a pena tentar de novo?"""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    message = str(error)
+    return any(marker.lower() in message.lower() for marker in _RETRYABLE_MARKERS)
+
+
+def retry_with_backoff(func, retries=4, base_delay=1.0, max_delay=60.0, retryable=is_retryable):
+    """Executa `func()` e repete falhas transitórias com recuo exponencial e jitter."""
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= retries or not retryable(e):
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(delay * random.uniform(0.5, 1.0))
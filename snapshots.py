@@ -0,0 +1,496 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import argparse
+import threading
+from contextlib import contextmanager
+
+from ingest_journal import JOURNAL_FILENAME
+from manifest import MANIFEST_FILENAME, INDEX_VERSION_FILENAME
+from lexical_index import LEXICAL_INDEX_FILENAME
+from vector_export import POINTER_FILENAME, VECTOR_INDEX_DIRNAME, current_version_dir
+from partitions import PARTITIONS_DIRNAME
+
+
+# Snapshots do índice: cada ingestão monta uma cópia nova em `snapshots/` e a publica
+# trocando o ponteiro CURRENT (os.replace é atômico); a ingestão nunca grava no publicado
+INDEX_ROOT = "./chroma_db"
+CURRENT_FILENAME = "CURRENT"
+SNAPSHOTS_DIRNAME = "snapshots"
+SNAPSHOT_META_FILENAME = "snapshot.json"
+STAGING_PREFIX = "staging-"
+# Processos com um snapshot aberto deixam um arquivo em `leases/`, renovado periodicamente
+LEASES_DIRNAME = "leases"
+LEASE_REFRESH_SECONDS = 30
+LEASE_TTL_SECONDS = 5 * 60
+# Snapshots mantidos no disco: o atual e os anteriores mais recentes (para o rollback)
+KEEP_SNAPSHOTS = 3
+# Intervalo entre as verificações do ponteiro CURRENT pelo app
+POLL_SECONDS = 5
+# Trava exclusiva da publicação (verificação da base + rename + troca do CURRENT); uma
+# trava mais velha que PUBLISH_LOCK_STALE_SECONDS é de um processo que morreu no meio
+PUBLISH_LOCK_FILENAME = "CURRENT.lock"
+PUBLISH_LOCK_TIMEOUT = 60
+PUBLISH_LOCK_STALE_SECONDS = 5 * 60
+
+# Arquivos da raiz do índice que não entram na cópia (controle e metadados do snapshot)
+_COPY_IGNORED = {CURRENT_FILENAME, PUBLISH_LOCK_FILENAME, SNAPSHOTS_DIRNAME, LEASES_DIRNAME,
+                 SNAPSHOT_META_FILENAME}
+# Arquivos que a ingestão só troca inteiros (arquivo novo + os.replace) e as exportações
+# em diretórios versionados entram na cópia como hardlinks: nada é copiado e o snapshot
+# publicado continua intacto. O ChromaDB grava nos próprios arquivos e é sempre copiado
+# (`_clone_file`: sem custo de disco onde há reflink).
+_LINKED = {MANIFEST_FILENAME, INDEX_VERSION_FILENAME, LEXICAL_INDEX_FILENAME, VECTOR_INDEX_DIRNAME,
+           PARTITIONS_DIRNAME}
+
+
+def current_name(root=INDEX_ROOT):
+    """Nome do snapshot publicado (ou None no layout antigo, com o ChromaDB direto na raiz)."""
+    try:
+        with open(os.path.join(root, CURRENT_FILENAME), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def snapshot_path(root=INDEX_ROOT, name=None):
+    """Diretório do snapshot `name` (padrão: o publicado); sem snapshots, a própria raiz."""
+    name = name or current_name(root)
+    return os.path.join(root, SNAPSHOTS_DIRNAME, name) if name else root
+
+
+def _write_current(root, name):
+    tmp_path = os.path.join(root, CURRENT_FILENAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILENAME))
+
+
+@contextmanager
+def _publish_lock(root, timeout=PUBLISH_LOCK_TIMEOUT):
+    """Trava entre processos da publicação: o arquivo é criado com O_EXCL (também no Windows)."""
+    path = os.path.join(root, PUBLISH_LOCK_FILENAME)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > PUBLISH_LOCK_STALE_SECONDS:
+                    print(f" !! Removendo a trava de publicação abandonada ({path}).")
+                    os.remove(path)
+                    continue
+            except OSError:
+                # A trava foi liberada entre o open e o getmtime: tenta de novo
+                continue
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Outra publicação está em andamento ({path}). Tente novamente.")
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        os.close(fd)
+        yield
+    finally:
+        os.remove(path)
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, SNAPSHOT_META_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(path, meta):
+    meta_path = os.path.join(path, SNAPSHOT_META_FILENAME)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _directory_size(path):
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(folder, name))
+            except OSError:
+                pass
+    return total
+
+
+def _clone_file(src, dst):
+    """Cópia feita pelo kernel (`copy_file_range`): em sistemas de arquivos com reflink
+    (Btrfs, XFS) os blocos do ChromaDB são compartilhados até serem alterados, e a cópia
+    não custa o tamanho do índice. Sem suporte (outros sistemas, Windows), cópia comum."""
+    if not hasattr(os, "copy_file_range"):
+        return shutil.copy2(src, dst)
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if not copied:
+                    break
+                remaining -= copied
+    except OSError:
+        return shutil.copy2(src, dst)
+    shutil.copystat(src, dst)
+    return dst
+
+
+def _copy_snapshot(source, target):
+    """Copia o snapshot `source` para `target`; retorna (arquivos ligados, bytes copiados)."""
+    journals = {JOURNAL_FILENAME.format(kind=kind) for kind in ("pdf", "web")}
+    totals = {"linked": 0, "copied": 0}
+
+    def ignore(folder, names):
+        ignored = {name for name in names if name in journals or name.endswith(".tmp")}
+        if os.path.samefile(folder, source):
+            ignored |= _COPY_IGNORED & set(names)
+        elif os.path.basename(folder) in (VECTOR_INDEX_DIRNAME, PARTITIONS_DIRNAME) and POINTER_FILENAME in names:
+            # Das exportações versionadas só a atual (a do ponteiro) é usada daqui em diante
+            current = os.path.basename(current_version_dir(folder))
+            ignored |= {name for name in names if name not in (POINTER_FILENAME, current)}
+        return list(ignored)
+
+    def copy(src, dst):
+        if os.path.relpath(src, source).split(os.sep)[0] in _LINKED:
+            try:
+                os.link(src, dst)
+                totals["linked"] += 1
+                return dst
+            except OSError:
+                # Sistema de arquivos sem hardlinks: cai na cópia comum
+                pass
+        _clone_file(src, dst)
+        totals["copied"] += os.path.getsize(dst)
+        return dst
+
+    shutil.copytree(source, target, ignore=ignore, copy_function=copy, dirs_exist_ok=True)
+    return totals["linked"], totals["copied"]
+
+
+def close_vectorstore(vectorstore):
+    """Libera o cliente do Chroma (conexão SQLite e arquivos) antes de mover ou apagar o diretório."""
+    close = getattr(vectorstore._client, "close", None)
+    if close is not None:
+        close()
+
+
+class StagingSnapshot:
+    """Cópia de trabalho de uma ingestão, em `snapshots/staging-<tipo>/`.
+
+    `begin` só reserva o diretório (journal e metadados). A cópia do snapshot publicado
+    (a ingestão é incremental) é feita por `prepare`, quando a ingestão já sabe que algo
+    mudou: quanto mais tarde, menor a chance de outra ingestão publicar antes desta.
+    Até lá o índice é lido do publicado (`read_path`). A cópia só fica visível para o app
+    em `publish`, que a renomeia para `v<versão>-<data>` e troca o CURRENT.
+    Uma ingestão interrompida deixa a cópia no lugar: `--resume` continua nela.
+    """
+
+    def __init__(self, root, kind, path, base=None, resumed=False, copied=False):
+        self.root = root
+        self.kind = kind
+        self.path = path
+        self.base = base
+        self.resumed = resumed
+        self.copied = copied
+
+    @classmethod
+    def begin(cls, root=INDEX_ROOT, kind="pdf", resume=False):
+        path = os.path.join(root, SNAPSHOTS_DIRNAME, STAGING_PREFIX + kind)
+        if os.path.exists(path):
+            meta = _read_meta(path)
+            # Cópias de trabalho anteriores ao `prepare` já nasciam copiadas
+            copied = meta.get("copied", True)
+            if resume and not copied:
+                return cls(root, kind, path)
+            if resume and meta.get("base") == current_name(root):
+                print(f"Retomando a cópia de trabalho em {path}.")
+                return cls(root, kind, path, meta.get("base"), resumed=True, copied=True)
+            print(f"Descartando a cópia de trabalho de uma execução anterior ({path}).")
+            shutil.rmtree(path)
+        os.makedirs(path)
+        _write_meta(path, {"kind": kind, "copied": False, "started_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        return cls(root, kind, path)
+
+    @property
+    def read_path(self):
+        """Diretório de onde ler o índice: a cópia, se já existe, ou o snapshot publicado."""
+        return self.path if self.copied else snapshot_path(self.root)
+
+    def prepare(self):
+        """Cria a cópia de trabalho a partir do snapshot publicado agora e retorna o caminho dela."""
+        if self.copied:
+            return self.path
+        self.base = current_name(self.root)
+        source = snapshot_path(self.root, self.base)
+        start = time.perf_counter()
+        linked, copied = _copy_snapshot(source, self.path) if os.path.exists(source) else (0, 0)
+        meta = _read_meta(self.path)
+        meta.update({"base": self.base, "copied": True})
+        _write_meta(self.path, meta)
+        self.copied = True
+        print(f"Cópia de trabalho do índice {self.base or '(layout antigo)'}: {copied / (1024 * 1024):.1f} MB "
+              f"copiados, {linked} arquivos ligados (hardlinks), em {time.perf_counter() - start:.1f}s")
+        return self.path
+
+    def publish(self, version):
+        """Torna a cópia o snapshot atual (troca atômica do CURRENT) e apaga os antigos."""
+        self.prepare()
+        # Verificação, rename e troca do ponteiro sob a mesma trava: duas ingestões
+        # terminando juntas não passam ambas pela verificação
+        with _publish_lock(self.root):
+            published = current_name(self.root)
+            if published != self.base:
+                self.discard()
+                raise RuntimeError(f"O índice publicado mudou durante a ingestão ({self.base} -> {published}): "
+                                   f"outra ingestão terminou antes desta. Execute a ingestão novamente.")
+            name = f"v{version:06d}-{time.strftime('%Y%m%dT%H%M%S')}"
+            meta = _read_meta(self.path)
+            meta.update({"name": name, "version": version, "published_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+            _write_meta(self.path, meta)
+            final_path = os.path.join(self.root, SNAPSHOTS_DIRNAME, name)
+            os.rename(self.path, final_path)
+            _write_current(self.root, name)
+        print(f"Snapshot {name} publicado (anterior: {self.base or 'layout antigo'}).")
+        collect_garbage(self.root)
+        return name
+
+    def discard(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class SnapshotLease:
+    """Marca um snapshot como em uso por este processo (a coleta de lixo não o apaga).
+
+    Uma thread renova o arquivo da marca; se o processo morrer, ela expira sozinha
+    depois de LEASE_TTL_SECONDS.
+    """
+
+    def __init__(self, root, name, refresh_seconds=LEASE_REFRESH_SECONDS):
+        self.name = name
+        self.path = None
+        self._stop = threading.Event()
+        if name is None:
+            return
+        directory = os.path.join(root, LEASES_DIRNAME)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}--{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        self.refresh()
+        threading.Thread(target=self._renew, args=(refresh_seconds,), daemon=True).start()
+
+    def refresh(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
+
+    def _renew(self, refresh_seconds):
+        while not self._stop.wait(refresh_seconds):
+            try:
+                self.refresh()
+            except OSError:
+                pass
+
+    def release(self):
+        self._stop.set()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def _active_leases(root):
+    """Snapshots com marca de uso recente; as marcas vencidas são apagadas."""
+    directory = os.path.join(root, LEASES_DIRNAME)
+    active = set()
+    if not os.path.isdir(directory):
+        return active
+    now = time.time()
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        try:
+            if now - os.path.getmtime(path) > LEASE_TTL_SECONDS:
+                os.remove(path)
+            else:
+                active.add(filename.split("--")[0])
+        except OSError:
+            continue
+    return active
+
+
+def list_snapshots(root=INDEX_ROOT):
+    """Snapshots publicados, do mais novo para o mais antigo."""
+    directory = os.path.join(root, SNAPSHOTS_DIRNAME)
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory)
+             if not name.startswith(STAGING_PREFIX) and os.path.isdir(os.path.join(directory, name))]
+    return sorted(names, reverse=True)
+
+
+def collect_garbage(root=INDEX_ROOT, keep=KEEP_SNAPSHOTS):
+    """Apaga os snapshots além dos `keep` mais recentes (nunca o atual nem os em uso)."""
+    current = current_name(root)
+    in_use = _active_leases(root)
+    removed = []
+    for name in list_snapshots(root)[keep:]:
+        if name == current or name in in_use:
+            continue
+        path = os.path.join(root, SNAPSHOTS_DIRNAME, name)
+        try:
+            shutil.rmtree(path)
+        except OSError as e:
+            # No Windows, arquivos ainda abertos por outro processo: fica para a próxima coleta
+            print(f" !! Snapshot {name} não pôde ser apagado agora: {e}")
+            continue
+        removed.append(name)
+    if removed:
+        print(f"Snapshots antigos apagados: {', '.join(removed)}")
+    return removed
+
+
+def rollback(root, name):
+    """Volta o ponteiro CURRENT para um snapshot anterior (também atômico)."""
+    if name not in list_snapshots(root):
+        raise ValueError(f"Snapshot inexistente: {name}")
+    with _publish_lock(root):
+        _write_current(root, name)
+    return name
+
+
+class _Handle:
+    def __init__(self, name, index, lease):
+        self.name = name
+        self.index = index
+        self.lease = lease
+        self.users = 0
+        self.retired = False
+
+    def close(self):
+        close = getattr(self.index, "close", None)
+        if close is not None:
+            close()
+        self.lease.release()
+
+
+class LiveIndex:
+    """Índice aberto pelo app, trocado a quente quando uma ingestão publica um snapshot novo.
+
+    `loader(path)` abre os componentes de busca de um snapshot (retorna um objeto com
+    `close()`). Uma thread verifica o CURRENT a cada `poll_seconds`; o snapshot novo é
+    aberto e aquecido por ela, fora do caminho das perguntas, e só então passa a ser o
+    atual. As perguntas usam o índice dentro de `use()`: as que já estavam em andamento
+    terminam no snapshot antigo, que é fechado quando a última delas sai.
+    """
+
+    def __init__(self, loader, root=INDEX_ROOT, poll_seconds=POLL_SECONDS):
+        self.loader = loader
+        self.root = root
+        self.poll_seconds = poll_seconds
+        self.warming = None
+        self.last_error = None
+        self.swaps = 0
+        self._lock = threading.Lock()
+        self._current = self._open(current_name(root))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def _open(self, name):
+        lease = SnapshotLease(self.root, name)
+        try:
+            return _Handle(name, self.loader(snapshot_path(self.root, name)), lease)
+        except Exception:
+            lease.release()
+            raise
+
+    @property
+    def name(self):
+        return self._current.name
+
+    @property
+    def current(self):
+        return self._current.index
+
+    @contextmanager
+    def use(self):
+        """Índice atual, garantido aberto até o fim do bloco (mesmo se houver troca no meio)."""
+        with self._lock:
+            handle = self._current
+            handle.users += 1
+        try:
+            yield handle.index
+        finally:
+            with self._lock:
+                handle.users -= 1
+                close = handle.retired and handle.users == 0
+            if close:
+                handle.close()
+
+    def reload(self):
+        """Abre o snapshot publicado, se ele mudou, e troca o atual por ele."""
+        name = current_name(self.root)
+        if name == self._current.name:
+            return False
+        self.warming = name
+        start = time.perf_counter()
+        try:
+            handle = self._open(name)
+        except Exception as e:
+            self.last_error = f"{name}: {e}"
+            print(f" !! Falha ao abrir o snapshot {name}: {e}")
+            return False
+        finally:
+            self.warming = None
+        with self._lock:
+            old, self._current = self._current, handle
+            old.retired = True
+            close = old.users == 0
+        self.swaps += 1
+        self.last_error = None
+        print(f"Índice trocado: {old.name or 'layout antigo'} -> {name} "
+              f"(aberto e aquecido em {time.perf_counter() - start:.1f}s)")
+        if close:
+            old.close()
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.reload()
+            except Exception as e:
+                self.last_error = str(e)
+
+    def close(self):
+        self._stop.set()
+        self._current.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshots publicados do índice (listar, rollback, limpeza).")
+    parser.add_argument("--root", default=INDEX_ROOT)
+    parser.add_argument("--rollback", metavar="NOME", help="publica de novo um snapshot anterior")
+    parser.add_argument("--gc", action="store_true", help="apaga os snapshots antigos que não estão em uso")
+    parser.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS)
+    args = parser.parse_args()
+
+    if args.rollback:
+        rollback(args.root, args.rollback)
+        print(f"CURRENT -> {args.rollback}")
+    if args.gc:
+        collect_garbage(args.root, args.keep)
+    current = current_name(args.root)
+    in_use = _active_leases(args.root)
+    print(f"Snapshot atual: {current or '(nenhum: layout antigo)'}")
+    for name in list_snapshots(args.root):
+        path = os.path.join(args.root, SNAPSHOTS_DIRNAME, name)
+        flags = [flag for flag, on in (("atual", name == current), ("em uso", name in in_use)) if on]
+        print(f"   {name}  {_directory_size(path) / (1024 * 1024):8.1f} MB  {', '.join(flags)}")
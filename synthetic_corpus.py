@@ -0,0 +1,195 @@
+import os
+import random
+import hashlib
+import threading
+import http.server
+from html import escape
+
+
+# Vocabulário usado para gerar artigos parecidos com a documentação GeneXus
+OBJECT_TYPES = ["Transaction", "Procedure", "Data Provider", "Web Panel", "Structured Data Type",
+                "Data Selector", "Panel", "Business Process Diagram", "External Object", "Domain"]
+ENTITIES = ["Customer", "Invoice", "Product", "Supplier", "Order", "Country", "Employee", "Flight",
+            "Airport", "Attraction", "Category", "Payment", "Shipment", "Warehouse", "Contract"]
+PROPERTIES = ["Load On Demand", "Keep Selected Row", "Commit On Exit", "Generate Object",
+              "Is Collection", "Main Program", "Call Protocol", "Refresh Timeout", "Encrypt URL Parameters",
+              "Web User Experience", "Cache Level", "Autonumber", "Nullable", "Base Type"]
+FILLER = [
+    "Este recurso permite definir o comportamento do objeto em tempo de execução.",
+    "O especificador do GeneXus infere as tabelas envolvidas a partir dos atributos utilizados.",
+    "A navegação é otimizada quando existe um índice que atende à ordem e às condições.",
+    "As regras são disparadas no momento adequado de acordo com a árvore de avaliação.",
+    "Recomenda-se declarar as variáveis com base em atributos ou domínios existentes.",
+    "O gerador produz o código correspondente para a plataforma escolhida na Knowledge Base.",
+    "Os eventos Start, Refresh e Load controlam o ciclo de vida da tela.",
+    "Quando a propriedade não é informada, o valor padrão do modelo é utilizado.",
+]
+
+PDF_PAGE_LINES = 60
+PDF_LINE_WIDTH = 95
+
+
+def generate_articles(count, seed=0, paragraphs=6):
+    """Gera `count` artigos determinísticos, cada um sobre um assunto exclusivo.
+
+    O assunto combina entidade, tipo de objeto e propriedade (ex: 'Invoice7 Procedure
+    Commit On Exit') e aparece no título, no texto e em um trecho de código GeneXus.
+    """
+    rng = random.Random(seed)
+    articles = []
+    for i in range(count):
+        entity = f"{ENTITIES[i % len(ENTITIES)]}{i}"
+        object_type = OBJECT_TYPES[(i // len(ENTITIES)) % len(OBJECT_TYPES)]
+        prop = PROPERTIES[rng.randrange(len(PROPERTIES))]
+        title = f"{entity} {object_type}: propriedade {prop}"
+        body = []
+        for p in range(paragraphs):
+            sentences = rng.sample(FILLER, 3)
+            sentences.insert(rng.randrange(4), f"No {object_type} {entity} a propriedade {prop} deve ser revisada.")
+            body.append(" ".join(sentences))
+        code = (f"For Each {entity}\n    where {entity}Id = &{entity}Id\n"
+                f"    &{entity}Name = {entity}Name\nEndFor")
+        articles.append({
+            "id": f"article-{i}",
+            "title": title,
+            "entity": entity,
+            "object_type": object_type,
+            "property": prop,
+            "paragraphs": body,
+            "code": code,
+        })
+    return articles
+
+
+def labelled_queries(articles, seed=0):
+    """Uma pergunta por artigo, com o ID do artigo que a responde (`relevant`)."""
+    rng = random.Random(seed)
+    templates = [
+        "Como configurar a propriedade {property} no {object_type} {entity}?",
+        "O que faz {property} em {entity}?",
+        "Exemplo de For Each com &{entity}Id",
+        "{entity} {object_type} {property}",
+    ]
+    return [
+        {"question": rng.choice(templates).format(**article), "relevant": article["id"]}
+        for article in articles
+    ]
+
+
+def article_text(article):
+    return "\n\n".join([article["title"], *article["paragraphs"], article["code"]])
+
+
+def _wrap(text, width=PDF_LINE_WIDTH):
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            if line and len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+    return lines
+
+
+def write_pdf(path, pages):
+    """PDF mínimo (Helvetica, WinAnsi), uma string de texto por página; o pypdf extrai o texto."""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    pages_id = len(pages) * 2 + 2
+    kids = []
+    for text in pages:
+        lines = _wrap(text)[:PDF_PAGE_LINES]
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        stream = ("BT /F1 9 Tf 40 800 Td 12 TL " + " ".join(f"({line}) '" for line in escaped) + " ET")
+        data = stream.encode("cp1252", errors="replace")
+        contents = add(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+        kids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R"
+                        b" /Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, contents, font)))
+    add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids)))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def write_pdf_corpus(articles, directory, articles_per_pdf=20):
+    """Grava os artigos em PDFs (um artigo por página); retorna {(caminho, página): id do artigo}.
+
+    As páginas seguem a numeração do pdf_pipeline (a partir de 0).
+    """
+    os.makedirs(directory, exist_ok=True)
+    placement = {}
+    for start in range(0, len(articles), articles_per_pdf):
+        group = articles[start:start + articles_per_pdf]
+        path = os.path.join(directory, f"manual_{start // articles_per_pdf:03d}.pdf")
+        write_pdf(path, [article_text(article) for article in group])
+        for page, article in enumerate(group):
+            placement[(path, page)] = article["id"]
+    return placement
+
+
+def article_html(article):
+    paragraphs = "".join(f"<p>{escape(p)}</p>" for p in article["paragraphs"])
+    return (f"<html lang='pt'><head><title>{escape(article['title'])}</title></head><body>"
+            f"<nav><a href='/'>Home</a> | <a href='/search'>Search</a></nav>"
+            f"<div id='content'><h1>{escape(article['title'])}</h1>{paragraphs}"
+            f"<pre>{escape(article['code'])}</pre></div>"
+            f"<footer>GeneXus Community Wiki</footer></body></html>").encode("utf-8")
+
+
+def serve_articles(articles):
+    """Servidor HTTP local com os artigos (ETag/304 como o servidor real).
+
+    Retorna (server, {url: id do artigo}); encerre com `server.shutdown()`.
+    """
+    pages = {f"/wiki?{i}": article_html(article) for i, article in enumerate(articles)}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = pages.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = {f"{base_url}/wiki?{i}": article["id"] for i, article in enumerate(articles)}
+    return server, urls
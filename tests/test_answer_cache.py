@@ -0,0 +1,68 @@
+import answer_cache
+from answer_cache import SemanticAnswerCache
+from fakes import FakeEmbeddings
+
+EMBEDDINGS = FakeEmbeddings()
+QUESTION = "Como criar uma Transaction no GeneXus 18?"
+
+
+def store(cache, question, index_version=1):
+    cache.store(EMBEDDINGS.embed_query(question), question, f"resposta: {question}", index_version)
+
+
+def lookup(cache, question, index_version=1):
+    return cache.lookup(EMBEDDINGS.embed_query(question), index_version)
+
+
+def test_similar_question_hits_and_different_one_misses():
+    cache = SemanticAnswerCache(threshold=0.85)
+    store(cache, QUESTION)
+    # Similaridade de cosseno ~0.89 com as FakeEmbeddings: acima do limiar
+    hit = lookup(cache, "Como criar uma Transaction no GeneXus 18 rapidamente?")
+    assert hit["answer"] == f"resposta: {QUESTION}"
+    assert 0.85 <= hit["similarity"] < 1.0
+    # ~0.67: abaixo do limiar
+    assert lookup(cache, "Como eu crio uma Transaction no GeneXus 18?") is None
+    assert lookup(cache, "Qual a sintaxe do For Each em Procedures?") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_identical_question_is_found_without_embedding():
+    cache = SemanticAnswerCache()
+    store(cache, QUESTION)
+    hit = cache.lookup_text("  como criar uma transaction NO genexus 18?", 1)
+    assert hit["similarity"] == 1.0
+    assert cache.lookup_text("Outra pergunta", 1) is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = SemanticAnswerCache(ttl=60)
+    store(cache, QUESTION)
+    now[0] += 59
+    assert lookup(cache, QUESTION) is not None
+    now[0] += 2
+    assert lookup(cache, QUESTION) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticAnswerCache(max_entries=2)
+    store(cache, "Pergunta sobre Procedures")
+    store(cache, "Pergunta sobre Data Providers")
+    # Usar a primeira a torna a mais recente: a segunda é a descartada
+    assert cache.lookup_text("Pergunta sobre Procedures", 1) is not None
+    store(cache, "Pergunta sobre Web Panels")
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup_text("Pergunta sobre Data Providers", 1) is None
+    assert cache.lookup_text("Pergunta sobre Procedures", 1) is not None
+    assert cache.lookup_text("Pergunta sobre Web Panels", 1) is not None
+
+
+def test_new_index_version_purges_old_answers():
+    cache = SemanticAnswerCache()
+    store(cache, QUESTION, index_version=1)
+    assert lookup(cache, QUESTION, index_version=2) is None
+    assert cache.lookup_text(QUESTION, 2) is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,64 @@
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+from check_index import inspect_index, source_kind
+from fakes import FakeEmbeddings
+from manifest import SourceManifest
+from snapshots import close_vectorstore
+
+PDF = "docs/manual.pdf"
+PAGE = "https://wiki.genexus.com/commwiki/wiki?1866"
+REPEATED = "A propriedade Commit On Exit define quando a Transaction faz o commit. " * 4
+
+
+def build_index(path):
+    """3 chunks de um PDF, 2 de uma página web (um repetido do PDF) e 1 chunk sem fonte."""
+    chunks = [
+        ("pdf-0", REPEATED, PDF),
+        ("pdf-1", "Procedure com For Each e where. " * 10, PDF),
+        ("pdf-2", "Data Provider gera coleções de SDT. " * 40, PDF),
+        ("web-0", REPEATED, PAGE),
+        ("web-1", "Web Panel com grid e eventos Load e Refresh. " * 5, PAGE),
+        ("loose-0", "Texto sem origem conhecida. " * 3, None),
+    ]
+    vectorstore = Chroma(persist_directory=str(path), embedding_function=FakeEmbeddings(dimension=16))
+    vectorstore.add_documents([Document(page_content=text, metadata={"source": source} if source else {})
+                               for _, text, source in chunks], ids=[chunk_id for chunk_id, _, _ in chunks])
+    close_vectorstore(vectorstore)
+    manifest = SourceManifest.load(str(path))
+    manifest.record(PDF, "pdf", "h1", ["pdf-0", "pdf-1", "pdf-2"])
+    manifest.record(PAGE, "web", "h2", ["web-0", "web-1"])
+    # Fonte do manifesto cujo chunk não chegou ao ChromaDB
+    manifest.record("docs/removido.pdf", "pdf", "h3", ["gone-0"])
+    manifest.bump_version()
+    manifest.save()
+
+
+def test_report_counts_chunks_per_source(tmp_path):
+    build_index(tmp_path)
+    # Páginas de 2 chunks: o resultado não depende da paginação da leitura do SQLite
+    report = inspect_index(str(tmp_path), page_size=2)
+    assert report["chunks"] == 6
+    assert report["sources"] == 3
+    assert report["index_version"] == 1
+    assert report["source_types"] == {"pdf": 3, "web": 2, "sem fonte": 1}
+    assert report["top_sources"][:2] == [(PDF, 3), (PAGE, 2)]
+    assert report["chunks_per_source"] == {"1": 1, "2-5": 2}
+    assert sum(report["chunk_length"]["histogram"].values()) == 6
+    assert report["duplicates"]["exact"] == 1
+    assert report["orphans"] == {"sem fonte": 1, "fora do manifesto": 1, "do manifesto ausentes no ChromaDB": 1}
+    assert report["orphan_examples"] == [("loose-0", "")]
+    assert report["manifest_sources"] == 3
+    assert report["disk_bytes"]["sqlite"] > 0
+
+    full = inspect_index(str(tmp_path))
+    for key in ("source_types", "top_sources", "chunks_per_source", "chunk_length", "duplicates", "orphans"):
+        assert full[key] == report[key]
+
+
+def test_source_kind_without_manifest_uses_the_name():
+    assert source_kind(PDF, {}) == "pdf"
+    assert source_kind(PAGE, {}) == "web"
+    assert source_kind(PDF, {PDF: {"kind": "web"}}) == "web"
+    assert source_kind("", {}) == "sem fonte"
+    assert source_kind("notas.txt", {}) == "outro"
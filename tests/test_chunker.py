@@ -0,0 +1,24 @@
+import pytest
+
+from chunker import MAX_ATOMIC_CHARS, StructureAwareSplitter
+
+
+@pytest.mark.parametrize("block", [
+    # Uma única linha de código (ex: minificada) maior que o teto
+    "```\n" + "&Total = &Total + &Value; " * 150 + "\n```",
+    "for each Customer\n    &Name = " + "x" * 5000 + "\nendfor",
+    # Tabela cujo próprio cabeçalho não cabe em um pedaço
+    "| " + " | ".join(f"Column{i}" for i in range(400)) + " |\n| a | b |\n| c | d |",
+])
+def test_atomic_blocks_never_pass_the_cap(block):
+    text = "# Commands\n\n## For Each command\n\n" + "The command iterates over the table. " * 20 + "\n\n" + block
+    chunks = StructureAwareSplitter().split_text(text)
+    assert max(len(chunk) for chunk in chunks) <= MAX_ATOMIC_CHARS
+    # Nada se perde na divisão
+    assert sum(len(chunk) for chunk in chunks) >= len(block) * 0.9
+
+
+def test_small_code_blocks_stay_whole():
+    code = "```\nfor each Customer\n    msg(CustomerName)\nendfor\n```"
+    chunks = StructureAwareSplitter().split_text("# For Each\n\nIntro.\n\n" + code)
+    assert any(code in chunk for chunk in chunks)
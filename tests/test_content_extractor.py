@@ -0,0 +1,56 @@
+from bs4 import BeautifulSoup
+
+from content_extractor import extract_main_content
+from synthetic_corpus import article_html, generate_articles
+
+
+# Estrutura de um artigo da docs.genexus.com: a página inteira fica dentro do form MAINFORM
+GENEXUS_DOCS_PAGE = """
+<html lang="en"><head><title>For Each command</title><script>var gx = {};</script></head>
+<body>
+<form id="MAINFORM" name="MAINFORM" method="post" action="wiki?24744">
+  <div id="HEADER" class="Header"><a href="/">GeneXus</a> <a href="/search">Search</a></div>
+  <div class="Sidebar"><ul><li><a href="wiki?1">Transaction</a></li><li><a href="wiki?2">Procedure</a></li></ul></div>
+  <div id="CONTENT" class="WikiContent">
+    <h1>For Each command</h1>
+    <table class="TableHeader"><tr><th>Syntax</th></tr><tr><td>For Each [Order att1]</td></tr></table>
+    <p>The For Each command is used to retrieve and update information stored in the database.
+       It navigates the base table inferred from the attributes referenced in the command body.</p>
+    <pre>For Each Customer
+    where CustomerId = &amp;CustomerId
+    &amp;CustomerName = CustomerName
+EndFor</pre>
+    <p>Conditions in the Where clause are used by the specifier to choose the best index.</p>
+  </div>
+  <div id="FOOTER" class="Footer">Copyright GeneXus S.A.</div>
+  <input type="hidden" name="GXState" value="{}"/>
+</form>
+</body></html>
+"""
+
+
+def extract(html):
+    return extract_main_content(BeautifulSoup(html, "html.parser"))
+
+
+def test_genexus_docs_page_inside_mainform():
+    content = extract(GENEXUS_DOCS_PAGE)
+    assert content.startswith("# For Each command")
+    assert "| Syntax |" in content
+    assert "where CustomerId = &CustomerId" in content
+    assert "choose the best index" in content
+    for boilerplate in ("Copyright", "Search", "var gx", "Procedure"):
+        assert boilerplate not in content
+
+
+def test_synthetic_article_drops_navigation_and_footer():
+    article = generate_articles(1)[0]
+    content = extract(article_html(article).decode("utf-8"))
+    assert article["paragraphs"][0] in content
+    assert "```\nFor Each" in content
+    assert "Home" not in content and "Community Wiki" not in content
+
+
+def test_falls_back_to_page_text_when_nothing_is_extracted():
+    content = extract("<html><body><nav>Apenas <b>texto</b> no menu</nav></body></html>")
+    assert content == "Apenas texto no menu"
@@ -0,0 +1,51 @@
+from langchain_core.documents import Document
+
+from context_builder import ContextBuilder
+from embedding_scheduler import estimate_tokens
+from synthetic_corpus import article_text, generate_articles
+
+ARTICLES = generate_articles(10)
+
+
+def chunk(text, source, chunk_index=0, page=None):
+    metadata = {"source": source, "chunk_index": chunk_index}
+    if page is not None:
+        metadata["page"] = page
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_context_stays_within_the_token_budget():
+    # ~250 tokens por chunk: 10 candidatos somam bem mais que o orçamento de 600
+    docs = [chunk(article_text(article)[:1000], f"{article['id']}.html") for article in ARTICLES]
+    selected, context, stats = ContextBuilder(max_tokens=600).select(docs)
+    assert 1 < stats["selected"] < len(docs)
+    assert stats["context_tokens"] == estimate_tokens(context) <= 600
+    assert selected[0] is docs[0]
+    assert all(f"[Fonte: {doc.metadata['source']}]" in context for doc in selected)
+
+
+def test_first_chunk_enters_even_above_the_budget():
+    docs = [chunk(article_text(article), f"{article['id']}.html") for article in ARTICLES[:3]]
+    selected, context, stats = ContextBuilder(max_tokens=10).select(docs)
+    assert selected == docs[:1]
+    assert stats["context_tokens"] > 10
+
+
+def test_duplicate_chunk_from_another_source_is_dropped():
+    text = article_text(ARTICLES[0])[:800]
+    docs = [chunk(text, "manual_v17.pdf", page=3), chunk(text, "manual_v18.pdf", page=3),
+            chunk(article_text(ARTICLES[1])[:800], "wiki.html")]
+    selected, context, stats = ContextBuilder().select(docs)
+    assert stats["duplicates"] == 1
+    assert selected == [docs[0], docs[2]]
+    assert context.count(text[:200]) == 1
+
+
+def test_adjacent_chunks_are_merged_without_the_overlap():
+    text = article_text(ARTICLES[0])[:900]
+    # Chunks vizinhos da mesma página, com 100 caracteres de sobreposição (como os do chunker)
+    first, second = chunk(text[:500], "manual.pdf", 0, page=2), chunk(text[400:], "manual.pdf", 1, page=2)
+    selected, context, stats = ContextBuilder().select([second, first])
+    assert len(selected) == 2
+    assert (stats["passages"], stats["merged"]) == (1, 1)
+    assert context == "[Fonte: manual.pdf · página 3]\n" + text
@@ -0,0 +1,49 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crawler import DocsCrawler, SEARCH
+
+
+def _serve(pages):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = pages.get(self.path)
+            self.send_response(200 if body is not None else 404)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.end_headers()
+            self.wfile.write((body or "").encode("utf-8"))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def _search_page(ids):
+    return "".join(f"<span class='Search__Title'><a href='/en/wiki?{i}'>Artigo {i}</a></span>" for i in ids)
+
+
+def test_category_crawl_does_not_follow_article_links(tmp_path):
+    # Os artigos da categoria apontam para outras páginas da wiki, fora dela
+    pages = {
+        "/en/hsearch?category": _search_page([1, 2]),
+        "/en/hsearch?category,2": _search_page([3]),
+        "/en/hsearch?category,3": "<p>Nenhum resultado</p>",
+    }
+    for i in range(1, 4):
+        pages[f"/en/wiki?{i}"] = f"<a href='/en/wiki?{100 + i}'>Fora da categoria</a>"
+    server, base_url = _serve(pages)
+    crawler = DocsCrawler(state_dir=str(tmp_path / "state"), cache_dir=str(tmp_path / "http"),
+                          rate=1000, follow_links=False)
+    try:
+        articles, complete = crawler.crawl([(f"{base_url}/en/hsearch?category", SEARCH)])
+    finally:
+        crawler.close()
+        server.shutdown()
+
+    assert sorted(articles) == [f"{base_url}/en/wiki?{i}" for i in range(1, 4)]
+    assert complete
+    # Robots.txt não conta; as três páginas de busca sim, os artigos não são baixados
+    assert crawler.stats["requests"] == 3
@@ -0,0 +1,48 @@
+from langchain_core.documents import Document
+
+from dedup import NearDuplicateFilter, simhash
+from synthetic_corpus import FILLER
+
+
+NOTICE = ("Copyright GeneXus S.A. Todos os direitos reservados. Nenhuma parte deste documento "
+          "pode ser reproduzida sem autorização prévia por escrito.")
+PARAGRAPH = " ".join(FILLER)
+
+
+def chunks(source, *texts):
+    return [Document(page_content=text, metadata={"source": source}) for text in texts]
+
+
+def test_exact_and_near_duplicates_in_one_source_are_dropped():
+    dedup = NearDuplicateFilter()
+    kept = dedup.filter(chunks("manual.pdf", PARAGRAPH, "For Each Customer EndFor", PARAGRAPH.upper(),
+                               PARAGRAPH + " Fim"))
+    assert [c.page_content for c in kept] == [PARAGRAPH, "For Each Customer EndFor"]
+    report = dedup.report()
+    assert report["exact_duplicates"] == 1 and report["near_duplicates"] == 1
+    assert kept[0].metadata["simhash"] == format(simhash(PARAGRAPH), "016x")
+
+
+def test_duplicates_across_sources_are_kept():
+    # Cada fonte guarda a sua cópia: remover uma delas não pode apagar o texto da outra
+    dedup = NearDuplicateFilter()
+    first = dedup.filter(chunks("a.pdf", NOTICE))
+    second = dedup.filter(chunks("b.pdf", NOTICE))
+    assert len(first) == len(second) == 1
+    assert dedup.report()["duplicates"] == 0
+
+
+def test_result_does_not_depend_on_source_order():
+    groups = [chunks("a", NOTICE, "Procedure parm(in:&Id)"), chunks("b", "Procedure parm(in:&Id)", NOTICE)]
+    forward = [[c.page_content for c in NearDuplicateFilter().filter(g)] for g in groups]
+    dedup = NearDuplicateFilter()
+    backward = [[c.page_content for c in dedup.filter(g)] for g in reversed(groups)]
+    assert forward == list(reversed(backward))
+
+
+def test_distant_texts_are_not_near_duplicates():
+    dedup = NearDuplicateFilter()
+    value = simhash(NOTICE)
+    dedup.add(NOTICE, value)
+    assert dedup.find(value) == value
+    assert dedup.find(simhash("Data Provider que retorna uma coleção de Structured Data Types por país")) is None
@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from embedding_cache import CachedEmbeddings, cache_key
+from fakes import FakeEmbeddings
+
+
+def make_cache(tmp_path, **kwargs):
+    backend = FakeEmbeddings(dimension=32)
+    return backend, CachedEmbeddings(backend, "fake-model", str(tmp_path / "embeddings.sqlite"), **kwargs)
+
+
+def test_second_call_is_served_from_cache(tmp_path):
+    backend, cache = make_cache(tmp_path)
+    first = cache.embed_documents(["For Each Customer", "EndFor"])
+    second = cache.embed_documents(["For Each Customer", "EndFor"])
+    assert backend.texts == 2
+    assert second == first
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 2
+    cache.close()
+
+
+def test_repeated_texts_in_one_batch_are_sent_once(tmp_path):
+    backend, cache = make_cache(tmp_path)
+    vectors = cache.embed_documents(["Procedure", "Procedure", "  Procedure "])
+    assert backend.texts == 1
+    assert vectors[0] == vectors[1] == vectors[2]
+    cache.close()
+
+
+def test_cache_survives_reopening(tmp_path):
+    backend, cache = make_cache(tmp_path)
+    cache.embed_documents(["Data Provider"])
+    cache.close()
+    backend, cache = make_cache(tmp_path)
+    cache.embed_documents(["Data Provider"])
+    assert backend.texts == 0
+    cache.close()
+
+
+def test_key_depends_on_model():
+    assert cache_key("a", "texto") != cache_key("b", "texto")
+    assert cache_key("a", "texto  normal") == cache_key("a", "texto normal")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    backend, cache = make_cache(tmp_path, max_entries=2)
+    cache.embed_documents(["um"])
+    cache.embed_documents(["dois"])
+    cache.embed_documents(["um"])
+    cache.embed_documents(["tres"])
+    assert cache.stats()["entries"] == 2
+    assert cache.evictions == 1
+    backend.texts = 0
+    cache.embed_documents(["um"])
+    assert backend.texts == 0
+    cache.embed_documents(["dois"])
+    assert backend.texts == 1
+    cache.close()
+
+
+def test_eviction_order_survives_reopening(tmp_path):
+    backend, cache = make_cache(tmp_path, max_entries=2)
+    cache.embed_documents(["um"])
+    cache.embed_documents(["dois"])
+    cache.close()
+    # O contador do LRU continua de onde parou: "um" usado agora é mais recente que "dois"
+    backend, cache = make_cache(tmp_path, max_entries=2)
+    cache.embed_documents(["um"])
+    cache.embed_documents(["tres"])
+    backend.texts = 0
+    cache.embed_documents(["um"])
+    assert backend.texts == 0
+    cache.close()
+
+
+def test_counters_add_up_under_concurrent_calls(tmp_path):
+    backend, cache = make_cache(tmp_path)
+    batches = [[f"texto {i % 10}", f"texto {i}"] for i in range(200)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(cache.embed_documents, batches))
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 400
+    cache.close()
+
+
+def test_queries_are_not_cached(tmp_path):
+    backend, cache = make_cache(tmp_path)
+    cache.embed_query("Transaction")
+    cache.embed_query("Transaction")
+    assert backend.texts == 2
+    cache.close()
@@ -0,0 +1,49 @@
+import pytest
+
+from embedding_scheduler import BatchedEmbeddings
+from fakes import FakeEmbeddings, RemoteFakeEmbeddings, serve_fake_embeddings
+
+
+def test_results_keep_input_order():
+    backend = FakeEmbeddings(dimension=16)
+    batched = BatchedEmbeddings(backend, workers=3, max_batch_texts=4)
+    texts = [f"Procedure{i} parm(&Id{i})" for i in range(37)]
+    try:
+        assert batched.embed_documents(texts) == backend.embed_documents(texts)
+        assert batched.stats()["batches"] == 10
+    finally:
+        batched.close()
+
+
+def test_throttling_backs_off_and_recovers_every_text():
+    # Cota de 5 requisições/s com rajada de 5: os 4 workers recebem 429 logo no início
+    server, url, server_stats = serve_fake_embeddings(requests_per_second=5.0, latency=0.01)
+    batched = BatchedEmbeddings(RemoteFakeEmbeddings(url), workers=4, max_batch_texts=5,
+                                requests_per_minute=6000, base_delay=0.05, max_delay=0.5, retries=10)
+    texts = [f"Transaction Customer{i}" for i in range(120)]
+    try:
+        vectors = batched.embed_documents(texts)
+        stats = batched.stats()
+    finally:
+        batched.close()
+        server.shutdown()
+
+    assert server_stats["throttled"] > 0
+    assert stats["throttle_events"] == server_stats["throttled"]
+    assert stats["rate_factor"] < 1.0
+    assert server_stats["texts"] == len(texts)
+    assert vectors == FakeEmbeddings(dimension=256).embed_documents(texts)
+
+
+def test_non_retryable_errors_are_raised():
+    class Broken(FakeEmbeddings):
+        def embed_documents(self, texts):
+            raise ValueError("entrada inválida")
+
+    batched = BatchedEmbeddings(Broken(), workers=2)
+    try:
+        with pytest.raises(ValueError):
+            batched.embed_documents(["x"])
+        assert batched.throttle_events == 0
+    finally:
+        batched.close()
@@ -0,0 +1,31 @@
+from ingest_journal import CHECKPOINT_EVERY, IngestJournal
+from manifest import SourceManifest, read_index_version
+
+
+def test_checkpoint_bumps_the_index_version(tmp_path):
+    manifest = SourceManifest.load(str(tmp_path))
+    journal = IngestJournal.open(str(tmp_path), "pdf")
+    try:
+        for i in range(CHECKPOINT_EVERY):
+            manifest.record(f"manual{i}.pdf", "pdf", "hash", [f"id{i}"])
+            journal.commit(f"manual{i}.pdf", "hash", [f"id{i}"])
+        assert journal.maybe_checkpoint(manifest)
+    finally:
+        journal.close()
+    # O manifesto salvo no checkpoint já tem uma versão nova (caches antigos invalidados)
+    assert read_index_version(str(tmp_path)) == 1
+    assert SourceManifest.load(str(tmp_path)).version == 1
+
+
+def test_resume_replays_committed_sources(tmp_path):
+    journal = IngestJournal.open(str(tmp_path), "web")
+    journal.commit("https://docs/wiki?1", "hash", ["a", "b"])
+    journal.close()
+
+    resumed = IngestJournal.open(str(tmp_path), "web", resume=True)
+    try:
+        manifest = SourceManifest.load(str(tmp_path))
+        assert resumed.replay(manifest, "web") == 1
+        assert manifest.chunk_ids("https://docs/wiki?1") == ["a", "b"]
+    finally:
+        resumed.finish()
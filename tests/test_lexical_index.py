@@ -0,0 +1,53 @@
+import pytest
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+TEXTS = {
+    "for-each": "For Each Customer where CustomerId = &CustomerId EndFor",
+    "transaction": "A Transaction define a estrutura de dados e a interface do objeto Customer.",
+    "data-provider": "O Data Provider retorna uma coleção de SDT.",
+    "parm": "Procedure com parm(in:&CustomerId, out:&CustomerName) e call.",
+}
+
+
+@pytest.fixture
+def index():
+    return LexicalIndex.build(TEXTS.items())
+
+
+@pytest.mark.parametrize("query", [
+    "&CustomerId",
+    "CustomerId",
+    "For Each",
+    "for each where",
+    "parm(in:&CustomerId)",
+    "EndFor",
+])
+def test_identifier_queries_skip_the_embedding(index, query):
+    assert index.is_identifier_query(query)
+
+
+@pytest.mark.parametrize("query", [
+    "What is a Transaction?",
+    "O que é uma Transaction?",
+    "Transaction",
+    "Data Provider",
+    "How do I call a procedure",
+    "Como usar o For Each",
+    "Qual o valor de &CustomerId?",
+    "Customer Transaction",
+    "GeneXus 18",
+    "&VariavelQueNaoExiste",
+])
+def test_natural_language_questions_need_the_embedding(index, query):
+    assert not index.is_identifier_query(query)
+
+
+def test_search_ranks_exact_identifier_first(index):
+    assert index.search("&CustomerName", 2)[0][0] == "parm"
+    assert tokenize("O For Each da Transaction") == ["for", "each", "transaction"]
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    assert reciprocal_rank_fusion([["a", "b"], ["b", "c"]], 60)[0] == "b"
@@ -0,0 +1,83 @@
+from langchain_core.documents import Document
+
+from manifest import SourceManifest, hash_file, hash_text, make_chunk_ids, purge_missing_sources, read_index_version, \
+    replace_source_chunks
+
+
+class RecordingStore:
+    """Vectorstore mínimo: guarda os documentos por ID e registra as remoções."""
+
+    def __init__(self):
+        self.documents = {}
+        self.deleted = []
+
+    def add_documents(self, documents, ids):
+        self.documents.update(zip(ids, documents))
+
+    def delete(self, ids=None, where=None):
+        if ids is not None:
+            self.deleted.extend(ids)
+            for id_ in ids:
+                self.documents.pop(id_, None)
+        else:
+            source = where["source"]
+            for id_ in [i for i, doc in self.documents.items() if doc.metadata["source"] == source]:
+                del self.documents[id_]
+
+
+def chunks(source, *texts):
+    return [Document(page_content=text, metadata={"source": source}) for text in texts]
+
+
+def test_chunk_ids_are_deterministic():
+    assert make_chunk_ids("a.pdf", "abc" * 10, 2) == make_chunk_ids("a.pdf", "abc" * 10, 2)
+    assert make_chunk_ids("a.pdf", "abc" * 10, 1) != make_chunk_ids("a.pdf", "def" * 10, 1)
+    assert make_chunk_ids("a.pdf", "abc" * 10, 1, part="p20")[0].endswith("-p20-0")
+
+
+def test_changed_source_replaces_only_its_chunks(tmp_path):
+    store, manifest = RecordingStore(), SourceManifest.load(str(tmp_path))
+    old_a = replace_source_chunks(store, manifest, "a.pdf", "pdf", "h1" * 32, chunks("a.pdf", "x", "y"))
+    ids_b = replace_source_chunks(store, manifest, "b.pdf", "pdf", "h2" * 32, chunks("b.pdf", "z"))
+
+    assert manifest.is_unchanged("a.pdf", "h1" * 32)
+    assert not manifest.is_unchanged("a.pdf", "h3" * 32)
+    new_a = replace_source_chunks(store, manifest, "a.pdf", "pdf", "h3" * 32, chunks("a.pdf", "w"))
+
+    assert set(old_a) <= set(store.deleted)
+    assert set(store.documents) == set(new_a) | set(ids_b)
+    assert manifest.chunk_ids("a.pdf") == new_a
+
+
+def test_removed_sources_are_purged_by_kind(tmp_path):
+    store, manifest = RecordingStore(), SourceManifest.load(str(tmp_path))
+    replace_source_chunks(store, manifest, "a.pdf", "pdf", "h1" * 32, chunks("a.pdf", "x"))
+    replace_source_chunks(store, manifest, "b.pdf", "pdf", "h2" * 32, chunks("b.pdf", "y"))
+    replace_source_chunks(store, manifest, "https://wiki/1", "web", "h3" * 32, chunks("https://wiki/1", "z"))
+
+    removed = purge_missing_sources(store, manifest, "pdf", ["b.pdf"])
+
+    assert removed == ["a.pdf"]
+    assert manifest.sources_of_kind("pdf") == {"b.pdf"}
+    assert manifest.sources_of_kind("web") == {"https://wiki/1"}
+    assert all(doc.metadata["source"] != "a.pdf" for doc in store.documents.values())
+
+
+def test_save_and_reload_keeps_version(tmp_path):
+    manifest = SourceManifest.load(str(tmp_path))
+    manifest.record("a.pdf", "pdf", "h1", ["id-0"])
+    manifest.bump_version()
+    manifest.save()
+
+    reloaded = SourceManifest.load(str(tmp_path))
+    assert reloaded.version == 1
+    assert reloaded.chunk_ids("a.pdf") == ["id-0"]
+    assert read_index_version(str(tmp_path)) == 1
+
+
+def test_splitter_version_changes_the_source_hash(tmp_path):
+    path = tmp_path / "manual.pdf"
+    path.write_bytes(b"%PDF-1.4 conteudo")
+    assert hash_file(str(path)) == hash_file(str(path))
+    assert hash_file(str(path), version="structure-1") != hash_file(str(path), version="structure-2")
+    assert hash_text("texto", version="structure-1") != hash_text("texto", version="structure-2")
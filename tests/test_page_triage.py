@@ -0,0 +1,35 @@
+from PIL import Image, ImageDraw
+
+from page_triage import iter_page_triage
+from synthetic_corpus import article_text, generate_articles, write_pdf
+
+
+def write_image_pdf(path):
+    """Uma página que é só um screenshot (como uma página escaneada ou um diagrama exportado)."""
+    image = Image.new("RGB", (595, 842), "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(10):
+        draw.rectangle((40, 60 + i * 75, 555, 110 + i * 75), fill=(30 + i * 20, 90, 180))
+    image.save(path, "PDF", resolution=72)
+
+
+def test_text_page_is_not_sent_to_vision(tmp_path):
+    path = str(tmp_path / "manual.pdf")
+    write_pdf(path, [article_text(article) for article in generate_articles(2)])
+    pages = list(iter_page_triage(path))
+    assert [page["page"] for page in pages] == [1, 2]
+    for page in pages:
+        assert not page["needs_vision"]
+        assert page["reason"] == "texto"
+        assert page["image_coverage"] == 0.0
+        assert page["text_chars"] >= 50
+
+
+def test_image_page_is_sent_to_vision(tmp_path):
+    path = str(tmp_path / "screenshot.pdf")
+    write_image_pdf(path)
+    [page] = iter_page_triage(path)
+    assert page["needs_vision"]
+    assert page["reason"] == "imagem"
+    assert page["image_coverage"] > 0.9
+    assert page["text_chars"] == 0
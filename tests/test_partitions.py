@@ -0,0 +1,103 @@
+import os
+import json
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+from fakes import FakeEmbeddings
+from lexical_index import LEXICAL_INDEX_FILENAME
+from partitions import CATALOG_FILENAME, PARTITIONS_DIRNAME, PartitionedSearcher, build_partitions, tag_chunks
+from snapshots import close_vectorstore
+from vector_export import current_version_dir
+
+
+def make_store(path):
+    vectorstore = Chroma(persist_directory=str(path), embedding_function=FakeEmbeddings(dimension=64))
+    for version in ("17", "18"):
+        chunks = tag_chunks([Document(page_content=f"GeneXus {version} Procedure Customer{i} For Each",
+                                      metadata={"source": f"manual{version}.pdf"}) for i in range(5)],
+                            "pdf", version)
+        vectorstore.add_documents(chunks, ids=[f"gx{version}-{i}" for i in range(5)])
+    return vectorstore
+
+
+def read_catalog(parent):
+    with open(os.path.join(current_version_dir(parent), CATALOG_FILENAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_rebuild_keeps_open_partitions_readable(tmp_path):
+    vectorstore = make_store(tmp_path)
+    build_partitions(vectorstore, str(tmp_path), index_version=1)
+    first = PartitionedSearcher.load(vectorstore, str(tmp_path))
+    try:
+        build_partitions(vectorstore, str(tmp_path), index_version=2)
+        second = PartitionedSearcher.load(vectorstore, str(tmp_path))
+        assert (first.index_version, second.index_version) == (1, 2)
+        # As partições abertas antes da reconstrução continuam no disco e respondendo
+        query = vectorstore.embeddings.embed_query("Customer3")
+        assert first.search("Customer3", query, versions=["17"])
+        parent = os.path.join(str(tmp_path), PARTITIONS_DIRNAME)
+        assert current_version_dir(parent) != parent
+        second.close()
+    finally:
+        first.close()
+        close_vectorstore(vectorstore)
+
+
+def test_question_without_version_searches_every_partition(tmp_path):
+    vectorstore = make_store(tmp_path)
+    build_partitions(vectorstore, str(tmp_path))
+    searcher = PartitionedSearcher.load(vectorstore, str(tmp_path))
+    try:
+        assert sorted(searcher.select("Como usar o For Each?")) == ["gx17-pdf", "gx18-pdf"]
+        assert searcher.select("For Each no GeneXus 17") == ["gx17-pdf"]
+        assert searcher.select("For Each", versions=["18"]) == ["gx18-pdf"]
+        docs, timings = searcher.search("Customer3", vectorstore.embeddings.embed_query("Customer3"), k=4)
+        assert {doc.metadata["gx_version"] for doc in docs} == {"17", "18"}
+        assert sorted(timings["partition_names"]) == ["gx17-pdf", "gx18-pdf"]
+    finally:
+        searcher.close()
+        close_vectorstore(vectorstore)
+
+
+def test_incremental_build_rebuilds_only_changed_partitions(tmp_path):
+    vectorstore = make_store(tmp_path)
+    wiki = tag_chunks([Document(page_content="GeneXus 17 Web Panel", metadata={"source": "https://wiki/17"})],
+                      "web", "17")
+    vectorstore.add_documents(wiki, ids=["wiki17-0"])
+    parent = os.path.join(str(tmp_path), PARTITIONS_DIRNAME)
+    build_partitions(vectorstore, str(tmp_path), index_version=1)
+    previous = current_version_dir(parent)
+
+    # manual17.pdf saiu, manual18.pdf mudou e apareceu um artigo do GeneXus 18
+    vectorstore.delete(ids=[f"gx{version}-{i}" for version in ("17", "18") for i in range(5)])
+    changed = tag_chunks([Document(page_content=f"GeneXus 18 Transaction Invoice{i}",
+                                   metadata={"source": "manual18.pdf"}) for i in range(3)], "pdf", "18")
+    changed += tag_chunks([Document(page_content="GeneXus 18 Data Provider", metadata={"source": "https://wiki/18"})],
+                          "web", "18")
+    vectorstore.add_documents(changed, ids=["new18-0", "new18-1", "new18-2", "wiki18-0"])
+    build_partitions(vectorstore, str(tmp_path), index_version=2,
+                     changed_sources={"manual17.pdf", "manual18.pdf", "https://wiki/18"})
+    current = current_version_dir(parent)
+    searcher = PartitionedSearcher.load(vectorstore, str(tmp_path))
+    try:
+        assert searcher.index_version == 2
+        assert {name: entry["chunks"] for name, entry in searcher.catalog["partitions"].items()} == \
+            {"gx17-web": 1, "gx18-pdf": 3, "gx18-web": 1}
+        # A partição sem fontes alteradas é a mesma de antes (hardlinks, nada reconstruído)
+        assert os.path.samefile(os.path.join(previous, "gx17-web", LEXICAL_INDEX_FILENAME),
+                                os.path.join(current, "gx17-web", LEXICAL_INDEX_FILENAME))
+        assert not os.path.samefile(os.path.join(previous, "gx18-pdf", LEXICAL_INDEX_FILENAME),
+                                    os.path.join(current, "gx18-pdf", LEXICAL_INDEX_FILENAME))
+        docs, _ = searcher.search("Invoice1", vectorstore.embeddings.embed_query("Invoice1"), versions=["18"])
+        assert "Invoice1" in docs[0].page_content
+    finally:
+        searcher.close()
+
+    # O resultado é o mesmo de uma reconstrução completa
+    incremental = read_catalog(parent)["partitions"]
+    build_partitions(vectorstore, str(tmp_path), index_version=2)
+    full = read_catalog(parent)["partitions"]
+    close_vectorstore(vectorstore)
+    assert incremental == full
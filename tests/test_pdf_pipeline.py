@@ -0,0 +1,96 @@
+import time
+
+from langchain_community.vectorstores import Chroma
+
+import pdf_pipeline
+from embedding_scheduler import BatchedEmbeddings
+from fakes import FakeEmbeddings, RemoteFakeEmbeddings, serve_fake_embeddings
+from manifest import SourceManifest, hash_file
+from pdf_pipeline import run_pdf_pipeline
+from snapshots import close_vectorstore
+from synthetic_corpus import generate_articles, write_pdf_corpus
+
+
+def make_corpus(tmp_path, count, articles_per_pdf=20):
+    placement = write_pdf_corpus(generate_articles(count), str(tmp_path / "docs"), articles_per_pdf)
+    return {path: hash_file(path) for path in sorted({path for path, _ in placement})}
+
+
+def test_throttled_embeddings_still_index_every_chunk(tmp_path):
+    # Cota de 5 requisições/s com rajada de 5: os workers recebem 429 logo no início
+    server, url, server_stats = serve_fake_embeddings(requests_per_second=5.0, latency=0.01)
+    scheduler = BatchedEmbeddings(RemoteFakeEmbeddings(url), workers=4, max_batch_texts=5,
+                                  requests_per_minute=6000, base_delay=0.05, max_delay=0.5, retries=10)
+    vectorstore = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=FakeEmbeddings())
+    manifest = SourceManifest(str(tmp_path / "manifest.json"))
+    pdf_hashes = make_corpus(tmp_path, 40)
+    try:
+        result = run_pdf_pipeline(pdf_hashes, vectorstore, manifest, scheduler, workers=2)
+        stored = vectorstore._collection.count()
+    finally:
+        scheduler.close()
+        server.shutdown()
+        close_vectorstore(vectorstore)
+
+    assert server_stats["throttled"] > 0
+    assert scheduler.stats()["throttle_events"] == server_stats["throttled"]
+    assert result["chunks"] == stored == server_stats["texts"]
+    assert manifest.sources_of_kind("pdf") == set(pdf_hashes)
+
+
+def test_ready_units_are_embedded_together(tmp_path, monkeypatch):
+    # Uma página por unidade e um modelo lento: as unidades se acumulam na fila
+    monkeypatch.setattr(pdf_pipeline, "PAGES_PER_UNIT", 1)
+    calls = []
+
+    class Slow(FakeEmbeddings):
+        def embed_documents(self, texts):
+            calls.append(len(texts))
+            time.sleep(0.2)
+            return super().embed_documents(texts)
+
+    vectorstore = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=FakeEmbeddings())
+    manifest = SourceManifest(str(tmp_path / "manifest.json"))
+    try:
+        result = run_pdf_pipeline(make_corpus(tmp_path, 12, articles_per_pdf=12), vectorstore, manifest,
+                                  Slow(), workers=2)
+    finally:
+        close_vectorstore(vectorstore)
+
+    assert sum(calls) == result["chunks"]
+    assert len(calls) < result["pages"]
+    assert max(calls) > result["chunks"] / result["pages"]
+
+
+def test_failed_page_range_leaves_no_partial_document(tmp_path, monkeypatch):
+    # Uma página por unidade; a segunda página do primeiro PDF falha no parse
+    monkeypatch.setattr(pdf_pipeline, "PAGES_PER_UNIT", 1)
+    pdf_hashes = make_corpus(tmp_path, 8, articles_per_pdf=4)
+    broken, healthy = sorted(pdf_hashes)
+    parse_and_split = pdf_pipeline.parse_and_split
+
+    def failing_parse_and_split(pdf_path, start, *args):
+        if pdf_path == broken and start == 1:
+            raise ValueError("página corrompida")
+        return parse_and_split(pdf_path, start, *args)
+
+    # Os processos do pool são criados por fork e herdam a substituição
+    monkeypatch.setattr(pdf_pipeline, "parse_and_split", failing_parse_and_split)
+    vectorstore = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=FakeEmbeddings())
+    manifest = SourceManifest(str(tmp_path / "manifest.json"))
+    # Versão anterior do PDF já indexada
+    vectorstore.add_texts(["versão antiga"], metadatas=[{"source": broken}], ids=["old-0"])
+    manifest.record(broken, "pdf", "old-hash", ["old-0"])
+    try:
+        result = run_pdf_pipeline(pdf_hashes, vectorstore, manifest, FakeEmbeddings(), workers=2)
+        stored = set(vectorstore._collection.get(where={"source": broken})["ids"])
+        healthy_count = len(vectorstore._collection.get(where={"source": healthy})["ids"])
+    finally:
+        close_vectorstore(vectorstore)
+
+    assert result["failed_sources"] == [broken]
+    # O índice e o manifesto concordam sobre o PDF que falhou, e ele será reprocessado
+    assert stored == set(manifest.chunk_ids(broken))
+    assert not manifest.is_unchanged(broken, pdf_hashes[broken])
+    assert manifest.is_unchanged(healthy, pdf_hashes[healthy])
+    assert healthy_count == len(manifest.chunk_ids(healthy)) > 0
@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+from context_builder import ContextBuilder
+from fakes import FakeChatModel, FakeEmbeddings
+from lexical_index import HybridSearcher, LexicalIndex
+from rag import build_rag_chain
+from snapshots import close_vectorstore
+
+
+def make_searcher(path):
+    texts = [f"Procedure Customer{i} usa For Each com where CustomerId = &CustomerId{i}" for i in range(20)]
+    ids = [f"c{i}" for i in range(len(texts))]
+    vectorstore = Chroma(persist_directory=str(path), embedding_function=FakeEmbeddings(dimension=64))
+    vectorstore.add_documents([Document(page_content=text, metadata={"source": "manual.pdf", "page": i})
+                               for i, text in enumerate(texts)], ids=ids)
+    return HybridSearcher(vectorstore, LexicalIndex.build(zip(ids, texts)), k=3)
+
+
+def test_search_returns_its_own_timings(tmp_path):
+    searcher = make_searcher(tmp_path)
+    embeddings = searcher.vectorstore.embeddings
+    try:
+        docs, timings = searcher.search("Customer7", embeddings.embed_query("Customer7"))
+        assert docs[0].page_content.startswith("Procedure Customer7 ")
+        assert set(timings) == {"vector_ms", "lexical_ms"}
+        docs, timings = searcher.search("&CustomerId7")
+        assert set(timings) == {"lexical_ms"}
+    finally:
+        close_vectorstore(searcher.vectorstore)
+
+
+def test_concurrent_questions_keep_separate_stats(tmp_path):
+    searcher = make_searcher(tmp_path)
+    embeddings = searcher.vectorstore.embeddings
+    chain = build_rag_chain(searcher, FakeChatModel(first_token_latency=0.0, token_latency=0.0),
+                            context_builder=ContextBuilder(candidates=5))
+
+    def ask(question, use_vector):
+        stats = {}
+        vector = embeddings.embed_query(question) if use_vector else None
+        chain.invoke({"question": question, "query_vector": vector, "stats": stats})
+        return stats
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(ask, [f"Customer{i}" for i in range(16)], [i % 2 == 0 for i in range(16)]))
+        for i, stats in enumerate(results):
+            assert ("vector_ms" in stats["search"]) == (i % 2 == 0)
+            # Só o BM25 encontra apenas o chunk que cita o identificador
+            assert stats["context"]["candidates"] == (5 if i % 2 == 0 else 1)
+            assert stats["context"]["selected"] >= 1
+    finally:
+        close_vectorstore(searcher.vectorstore)
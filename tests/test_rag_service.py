@@ -0,0 +1,120 @@
+import time
+import shutil
+import asyncio
+from contextlib import asynccontextmanager
+
+from aiohttp import web, ClientSession
+
+from manifest import SourceManifest
+from rag_service import RagService, build_stub_backends, create_app
+from snapshots import StagingSnapshot
+
+QUESTION = "Como usar o For Each em uma Procedure?"
+
+
+def stub_backends(**options):
+    options = {"articles": 20, "embed_latency": 0.0, "llm_first_token": 0.0, "llm_token": 0.0, **options}
+    return build_stub_backends(**options)
+
+
+@asynccontextmanager
+async def serve(service):
+    runner = web.AppRunner(create_app(service))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        async with ClientSession() as session:
+            yield session, f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
+
+
+async def ask(session, url, question):
+    async with session.post(f"{url}/query", json={"question": question}) as response:
+        assert response.status == 200
+        return await response.json()
+
+
+def publish_new_version(root):
+    """Publica um snapshot novo (mesmo conteúdo, versão seguinte) como faria uma ingestão."""
+    staging = StagingSnapshot.begin(root, "pdf")
+    manifest = SourceManifest.load(staging.prepare())
+    manifest.bump_version()
+    manifest.save()
+    return staging.publish(manifest.version)
+
+
+def test_service_swaps_to_a_published_snapshot_without_restarting():
+    live_index, embeddings, work_dir = stub_backends(poll_seconds=0.05)
+    try:
+        service = RagService(live_index, embeddings)
+
+        async def run():
+            async with serve(service) as (session, url):
+                await ask(session, url, QUESTION)
+                name = publish_new_version(live_index.root)
+                # A thread do LiveIndex abre e aquece o snapshot novo em segundo plano
+                deadline = time.monotonic() + 10
+                while live_index.name != name and time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                answer = await ask(session, url, QUESTION)
+                async with session.get(f"{url}/stats") as response:
+                    return name, answer, await response.json()
+
+        name, answer, stats = asyncio.run(run())
+        assert stats["snapshot"] == name
+        assert stats["index_version"] == 1
+        assert stats["snapshot_swaps"] == 1
+        # Versão nova do índice: a resposta guardada da versão anterior não é reaproveitada
+        assert not answer["cached"]
+        assert stats["llm_calls"] == 2
+    finally:
+        live_index.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def test_identical_concurrent_questions_share_one_llm_call():
+    live_index, embeddings, work_dir = stub_backends(llm_first_token=0.2)
+    try:
+        service = RagService(live_index, embeddings)
+
+        async def run():
+            async with serve(service) as (session, url):
+                answers = await asyncio.gather(*(ask(session, url, QUESTION) for _ in range(10)))
+                async with session.get(f"{url}/stats") as response:
+                    return answers, await response.json()
+
+        answers, stats = asyncio.run(run())
+        assert len({answer["answer"] for answer in answers}) == 1
+        assert stats["llm_calls"] == 1
+        assert stats["coalesced"] + stats["cache_hits"] == 9
+        assert stats["embeddings"]["texts"] == 1
+    finally:
+        live_index.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def test_distinct_concurrent_questions_are_embedded_in_one_batch():
+    live_index, embeddings, work_dir = stub_backends()
+    questions = [f"Como configurar a propriedade {i} em um Web Panel?" for i in range(8)]
+    try:
+        # Janela larga: todas as requisições chegam antes de o lote sair, mesmo numa máquina lenta
+        service = RagService(live_index, embeddings, embed_wait_ms=500)
+        calls_before = embeddings.calls
+
+        async def run():
+            async with serve(service) as (session, url):
+                await asyncio.gather(*(ask(session, url, question) for question in questions))
+                async with session.get(f"{url}/stats") as response:
+                    return await response.json()
+
+        stats = asyncio.run(run())
+        assert stats["embeddings"]["batches"] == 1
+        assert stats["embeddings"]["texts"] == len(questions)
+        assert embeddings.calls - calls_before == 1
+        assert stats["llm_calls"] == len(questions)
+    finally:
+        live_index.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
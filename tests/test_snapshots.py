@@ -0,0 +1,167 @@
+import os
+import time
+import threading
+
+import pytest
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+import snapshots
+from fakes import FakeEmbeddings
+from lexical_index import LEXICAL_INDEX_FILENAME, build_lexical_index
+from manifest import MANIFEST_FILENAME, SourceManifest, read_index_version
+from snapshots import SNAPSHOTS_DIRNAME, LiveIndex, SnapshotLease, StagingSnapshot, close_vectorstore, \
+    collect_garbage, current_name, list_snapshots, snapshot_path
+from vector_export import POINTER_FILENAME, VECTOR_INDEX_DIRNAME, MemmapVectorIndex, current_version_dir, \
+    export_vectors
+
+EMBEDDINGS = FakeEmbeddings(dimension=32)
+
+
+def ingest(staging, texts):
+    """Uma ingestão mínima: grava os textos na cópia de trabalho e refaz os índices derivados."""
+    path = staging.prepare()
+    vectorstore = Chroma(persist_directory=path, embedding_function=EMBEDDINGS)
+    manifest = SourceManifest.load(path)
+    source = f"{staging.kind}-{len(texts)}-{texts[0]}"
+    ids = [f"{source}-{i}" for i in range(len(texts))]
+    vectorstore.add_documents([Document(page_content=text, metadata={"source": source}) for text in texts], ids=ids)
+    manifest.record(source, staging.kind, "hash", ids)
+    manifest.bump_version()
+    manifest.save()
+    build_lexical_index(vectorstore, path)
+    export_vectors(vectorstore, path, index_version=manifest.version)
+    close_vectorstore(vectorstore)
+    return manifest.version
+
+
+def publish(root, texts, kind="pdf"):
+    staging = StagingSnapshot.begin(str(root), kind)
+    return staging.publish(ingest(staging, texts))
+
+
+class Index:
+    """O que o app abre de um snapshot (aqui, só a exportação dos vetores)."""
+
+    def __init__(self, path):
+        self.version = read_index_version(path)
+        self.vectors = MemmapVectorIndex.load(path)
+        self.closed = False
+
+    def close(self):
+        self.vectors.close()
+        self.closed = True
+
+
+def test_begin_does_not_copy_until_prepare(tmp_path):
+    first = publish(tmp_path, ["Procedure com For Each"])
+    staging = StagingSnapshot.begin(str(tmp_path), "web")
+    # Nada é copiado antes de a ingestão saber que algo mudou: a leitura vem do publicado
+    assert staging.read_path == snapshot_path(str(tmp_path), first)
+    assert not os.path.exists(os.path.join(staging.path, MANIFEST_FILENAME))
+    staging.discard()
+    assert list_snapshots(str(tmp_path)) == [first]
+
+
+def test_staging_links_unchanged_files_without_touching_the_published_snapshot(tmp_path):
+    first = publish(tmp_path, [f"Transaction {i}" for i in range(5)])
+    published = snapshot_path(str(tmp_path), first)
+    with open(os.path.join(published, MANIFEST_FILENAME), "rb") as f:
+        manifest_before = f.read()
+    vectors_before = current_version_dir(os.path.join(published, VECTOR_INDEX_DIRNAME))
+
+    staging = StagingSnapshot.begin(str(tmp_path), "pdf")
+    path = staging.prepare()
+    for filename in (MANIFEST_FILENAME, LEXICAL_INDEX_FILENAME):
+        assert os.path.samefile(os.path.join(path, filename), os.path.join(published, filename))
+    # Só a exportação atual é levada para a cópia, com o ponteiro dela
+    copied_vectors = os.path.join(path, VECTOR_INDEX_DIRNAME)
+    assert os.path.exists(os.path.join(copied_vectors, POINTER_FILENAME))
+    assert sorted(os.listdir(copied_vectors)) == sorted([POINTER_FILENAME, os.path.basename(vectors_before)])
+
+    second = staging.publish(ingest(staging, ["Web Panel com grid"]))
+    # O snapshot publicado antes continua exatamente como estava
+    with open(os.path.join(published, MANIFEST_FILENAME), "rb") as f:
+        assert f.read() == manifest_before
+    assert current_version_dir(os.path.join(published, VECTOR_INDEX_DIRNAME)) == vectors_before
+    assert read_index_version(published) == 1
+    assert read_index_version(snapshot_path(str(tmp_path), second)) == 2
+
+
+def test_publish_fails_when_another_ingestion_published_first(tmp_path):
+    publish(tmp_path, ["Procedure com For Each"])
+    pdf = StagingSnapshot.begin(str(tmp_path), "pdf")
+    web = StagingSnapshot.begin(str(tmp_path), "web")
+    pdf_version = ingest(pdf, ["Manual do GeneXus 18"])
+    web_version = ingest(web, ["Artigo da wiki"])
+    published = pdf.publish(pdf_version)
+    with pytest.raises(RuntimeError):
+        web.publish(web_version)
+    assert current_name(str(tmp_path)) == published
+    assert not os.path.exists(web.path)
+
+
+def test_simultaneous_publishes_keep_only_one(tmp_path, monkeypatch):
+    publish(tmp_path, ["Procedure com For Each"])
+    stagings = [StagingSnapshot.begin(str(tmp_path), kind) for kind in ("pdf", "web")]
+    versions = [ingest(staging, [f"Fonte {staging.kind}"]) for staging in stagings]
+    write_current = snapshots._write_current
+
+    def slow_write_current(root, name):
+        # Alarga a janela entre a verificação da base e a troca do ponteiro
+        time.sleep(0.2)
+        write_current(root, name)
+
+    monkeypatch.setattr(snapshots, "_write_current", slow_write_current)
+    barrier = threading.Barrier(2)
+    published, errors = [], []
+
+    def run(staging, version):
+        barrier.wait()
+        try:
+            published.append(staging.publish(version))
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=pair) for pair in zip(stagings, versions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(published) == 1 and len(errors) == 1
+    assert current_name(str(tmp_path)) == published[0]
+    assert not os.path.exists(os.path.join(tmp_path, snapshots.PUBLISH_LOCK_FILENAME))
+
+
+def test_live_index_swaps_after_the_running_query(tmp_path):
+    publish(tmp_path, ["Procedure com For Each"])
+    live = LiveIndex(Index, str(tmp_path), poll_seconds=3600)
+    try:
+        with live.use() as old:
+            assert old.version == 1
+            publish(tmp_path, ["Transaction com regras"])
+            assert live.reload()
+            # A pergunta em andamento termina no snapshot antigo, ainda aberto
+            assert not old.closed
+            assert live.current.version == 2
+        assert old.closed
+        with live.use() as index:
+            assert index.version == 2
+        assert not live.reload()
+    finally:
+        live.close()
+
+
+def test_garbage_collection_keeps_current_and_leased_snapshots(tmp_path):
+    names = [publish(tmp_path, [f"Versão {i}"]) for i in range(2)]
+    lease = SnapshotLease(str(tmp_path), names[0])
+    try:
+        for i in range(2, 5):
+            names.append(publish(tmp_path, [f"Versão {i}"]))
+        collect_garbage(str(tmp_path), keep=1)
+        assert set(list_snapshots(str(tmp_path))) == {names[0], names[-1]}
+    finally:
+        lease.release()
+    collect_garbage(str(tmp_path), keep=1)
+    assert list_snapshots(str(tmp_path)) == [names[-1]]
+    assert os.listdir(os.path.join(tmp_path, SNAPSHOTS_DIRNAME)) == [names[-1]]
@@ -0,0 +1,16 @@
+import os
+
+from tracing import TRACES_FILENAME, Tracer
+
+
+def test_traces_file_is_rotated(tmp_path):
+    tracer = Tracer(enabled=True, directory=str(tmp_path), max_bytes=400, backups=2)
+    for i in range(30):
+        with tracer.trace("query", question=f"pergunta {i}"):
+            with tracer.span("retrieve", chunks=5):
+                pass
+
+    path = os.path.join(str(tmp_path), TRACES_FILENAME)
+    assert os.path.exists(path + ".1") and os.path.exists(path + ".2")
+    assert not os.path.exists(path + ".3")
+    assert tracer.last_trace("query")["spans"][0]["attributes"]["question"] == "pergunta 29"
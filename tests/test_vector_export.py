@@ -0,0 +1,77 @@
+import os
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+from fakes import FakeEmbeddings
+from snapshots import close_vectorstore
+from vector_export import POINTER_FILENAME, VECTOR_INDEX_DIRNAME, MemmapVectorIndex, current_version_dir, \
+    export_vectors
+
+
+def make_store(path, texts):
+    vectorstore = Chroma(persist_directory=str(path), embedding_function=FakeEmbeddings(dimension=32))
+    documents = [Document(page_content=text, metadata={"source": f"s{i}"}) for i, text in enumerate(texts)]
+    vectorstore.add_documents(documents, ids=[f"c{i}" for i in range(len(texts))])
+    return vectorstore
+
+
+def test_export_matches_chroma_ranking(tmp_path):
+    texts = [f"Procedure {i} com For Each sobre Customer{i}" for i in range(30)]
+    vectorstore = make_store(tmp_path, texts)
+    export_vectors(vectorstore, str(tmp_path), dtype="float16", index_version=7)
+    index = MemmapVectorIndex.load(str(tmp_path))
+    try:
+        assert index.index_version == 7
+        query = vectorstore.embeddings.embed_query("For Each sobre Customer12")
+        expected = vectorstore._collection.query(query_embeddings=[query], n_results=3, include=[])["ids"][0]
+        assert [chunk_id for chunk_id, _ in index.search(query, 3)] == expected
+        assert index.get_documents(["c12"])["c12"].page_content == texts[12]
+    finally:
+        index.close()
+        close_vectorstore(vectorstore)
+
+
+def test_new_export_does_not_touch_an_open_one(tmp_path):
+    vectorstore = make_store(tmp_path, [f"Transaction {i}" for i in range(10)])
+    parent = tmp_path / VECTOR_INDEX_DIRNAME
+    export_vectors(vectorstore, str(tmp_path), index_version=1)
+    first = MemmapVectorIndex.load(str(tmp_path))
+    try:
+        vectorstore.add_documents([Document(page_content="Data Provider", metadata={"source": "novo"})], ids=["novo"])
+        export_vectors(vectorstore, str(tmp_path), index_version=2)
+        # A versão aberta continua no disco e respondendo; o ponteiro já indica a nova
+        assert os.path.isdir(first.index_dir)
+        assert first.get_documents(["c3"])["c3"].page_content == "Transaction 3"
+        second = MemmapVectorIndex.load(str(tmp_path))
+        assert second.index_version == 2 and len(second.ids) == 11
+        assert current_version_dir(str(parent)) == second.index_dir != first.index_dir
+        second.close()
+
+        # Uma terceira exportação apaga as versões anteriores à última publicada
+        export_vectors(vectorstore, str(tmp_path), index_version=3)
+        assert sorted(os.listdir(parent)) == sorted([POINTER_FILENAME, os.path.basename(second.index_dir),
+                                                     os.path.basename(current_version_dir(str(parent)))])
+    finally:
+        first.close()
+        close_vectorstore(vectorstore)
+
+
+def test_legacy_layout_is_still_readable(tmp_path):
+    vectorstore = make_store(tmp_path, ["Web Panel", "Procedure"])
+    parent = tmp_path / VECTOR_INDEX_DIRNAME
+    version_dir = export_vectors(vectorstore, str(tmp_path), index_version=1)
+    # Formato antigo: os arquivos direto em vectors/, sem ponteiro
+    os.remove(parent / POINTER_FILENAME)
+    for name in os.listdir(version_dir):
+        os.replace(os.path.join(version_dir, name), parent / name)
+    os.rmdir(version_dir)
+    index = MemmapVectorIndex.load(str(tmp_path))
+    assert len(index.ids) == 2
+    index.close()
+
+    export_vectors(vectorstore, str(tmp_path), index_version=2)
+    index = MemmapVectorIndex.load(str(tmp_path))
+    assert index.index_version == 2
+    index.close()
+    close_vectorstore(vectorstore)
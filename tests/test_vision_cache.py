@@ -0,0 +1,46 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from vision_cache import VisionDescriptionCache, hamming_distance, perceptual_hash
+
+PROMPT = "Descreva a imagem."
+MODEL = "gemini-2.5-flash"
+
+
+def screenshot(seed):
+    """Uma "tela" sintética: barras e blocos cuja posição depende da semente."""
+    image = Image.new("RGB", (400, 300), "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(8):
+        x = (seed * 37 + i * 53) % 320
+        y = (seed * 61 + i * 29) % 240
+        draw.rectangle((x, y, x + 60 + (i * seed) % 40, y + 30), fill=((i * 40) % 256, 80, 160))
+    return image
+
+
+def reencoded(image):
+    """A mesma tela depois de uma recompressão JPEG (diferenças pequenas de renderização)."""
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=60)
+    buffer.seek(0)
+    return Image.open(buffer).convert("RGB")
+
+
+def test_near_identical_image_hits_and_different_image_misses(tmp_path):
+    cache = VisionDescriptionCache(str(tmp_path / "vision.sqlite"))
+    original = screenshot(1)
+    cache.put(original, PROMPT, MODEL, "Tela de Transaction")
+    near = reencoded(original)
+    assert 0 < hamming_distance(perceptual_hash(original), perceptual_hash(near)) <= cache.threshold
+
+    assert cache.get(original, PROMPT, MODEL) == "Tela de Transaction"
+    assert cache.get(near, PROMPT, MODEL) == "Tela de Transaction"
+    assert cache.get(screenshot(2), PROMPT, MODEL) is None
+    # A mesma imagem com outro prompt é outra descrição
+    assert cache.get(original, "Transcreva o código.", MODEL) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["near_hits"], stats["misses"]) == (1, 1, 2)
+    cache.close()
+
@@ -0,0 +1,63 @@
+from synthetic_corpus import generate_articles, serve_articles
+from web_fetcher import HttpCache, fetch_documents, iter_documents
+
+
+def test_second_fetch_uses_conditional_get(tmp_path):
+    articles = generate_articles(3)
+    server, urls = serve_articles(articles)
+    cache_dir = str(tmp_path / "http")
+    try:
+        documents, report = fetch_documents(list(urls), cache_dir=cache_dir)
+        assert report["fetched"] == 3 and report["not_modified"] == 0
+
+        again, report = fetch_documents(list(urls), cache_dir=cache_dir)
+        assert report["fetched"] == 0 and report["not_modified"] == 3
+        assert [doc.page_content for doc in again] == [doc.page_content for doc in documents]
+    finally:
+        server.shutdown()
+
+
+def test_fresh_entries_skip_the_server(tmp_path):
+    server, urls = serve_articles(generate_articles(2))
+    cache_dir = str(tmp_path / "http")
+    try:
+        fetch_documents(list(urls), cache_dir=cache_dir)
+        _, report = fetch_documents(list(urls), cache_dir=cache_dir, max_age=3600)
+        assert report["from_cache"] == 2 and report["not_modified"] == 0
+    finally:
+        server.shutdown()
+
+
+def test_missing_pages_are_reported_as_gone(tmp_path):
+    server, urls = serve_articles(generate_articles(1))
+    missing = next(iter(urls)).replace("wiki?0", "wiki?99")
+    try:
+        documents, report = fetch_documents([*urls, missing], cache_dir=str(tmp_path / "http"))
+        assert len(documents) == 1
+        assert report["gone"] == [missing]
+    finally:
+        server.shutdown()
+
+
+def test_documents_keep_only_main_content(tmp_path):
+    articles = generate_articles(1)
+    server, urls = serve_articles(articles)
+    try:
+        (document,), _ = fetch_documents(list(urls), cache_dir=str(tmp_path / "http"))
+        assert articles[0]["entity"] in document.page_content
+        assert "GeneXus Community Wiki" not in document.page_content
+        assert document.metadata["title"] == articles[0]["title"]
+        assert HttpCache(str(tmp_path / "http")).get(next(iter(urls)))["etag"]
+    finally:
+        server.shutdown()
+
+
+def test_documents_are_streamed_in_batches(tmp_path):
+    server, urls = serve_articles(generate_articles(5))
+    try:
+        batches = list(iter_documents(list(urls), batch_size=2, cache_dir=str(tmp_path / "http")))
+        assert [len(documents) for documents, _ in batches] == [2, 2, 1]
+        # O report é o mesmo em todos os lotes e acumula as contagens
+        assert batches[-1][1]["fetched"] == 5
+    finally:
+        server.shutdown()
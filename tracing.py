@@ -0,0 +1,362 @@
+import os
+import json
+import time
+import uuid
+import threading
+import itertools
+import contextvars
+from collections import deque
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from embedding_scheduler import estimate_tokens
+
+
+# Rastreamento desligado por padrão: GENEXUS_TRACING=1 liga (ou --trace nos scripts de ingestão)
+TRACING_ENV = "GENEXUS_TRACING"
+TRACES_DIRECTORY_ENV = "GENEXUS_TRACES_DIR"
+TRACES_DIRECTORY = "./traces"
+TRACES_FILENAME = "traces.jsonl"
+# Rotação do traces.jsonl (como o RotatingFileHandler): ao passar do tamanho, vira
+# traces.jsonl.1 (o .1 vira .2 e assim por diante) e os mais antigos são apagados
+TRACES_MAX_BYTES = 20 * 1024 * 1024
+TRACES_BACKUPS = 3
+METRICS_FILENAME = "metrics.prom"
+# Limites (em segundos) do histograma de latência exportado para o Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# Durações recentes guardadas por etapa para os percentis do painel do app
+RECENT_SAMPLES = 200
+RECENT_TRACES = 20
+# Atributos numéricos das etapas somados em contadores (tokens, chunks, páginas...)
+COUNTED_ATTRIBUTES = ("input_tokens", "output_tokens", "tokens", "chunks", "pages", "documents", "requests")
+METRIC_PREFIX = "genexus"
+
+_current_span = contextvars.ContextVar("genexus_current_span", default=None)
+
+
+def _enabled_from_env():
+    return os.getenv(TRACING_ENV, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class _NoopSpan:
+    """Etapa usada com o rastreamento desligado: não mede nem guarda nada."""
+
+    def set(self, **attributes):
+        return self
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Uma etapa medida: nome, duração, atributos e a etapa-mãe (mesmo trace)."""
+
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.span_id = next(tracer._ids)
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.root = parent.root if parent is not None else self
+        self.attributes = dict(attributes or {})
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.error = None
+        self.children = []
+        # Registro exportado do trace (só na etapa raiz, quando ela termina)
+        self.record = None
+        self._token = None
+        if parent is not None:
+            parent.children.append(self)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def end(self, error=None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.tracer._finish(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        self.end(exc)
+        return False
+
+    def to_dict(self):
+        return {
+            "id": self.span_id,
+            "parent": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "offset_ms": round((self.started_at - self.root.started_at) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _StageMetrics:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.counters = {}
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, span):
+        self.count += 1
+        self.total += span.duration
+        self.recent.append(span.duration)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if span.duration <= bound:
+                self.buckets[i] += 1
+        if span.error:
+            self.errors += 1
+        for name in COUNTED_ATTRIBUTES:
+            value = span.attributes.get(name)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.counters[name] = self.counters.get(name, 0) + value
+        if isinstance(span.attributes.get("cache_hit"), bool):
+            key = "cache_hits" if span.attributes["cache_hit"] else "cache_misses"
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+class Tracer:
+    """Mede as etapas do pipeline (consulta e ingestão) em spans aninhados.
+
+    `span(nome)` é um context manager: dentro dele, as etapas abertas (na mesma thread
+    ou tarefa asyncio) ficam como filhas. Ao fechar uma etapa, a duração e os atributos
+    numéricos entram nas métricas por etapa; ao fechar a etapa raiz, o trace inteiro é
+    gravado em JSONL. Desligado, `span` devolve sempre o mesmo objeto sem efeito.
+    """
+
+    def __init__(self, enabled=None, directory=None, max_bytes=TRACES_MAX_BYTES, backups=TRACES_BACKUPS):
+        self.enabled = _enabled_from_env() if enabled is None else enabled
+        self.directory = directory or os.getenv(TRACES_DIRECTORY_ENV) or TRACES_DIRECTORY
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._recent_traces = deque(maxlen=RECENT_TRACES)
+
+    def enable(self, directory=None):
+        self.enabled = True
+        if directory:
+            self.directory = directory
+
+    def span(self, name, **attributes):
+        """Etapa filha da etapa atual (ou raiz de um novo trace, se não houver nenhuma)."""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, _current_span.get(), attributes)
+
+    def trace(self, name, **attributes):
+        """Etapa raiz de um novo trace (uma consulta, uma execução de ingestão)."""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, None, attributes)
+
+    def start_span(self, name, parent=None, **attributes):
+        """Etapa aberta sem context manager (encerrada com `end`); usada pelos callbacks do LangChain."""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, parent if parent is not None else _current_span.get(), attributes)
+
+    def record(self, name, seconds, **attributes):
+        """Registra uma etapa já medida em outro lugar (ex.: em um processo do pool)."""
+        if not self.enabled:
+            return
+        span = Span(self, name, _current_span.get(), attributes)
+        span._start = time.perf_counter() - seconds
+        span.started_at = time.time() - seconds
+        span.end()
+
+    def _finish(self, span):
+        with self._lock:
+            self._stages.setdefault(span.name, _StageMetrics()).observe(span)
+        if span.parent is None:
+            self._export_trace(span)
+
+    def _export_trace(self, root):
+        spans = []
+        stack = [root]
+        while stack:
+            span = stack.pop()
+            spans.append(span.to_dict())
+            stack.extend(reversed(span.children))
+        record = {
+            "trace_id": root.trace_id,
+            "name": root.name,
+            "timestamp": root.started_at,
+            "duration_ms": round(root.duration * 1000, 3),
+            "spans": spans,
+        }
+        root.record = record
+        with self._lock:
+            self._recent_traces.append(record)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, TRACES_FILENAME)
+                self._rotate(path)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                print(f"Aviso: não foi possível gravar o trace: {e}")
+
+    def _rotate(self, path):
+        """Passa o arquivo de traces para o backup .1 quando ele chega a `max_bytes`."""
+        if not self.max_bytes or not os.path.exists(path) or os.path.getsize(path) < self.max_bytes:
+            return
+        if not self.backups:
+            os.remove(path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{index}"):
+                os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+        os.replace(path, f"{path}.1")
+
+    def last_trace(self, name=None):
+        """Último trace concluído (de um nome específico, se informado)."""
+        with self._lock:
+            for record in reversed(self._recent_traces):
+                if name is None or record["name"] == name:
+                    return record
+        return None
+
+    def stage_summary(self):
+        """Por etapa: execuções, latência média/p50/p95 (ms) e os contadores somados."""
+        with self._lock:
+            rows = []
+            for name, stage in self._stages.items():
+                recent = list(stage.recent)
+                rows.append({
+                    "stage": name,
+                    "count": stage.count,
+                    "errors": stage.errors,
+                    "mean_ms": stage.total / stage.count * 1000,
+                    "p50_ms": _percentile(recent, 0.5) * 1000,
+                    "p95_ms": _percentile(recent, 0.95) * 1000,
+                    "total_s": stage.total,
+                    **stage.counters,
+                })
+        return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+    def prometheus_text(self):
+        """Métricas por etapa no formato texto do Prometheus."""
+        metric = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines = [f"# HELP {metric} Duração das etapas do pipeline RAG.", f"# TYPE {metric} histogram"]
+        counters = {}
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for name, stage in stages:
+                label = f'stage="{_label(name)}"'
+                for bound, count in zip(LATENCY_BUCKETS, stage.buckets):
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {stage.count}')
+                lines.append(f"{metric}_sum{{{label}}} {stage.total:.6f}")
+                lines.append(f"{metric}_count{{{label}}} {stage.count}")
+                counters.setdefault("errors", []).append((label, stage.errors))
+                for counter, value in stage.counters.items():
+                    counters.setdefault(counter, []).append((label, value))
+        for counter, values in sorted(counters.items()):
+            name = f"{METRIC_PREFIX}_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{{{label}}} {value}" for label, value in values)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=None):
+        """Grava as métricas para o textfile collector do node_exporter (troca atômica)."""
+        if not self.enabled:
+            return None
+        path = path or os.path.join(self.directory, METRICS_FILENAME)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(path + ".tmp", path)
+        return path
+
+
+class RagTracingHandler(BaseCallbackHandler):
+    """Callback do LangChain: cada chamada ao LLM do rag_chain vira uma etapa `llm`
+    com tempo até o primeiro token e tokens de entrada/saída.
+    """
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self._runs = {}
+
+    def _start(self, run_id, prompt_text, serialized):
+        model = (serialized or {}).get("kwargs", {}).get("model") or (serialized or {}).get("name")
+        self._runs[run_id] = self.tracer.start_span("llm", model=model, input_tokens=estimate_tokens(prompt_text))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        text = "\n".join(str(message.content) for batch in messages for message in batch)
+        self._start(run_id, text, serialized)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "\n".join(prompts), serialized)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        span = self._runs.get(run_id)
+        if span is not None and "ttft_ms" not in span.attributes:
+            span.set(ttft_ms=round((time.perf_counter() - span._start) * 1000, 3))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._runs.pop(run_id, None)
+        if span is None:
+            return
+        text = "".join(generation.text for generations in response.generations for generation in generations)
+        span.set(output_tokens=estimate_tokens(text) if text else 0)
+        # Contagem exata do modelo, quando ele informa (usage_metadata do Gemini)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    span.set(input_tokens=usage.get("input_tokens", span.attributes["input_tokens"]),
+                             output_tokens=usage.get("output_tokens", span.attributes["output_tokens"]))
+        span.end()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._runs.pop(run_id, None)
+        if span is not None:
+            span.end(error)
+
+
+def format_trace_breakdown(record, limit=8):
+    """Resumo do trace para a legenda do app: as etapas filhas diretas e suas durações."""
+    root_id = record["spans"][0]["id"]
+    parts = [f"{span['name']} {span['duration_ms']:.0f} ms" for span in record["spans"]
+             if span["parent"] == root_id and span["duration_ms"] is not None]
+    return "🧭 " + " · ".join(parts[:limit]) if parts else ""
+
+
+# Rastreador do processo, compartilhado pelo app, pelo serviço e pelos scripts de ingestão
+tracer = Tracer()
@@ -0,0 +1,366 @@
+import os
+import json
+import mmap
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from langchain_core.documents import Document
+
+
+# A exportação fica dentro do diretório do índice, ao lado do ChromaDB
+VECTOR_INDEX_DIRNAME = "vectors"
+# Cada exportação vai para um subdiretório novo e este arquivo aponta a publicada
+POINTER_FILENAME = "CURRENT"
+DEFAULT_DTYPE = "float16"
+DTYPES = ("float16", "int8")
+# Listas visitadas por busca quando a partição IVF está ativa
+DEFAULT_NPROBE = 8
+# Linhas lidas do Chroma por vez e linhas por bloco na busca (limita a memória temporária)
+_PAGE_SIZE = 1000
+_SEARCH_BLOCK = 2048
+_KMEANS_ITERATIONS = 10
+_KMEANS_SAMPLE_PER_LIST = 64
+
+
+def _quantize(block, dtype):
+    """Converte um bloco float32; no int8 cada linha tem a sua escala (max |v| -> 127)."""
+    if dtype == "float16":
+        return block.astype(np.float16), np.ones(len(block), dtype=np.float32)
+    scales = np.abs(block).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(block / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def _scores(vectors, scales, norms, query):
+    """Equivalente à distância L2 do Chroma: maior `x·q - |x|²/2` = menor `|x - q|`."""
+    return (vectors.astype(np.float32) @ query) * scales - 0.5 * norms
+
+
+def _kmeans(sample, nlist, iterations=_KMEANS_ITERATIONS, seed=0):
+    """K-means simples para a partição grossa (IVF)."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+        for c in range(nlist):
+            members = sample[assignment == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return centroids
+
+
+def new_version_dir(parent):
+    """Cria um subdiretório vazio e exclusivo em `parent` para montar uma nova versão."""
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=time.strftime("v%Y%m%d-%H%M%S-"), dir=parent)
+
+
+def current_version_dir(parent):
+    """Versão publicada em `parent` (no formato antigo, sem ponteiro, o próprio `parent`)."""
+    try:
+        with open(os.path.join(parent, POINTER_FILENAME), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        return parent
+    return os.path.join(parent, name) if name else parent
+
+
+def publish_version_dir(parent, path):
+    """Aponta `parent/CURRENT` para `path` e apaga as versões antigas.
+
+    Nada é renomeado nem apagado antes da troca: no Windows um diretório com arquivos
+    mapeados por um leitor não pode ser removido. O `os.replace` do ponteiro é atômico
+    nas duas plataformas; a versão anterior fica para os leitores que acabaram de ler o
+    ponteiro, e as que ainda estiverem abertas são apagadas numa próxima publicação.
+    """
+    pointer = os.path.join(parent, POINTER_FILENAME)
+    previous = os.path.basename(current_version_dir(parent))
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(os.path.basename(path))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + ".tmp", pointer)
+    for name in os.listdir(parent):
+        if name in (POINTER_FILENAME, os.path.basename(path), previous):
+            continue
+        stale = os.path.join(parent, name)
+        if os.path.isdir(stale):
+            shutil.rmtree(stale, ignore_errors=True)
+        else:
+            # Arquivos do formato antigo (exportação direto em `parent`)
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return path
+
+
+def export_vectors(vectorstore, persist_directory, dtype=DEFAULT_DTYPE, nlist=0, index_version=None, where=None):
+    """Exporta os embeddings do ChromaDB para uma matriz contígua memory-mapped.
+
+    Com `where` (filtro de metadata do Chroma) só os chunks correspondentes são exportados
+    (ex: uma partição, em `partitions/<nome>/vectors/`).
+
+    Cada exportação é gravada em `<persist_directory>/vectors/<versão>/` e publicada pelo
+    ponteiro `vectors/CURRENT` (`publish_version_dir`), sem apagar a que estiver aberta.
+    Arquivos gerados em cada versão:
+      vectors.npy   matriz (n, dim) em float16 ou int8 (aberta com mmap pelo app)
+      scales.npy    escala por linha (int8) e norms.npy com |x|² (ranking igual ao L2 do Chroma)
+      chunks.jsonl  texto e metadados de cada chunk; offsets.npy aponta a linha de cada vetor
+      ids.json      IDs dos chunks na ordem da matriz; meta.json com dtype, dimensão e versão
+      centroids.npy / list_offsets.npy   partição IVF (só com `nlist` > 0)
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Tipo de exportação inválido: {dtype}. Use um de {DTYPES}.")
+    start = time.perf_counter()
+    collection = vectorstore._collection
+    count = collection.count() if where is None else len(collection.get(where=where, include=[])["ids"])
+    if count == 0:
+        print("Exportação de vetores ignorada: nenhum chunk no ChromaDB.")
+        return None
+
+    parent = os.path.join(persist_directory, VECTOR_INDEX_DIRNAME)
+    tmp_dir = new_version_dir(parent)
+
+    vectors = scales = norms = None
+    offsets = np.zeros(count, dtype=np.int64)
+    ids = []
+    with open(os.path.join(tmp_dir, "chunks.jsonl"), "wb") as chunks_file:
+        while len(ids) < count:
+            page = collection.get(include=["embeddings", "documents", "metadatas"], where=where,
+                                  limit=_PAGE_SIZE, offset=len(ids))
+            if not page["ids"]:
+                break
+            page_ids = page["ids"][:count - len(ids)]
+            block = np.asarray(page["embeddings"][:len(page_ids)], dtype=np.float32)
+            if vectors is None:
+                vectors = open_memmap(os.path.join(tmp_dir, "vectors.npy"), mode="w+",
+                                      dtype=dtype, shape=(count, block.shape[1]))
+                scales = np.ones(count, dtype=np.float32)
+                norms = np.zeros(count, dtype=np.float32)
+            row = len(ids)
+            vectors[row:row + len(page_ids)], scales[row:row + len(page_ids)] = _quantize(block, dtype)
+            norms[row:row + len(page_ids)] = (block ** 2).sum(axis=1)
+            for i, chunk_id in enumerate(page_ids):
+                offsets[row + i] = chunks_file.tell()
+                line = {"id": chunk_id, "text": page["documents"][i], "metadata": page["metadatas"][i] or {}}
+                chunks_file.write(json.dumps(line, ensure_ascii=False).encode("utf-8") + b"\n")
+            ids.extend(page_ids)
+
+    count = len(ids)
+    dimension = vectors.shape[1]
+    if nlist:
+        # Partição IVF: as linhas são reordenadas para cada lista ficar contígua na matriz
+        nlist = min(nlist, count)
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(count, min(count, nlist * _KMEANS_SAMPLE_PER_LIST), replace=False))
+        sample = vectors[sample_rows].astype(np.float32) * scales[sample_rows, None]
+        centroids = _kmeans(sample, nlist)
+        half_norms = 0.5 * (centroids ** 2).sum(axis=1)
+        assignment = np.empty(count, dtype=np.int32)
+        for s in range(0, count, _SEARCH_BLOCK):
+            block = vectors[s:s + _SEARCH_BLOCK].astype(np.float32) * scales[s:s + _SEARCH_BLOCK, None]
+            assignment[s:s + _SEARCH_BLOCK] = np.argmax(block @ centroids.T - half_norms, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        sorted_vectors = open_memmap(os.path.join(tmp_dir, "vectors.sorted.npy"), mode="w+",
+                                     dtype=dtype, shape=(count, dimension))
+        for s in range(0, count, _SEARCH_BLOCK):
+            sorted_vectors[s:s + _SEARCH_BLOCK] = vectors[order[s:s + _SEARCH_BLOCK]]
+        sorted_vectors.flush()
+        del vectors, sorted_vectors
+        os.replace(os.path.join(tmp_dir, "vectors.sorted.npy"), os.path.join(tmp_dir, "vectors.npy"))
+        scales, norms, offsets = scales[order], norms[order], offsets[order]
+        ids = [ids[i] for i in order]
+        list_offsets = np.searchsorted(assignment[order], np.arange(nlist + 1)).astype(np.int64)
+        np.save(os.path.join(tmp_dir, "centroids.npy"), centroids.astype(np.float32))
+        np.save(os.path.join(tmp_dir, "list_offsets.npy"), list_offsets)
+    else:
+        vectors.flush()
+        del vectors
+
+    np.save(os.path.join(tmp_dir, "scales.npy"), scales)
+    np.save(os.path.join(tmp_dir, "norms.npy"), norms)
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    with open(os.path.join(tmp_dir, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "count": count,
+            "dimension": dimension,
+            "dtype": dtype,
+            "nlist": nlist,
+            "index_version": index_version,
+            "created_at": time.time(),
+        }, f)
+
+    # Processos com a exportação antiga aberta continuam lendo os arquivos já mapeados
+    output_dir = publish_version_dir(parent, tmp_dir)
+    size = sum(os.path.getsize(os.path.join(output_dir, name)) for name in os.listdir(output_dir))
+    print(f"Vetores exportados: {count} x {dimension} em {dtype}"
+          f"{f', IVF com {nlist} listas' if nlist else ''}, {size / (1024 * 1024):.1f} MB em disco, "
+          f"em {time.perf_counter() - start:.1f}s")
+    return output_dir
+
+
+class MemmapVectorIndex:
+    """Busca top-k por força bruta (NumPy vetorizado) sobre a matriz exportada.
+
+    Os arquivos são abertos com mmap: a abertura é instantânea e as páginas da matriz
+    são compartilhadas pelo sistema operacional entre vários processos do app.
+    """
+
+    def __init__(self, index_dir, nprobe=DEFAULT_NPROBE):
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, "ids.json"), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.index_dir = index_dir
+        self.nprobe = nprobe
+        self.vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(index_dir, "scales.npy"), mmap_mode="r")
+        self.norms = np.load(os.path.join(index_dir, "norms.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(index_dir, "offsets.npy"), mmap_mode="r")
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.centroids = self.list_offsets = None
+        if self.meta.get("nlist"):
+            self.centroids = np.load(os.path.join(index_dir, "centroids.npy"))
+            self.list_offsets = np.load(os.path.join(index_dir, "list_offsets.npy"))
+        self._chunks_file = open(os.path.join(index_dir, "chunks.jsonl"), "rb")
+        self._chunks = mmap.mmap(self._chunks_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, persist_directory, nprobe=DEFAULT_NPROBE):
+        """Abre a exportação do índice (ou None se ela ainda não existir)."""
+        index_dir = current_version_dir(os.path.join(persist_directory, VECTOR_INDEX_DIRNAME))
+        if not os.path.exists(os.path.join(index_dir, "meta.json")):
+            return None
+        return cls(index_dir, nprobe)
+
+    @property
+    def index_version(self):
+        return self.meta.get("index_version")
+
+    def _ranges(self, query):
+        if self.centroids is None:
+            return [(0, len(self.ids))]
+        centroid_scores = self.centroids @ query - 0.5 * (self.centroids ** 2).sum(axis=1)
+        probes = np.argsort(-centroid_scores)[:self.nprobe]
+        return [(int(self.list_offsets[p]), int(self.list_offsets[p + 1])) for p in probes]
+
+    def search(self, query_vector, k=4):
+        """Retorna [(id, score)] dos `k` vetores mais próximos (mesma ordem da distância L2)."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        rows, scores = [], []
+        for start, end in self._ranges(query):
+            for s in range(start, end, _SEARCH_BLOCK):
+                e = min(end, s + _SEARCH_BLOCK)
+                scores.append(_scores(self.vectors[s:e], self.scales[s:e], self.norms[s:e], query))
+                rows.append(np.arange(s, e))
+        if not scores:
+            return []
+        scores = np.concatenate(scores)
+        rows = np.concatenate(rows)
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.ids[rows[i]], float(scores[i])) for i in best]
+
+    def get_documents(self, ids):
+        """Lê texto e metadados dos chunks pelo ID (direto do sidecar mapeado em memória)."""
+        documents = {}
+        for chunk_id in ids:
+            row = self._rows.get(chunk_id)
+            if row is None:
+                continue
+            start = int(self.offsets[row])
+            with self._lock:
+                end = self._chunks.find(b"\n", start)
+                line = json.loads(self._chunks[start:end])
+            documents[chunk_id] = Document(page_content=line["text"], metadata=line["metadata"])
+        return documents
+
+    def similarity_search_by_vector(self, query_vector, k=4):
+        ranked = [chunk_id for chunk_id, _ in self.search(query_vector, k)]
+        documents = self.get_documents(ranked)
+        return [documents[chunk_id] for chunk_id in ranked]
+
+    def warm(self):
+        """Lê a matriz inteira uma vez: as páginas ficam no cache do sistema antes da primeira pergunta."""
+        for s in range(0, len(self.ids), _SEARCH_BLOCK * 16):
+            np.asarray(self.vectors[s:s + _SEARCH_BLOCK * 16]).sum()
+        for s in range(0, len(self._chunks), 1 << 24):
+            self._chunks[s:s + (1 << 24)]
+        return len(self.ids)
+
+    def close(self):
+        self._chunks.close()
+        self._chunks_file.close()
+
+
+def measure_recall(vectorstore, index, samples=100, k=10, seed=0):
+    """Recall@k da exportação contra o próprio ChromaDB, usando vetores do índice como consulta."""
+    collection = vectorstore._collection
+    rng = np.random.default_rng(seed)
+    query_ids = [index.ids[i] for i in rng.choice(len(index.ids), min(samples, len(index.ids)), replace=False)]
+    queries = collection.get(ids=query_ids, include=["embeddings"])["embeddings"]
+    # Um pouco de ruído para as consultas não serem idênticas aos vetores indexados
+    queries = np.asarray(queries, dtype=np.float32)
+    queries += rng.normal(0, 0.01, queries.shape).astype(np.float32) * np.abs(queries).mean()
+
+    found, chroma_ms, export_ms = 0, [], []
+    for query in queries:
+        start = time.perf_counter()
+        expected = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0]
+        chroma_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        result = [chunk_id for chunk_id, _ in index.search(query, k)]
+        export_ms.append((time.perf_counter() - start) * 1000)
+        found += len(set(expected) & set(result))
+    return {
+        "samples": len(queries),
+        "k": k,
+        "recall": found / (len(queries) * k) if len(queries) else 0.0,
+        "chroma_p50_ms": float(np.percentile(chroma_ms, 50)) if chroma_ms else 0.0,
+        "export_p50_ms": float(np.percentile(export_ms, 50)) if export_ms else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    from langchain_community.vectorstores import Chroma
+    from manifest import read_index_version
+    from snapshots import INDEX_ROOT, StagingSnapshot, close_vectorstore
+
+    parser = argparse.ArgumentParser(description="Exporta os embeddings do ChromaDB para uma matriz memory-mapped.")
+    parser.add_argument("--persist-directory", default=INDEX_ROOT, help="raiz do índice (a do CURRENT)")
+    parser.add_argument("--dtype", choices=DTYPES, default=DEFAULT_DTYPE)
+    parser.add_argument("--nlist", type=int, default=0, help="listas da partição IVF (0 = força bruta)")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE)
+    parser.add_argument("--samples", type=int, default=100, help="consultas para medir o recall (0 = não medir)")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    # Snapshots publicados não mudam: a exportação nova é feita em uma cópia de trabalho
+    # (hardlinks para o que não muda) e publicada como um snapshot novo, que o app carrega
+    # sem reiniciar
+    staging = StagingSnapshot.begin(args.persist_directory, "export")
+    persist_directory = staging.prepare()
+    version = read_index_version(persist_directory)
+
+    # Só leitura dos vetores já gravados: nenhuma função de embedding é necessária
+    vectorstore = Chroma(persist_directory=persist_directory)
+    export_vectors(vectorstore, persist_directory, args.dtype, args.nlist, version)
+    if args.samples:
+        index = MemmapVectorIndex.load(persist_directory, args.nprobe)
+        if index is not None:
+            report = measure_recall(vectorstore, index, args.samples, args.k)
+            index.close()
+            print(f"Recall@{report['k']} contra o ChromaDB: {report['recall']:.3f} "
+                  f"({report['samples']} consultas) · p50 ChromaDB {report['chroma_p50_ms']:.2f} ms, "
+                  f"exportação {report['export_p50_ms']:.2f} ms")
+    close_vectorstore(vectorstore)
+    staging.publish(version)
@@ -0,0 +1,183 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+
+from PIL import Image
+
+
+# Local padrão do cache de descrições do modelo de visão
+DEFAULT_CACHE_PATH = "./.cache/vision_descriptions.sqlite"
+DEFAULT_MAX_ENTRIES = 50_000
+# Lado da grade do dHash: 16 -> hash de 256 bits (8 bits é grosseiro demais para páginas de texto)
+HASH_SIZE = 16
+# Máximo de bits diferentes para considerar duas páginas quase idênticas
+DEFAULT_THRESHOLD = 4
+# O hash é dividido em faixas para a busca aproximada (princípio da casa dos pombos:
+# hashes a até BANDS-1 bits de distância compartilham ao menos uma faixa idêntica)
+BANDS = 16
+
+
+def perceptual_hash(image, hash_size=HASH_SIZE):
+    """dHash: compara a luminosidade de pixels vizinhos em uma miniatura da imagem."""
+    thumbnail = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(thumbnail.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _bands(value, bits):
+    width = bits // BANDS
+    mask = (1 << width) - 1
+    return [(value >> (i * width)) & mask for i in range(BANDS)]
+
+
+class VisionDescriptionCache:
+    """Cache persistente de descrições, indexado por (hash perceptual, prompt, modelo).
+
+    Páginas repetidas (capas, cabeçalhos de template, screenshots reaproveitados entre
+    capítulos e versões do manual) são reconhecidas mesmo com pequenas diferenças de
+    renderização, dentro do limite `threshold` de bits diferentes.
+    """
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES,
+                 threshold=DEFAULT_THRESHOLD, hash_size=HASH_SIZE):
+        if threshold >= BANDS:
+            raise ValueError(f"O limite de quase-duplicata deve ser menor que {BANDS} bits.")
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hash_size = hash_size
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS descriptions ("
+            " id INTEGER PRIMARY KEY,"
+            " prompt_key TEXT NOT NULL,"
+            " phash TEXT NOT NULL,"
+            " description TEXT NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " UNIQUE (prompt_key, phash));"
+            "CREATE TABLE IF NOT EXISTS bands ("
+            " entry_id INTEGER NOT NULL REFERENCES descriptions(id) ON DELETE CASCADE,"
+            " band INTEGER NOT NULL,"
+            " value INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_bands ON bands(band, value);"
+            "CREATE INDEX IF NOT EXISTS idx_descriptions_last_used ON descriptions(last_used);"
+        )
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.commit()
+
+    @staticmethod
+    def _prompt_key(prompt, model):
+        return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, image, prompt, model):
+        """Retorna a descrição de uma imagem igual ou quase igual, ou None."""
+        phash = perceptual_hash(image, self.hash_size)
+        prompt_key = self._prompt_key(prompt, model)
+        bits = self.hash_size * self.hash_size
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, description FROM descriptions WHERE prompt_key = ? AND phash = ?",
+                (prompt_key, format(phash, "x")),
+            ).fetchone()
+            distance = 0
+            if row is None and self.threshold > 0:
+                row, distance = self._nearest(prompt_key, phash, bits)
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE descriptions SET last_used = ? WHERE id = ?", (time.time(), row[0]))
+            self._conn.commit()
+        if distance:
+            self.near_hits += 1
+        else:
+            self.hits += 1
+        return row[1]
+
+    def _nearest(self, prompt_key, phash, bits):
+        """Busca candidatos que compartilham alguma faixa e escolhe o mais próximo."""
+        conditions = " OR ".join("(b.band = ? AND b.value = ?)" for _ in range(BANDS))
+        params = [prompt_key]
+        for band, value in enumerate(_bands(phash, bits)):
+            params.extend((band, value))
+        candidates = self._conn.execute(
+            "SELECT DISTINCT d.id, d.description, d.phash FROM bands b"
+            " JOIN descriptions d ON d.id = b.entry_id"
+            f" WHERE d.prompt_key = ? AND ({conditions})",
+            params,
+        ).fetchall()
+        best, best_distance = None, None
+        for entry_id, description, stored in candidates:
+            distance = hamming_distance(phash, int(stored, 16))
+            if distance <= self.threshold and (best_distance is None or distance < best_distance):
+                best, best_distance = (entry_id, description), distance
+        return best, best_distance or 0
+
+    def put(self, image, prompt, model, description):
+        phash = perceptual_hash(image, self.hash_size)
+        prompt_key = self._prompt_key(prompt, model)
+        bits = self.hash_size * self.hash_size
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO descriptions (prompt_key, phash, description, last_used)"
+                " VALUES (?, ?, ?, ?)",
+                (prompt_key, format(phash, "x"), description, time.time()),
+            )
+            entry_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO bands (entry_id, band, value) VALUES (?, ?, ?)",
+                [(entry_id, band, value) for band, value in enumerate(_bands(phash, bits))],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Remove as entradas usadas há mais tempo (LRU) quando o limite é excedido."""
+        size = self._conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+        excess = size - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM descriptions WHERE id IN ("
+                " SELECT id FROM descriptions ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def stats(self):
+        """Estatísticas de acerto (exatos e quase-duplicatas) e tamanho do cache."""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": ((self.hits + self.near_hits) / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": size,
+            "max_entries": self.max_entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+from urllib.parse import urlsplit
+
+import aiohttp
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+
+from content_extractor import extract_main_content
+from embedding_scheduler import estimate_tokens
+
+
+# Cache HTTP em disco (um arquivo JSON por URL)
+HTTP_CACHE_DIR = "./.cache/http"
+# Conexões simultâneas no total e por host (o servidor da documentação é um só)
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PER_HOST = 4
+DEFAULT_TIMEOUT = 30
+MAX_RETRIES = 2
+# Artigos por lote em `iter_documents` (só um lote de HTML/Documents fica na memória)
+FETCH_BATCH_SIZE = 200
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+}
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class HttpCache:
+    """Guarda o corpo e os validadores (ETag/Last-Modified) de cada URL baixada."""
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url):
+        path = self._path(url)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Entrada corrompida (ex: execução interrompida): trata como ausente
+            return None
+
+    def put(self, url, entry):
+        path = self._path(url)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def _is_fresh(entry, max_age):
+    """A entrada ainda pode ser usada sem nenhuma requisição (Cache-Control ou `max_age`)?"""
+    age = time.time() - entry.get("fetched_at", 0)
+    if max_age is not None and age < max_age:
+        return True
+    return age < entry.get("server_max_age", 0)
+
+
+def _server_max_age(headers):
+    cache_control = headers.get("Cache-Control", "")
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = _MAX_AGE_RE.search(cache_control)
+    return int(match.group(1)) if match else 0
+
+
+def _build_metadata(soup, url):
+    """Mesma metadata gerada pelo WebBaseLoader (source, title, description, language)."""
+    metadata = {"source": url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if html := soup.find("html"):
+        metadata["language"] = html.get("lang", "No language found.")
+    return metadata
+
+
+def html_to_document(url, html, report=None):
+    """Converte o HTML em um Document só com o conteúdo principal do artigo (em markdown).
+
+    A metadata é a mesma do WebBaseLoader; com `report`, soma os tokens do texto bruto
+    da página e do conteúdo extraído (menus, barras laterais e rodapés removidos).
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    # A metadata vem antes: a extração remove o boilerplate da árvore
+    metadata = _build_metadata(soup, url)
+    raw_tokens = estimate_tokens(soup.get_text(" ", strip=True)) if report is not None else 0
+    content = extract_main_content(soup)
+    if report is not None:
+        report["raw_tokens"] += raw_tokens
+        report["content_tokens"] += estimate_tokens(content)
+    return Document(page_content=content, metadata=metadata)
+
+
+async def _fetch_one(session, url, cache, report, max_age):
+    """Baixa uma URL usando GET condicional; retorna o HTML (do servidor ou do cache) ou None."""
+    entry = cache.get(url)
+    if entry and _is_fresh(entry, max_age):
+        report["from_cache"] += 1
+        return entry["body"]
+
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304 and entry:
+                    report["not_modified"] += 1
+                    entry["fetched_at"] = time.time()
+                    entry["server_max_age"] = _server_max_age(response.headers) or entry.get("server_max_age", 0)
+                    cache.put(url, entry)
+                    return entry["body"]
+                if response.status in (404, 410):
+                    report["gone"].append(url)
+                    return None
+                if response.status == 429 or response.status >= 500:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=response.status
+                    )
+                if response.status >= 400:
+                    report["failed"].append(url)
+                    print(f" !! ERRO ao carregar {url}: HTTP {response.status}")
+                    return None
+
+                body = await response.text(errors="replace")
+                cache.put(url, {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "server_max_age": _server_max_age(response.headers),
+                    "fetched_at": time.time(),
+                    "body": body,
+                })
+                report["fetched"] += 1
+                report["bytes"] += len(body)
+                return body
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt < MAX_RETRIES:
+                # Espera crescente antes de tentar de novo (erros transitórios, 429, 5xx)
+                await asyncio.sleep(2 ** attempt)
+                continue
+            if entry:
+                # Sem resposta do servidor: melhor usar a última versão conhecida do artigo
+                print(f" !! ERRO ao carregar {url} ({e}). Usando a cópia em cache.")
+                report["from_cache"] += 1
+                return entry["body"]
+            print(f" !! ERRO ao carregar {url}: {e}")
+            report["failed"].append(url)
+            return None
+
+
+async def _fetch_all(urls, cache, report, concurrency, per_host, timeout, max_age):
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    # Uma única sessão: as conexões são reutilizadas entre os artigos (keep-alive)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout,
+                                     headers=DEFAULT_HEADERS) as session:
+        return await asyncio.gather(*(_fetch_one(session, url, cache, report, max_age) for url in urls))
+
+
+def _new_report():
+    return {"fetched": 0, "not_modified": 0, "from_cache": 0, "bytes": 0, "failed": [], "gone": [],
+            "raw_tokens": 0, "content_tokens": 0, "seconds": 0.0}
+
+
+def iter_documents(urls, batch_size=FETCH_BATCH_SIZE, concurrency=DEFAULT_CONCURRENCY,
+                   per_host=DEFAULT_PER_HOST, timeout=DEFAULT_TIMEOUT, cache_dir=HTTP_CACHE_DIR, max_age=None):
+    """Baixa os artigos em lotes de `batch_size` e produz (documents, report) a cada lote.
+
+    Quem consome processa o lote antes do próximo download: a memória não cresce com o
+    número de artigos. O report é o mesmo objeto em todos os lotes e acumula as contagens.
+    """
+    urls = list(dict.fromkeys(urls))
+    batch_size = max(1, batch_size)
+    cache = HttpCache(cache_dir)
+    report = _new_report()
+    hosts = {urlsplit(url).netloc for url in urls}
+
+    for start in range(0, len(urls), batch_size):
+        batch = urls[start:start + batch_size]
+        t0 = time.perf_counter()
+        bodies = asyncio.run(_fetch_all(batch, cache, report, concurrency, per_host, timeout, max_age))
+        report["seconds"] += time.perf_counter() - t0
+        yield [html_to_document(url, body, report) for url, body in zip(batch, bodies) if body is not None], report
+
+    print(f" -> {len(urls)} URLs em {len(hosts)} host(s) em {report['seconds']:.1f}s: "
+          f"{report['fetched']} baixadas, {report['not_modified']} não modificadas (304), "
+          f"{report['from_cache']} do cache, {len(report['failed'])} falhas, {len(report['gone'])} removidas.")
+    if report["raw_tokens"]:
+        removed = report["raw_tokens"] - report["content_tokens"]
+        print(f" -> Conteúdo principal: ~{report['content_tokens']} de ~{report['raw_tokens']} tokens "
+              f"({removed / report['raw_tokens']:.0%} de menus, rodapés e outros elementos descartados).")
+
+
+def fetch_documents(urls, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST,
+                    timeout=DEFAULT_TIMEOUT, cache_dir=HTTP_CACHE_DIR, max_age=None):
+    """Baixa os artigos em paralelo e retorna (documents, report).
+
+    Os Documents têm a mesma metadata dos gerados pelo WebBaseLoader (`source`), mas
+    só com o conteúdo principal de cada artigo (`raw_tokens`/`content_tokens` no report).
+    O report traz as contagens de downloads, respostas 304 e acertos de cache, além
+    das URLs que falharam (`failed`) ou não existem mais no servidor (`gone`).
+    """
+    urls = list(dict.fromkeys(urls))
+    documents, report = [], None
+    for batch, report in iter_documents(urls, len(urls), concurrency, per_host, timeout,
+                                        cache_dir, max_age):
+        documents.extend(batch)
+    # Sem URLs o gerador não produz nenhum lote
+    return documents, report if report is not None else _new_report()